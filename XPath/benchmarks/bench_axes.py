@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""Descendant, following and preceding axes on deep and wide documents.
+
+The deep document nests 5000 elements, each with a leaf sibling; the wide
+document has one million children under the document element.
+
+    python benchmarks/bench_axes.py [depth] [width]
+
+"""
+
+import os
+import sys
+import time
+import xml.dom.minidom
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import xpath
+
+DEEP_QUERIES = [
+    "count(/descendant::x)",
+    "count(/descendant-or-self::node())",
+    "string-length(string(/))",
+    "count(/x/y/following::*)",
+    "count((/descendant::y)[last()]/preceding::*)",
+]
+
+WIDE_QUERIES = [
+    "count(/descendant::i)",
+    "count(/r/i[1]/following::*)",
+    "count(/r/i[last()]/preceding::*)",
+    "count(/r/descendant-or-self::node())",
+]
+
+
+def make_deep(depth):
+    return xml.dom.minidom.parseString(
+        "<x><y>t</y>" * depth + "</x>" * depth
+    )
+
+
+def make_wide(width):
+    return xml.dom.minidom.parseString("<r>" + "<i/>" * width + "</r>")
+
+
+def run(doc, queries):
+    for query in queries:
+        expr = xpath.XPath(query)
+        start = time.perf_counter()
+        try:
+            result = expr.find(doc)
+        except RecursionError:
+            result = "RecursionError"
+        elapsed = time.perf_counter() - start
+        print("%-48s %8.3fs  %s" % (query, elapsed, result))
+
+
+def main():
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    width = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+    print("depth %d" % depth)
+    run(make_deep(depth), DEEP_QUERIES)
+    print("width %d" % width)
+    run(make_wide(width), WIDE_QUERIES)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""Compiled closures versus the tree-walking interpreter.
+
+Evaluates a set of predicate-heavy queries with XPath(expr, compiled=False)
+and with the default compiled evaluation.
+
+    python benchmarks/bench_compiler.py [items]
+
+"""
+
+import os
+import sys
+import time
+import xml.dom.minidom
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import xpath
+
+QUERIES = [
+    "//item[@price > 10 and @price < 50]",
+    "//item[contains(name, 'x') or starts-with(name, 'b')]",
+    "//item[position() mod 2 = 0]/name",
+    "//item[not(@sale)][string-length(name) > 3]",
+    "count(//item[@price * 2 > 30])",
+    "//item[name = concat('b', 'x')]",
+]
+
+
+def make_document(items):
+    parts = ["<catalog>"]
+    for i in range(items):
+        sale = ' sale="1"' if i % 3 == 0 else ""
+        parts.append(
+            '<item price="%d"%s><name>%s</name></item>'
+            % (i % 100, sale, ("bx", "axe", "box", "cx")[i % 4])
+        )
+    parts.append("</catalog>")
+    return xml.dom.minidom.parseString("".join(parts))
+
+
+def timed(expr, doc, context, repeat=3):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = expr.find(doc, context)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    doc = make_document(items)
+    context = xpath.XPathContext(doc)
+    total = [0.0, 0.0]
+    for query in QUERIES:
+        interpreted, r1 = timed(xpath.XPath(query, compiled=False), doc, context)
+        compiled, r2 = timed(xpath.XPath(query), doc, context)
+        assert r1 == r2
+        total[0] += interpreted
+        total[1] += compiled
+        print(
+            "%-55s %8.3fs %8.3fs %5.2fx"
+            % (query, interpreted, compiled, interpreted / compiled)
+        )
+    print(
+        "%-55s %8.3fs %8.3fs %5.2fx"
+        % ("total", total[0], total[1], total[0] / total[1])
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""Many small queries against one document, as a request handler makes.
+
+The document declares a handful of namespaces on its document element.
+Each round looks up every field of a record with findvalue(), first
+without a context, so that one is built from the document for each call,
+and then with a shared context and a per-call variable.
+
+    python benchmarks/bench_context.py [rounds] [declarations]
+
+"""
+
+import os
+import sys
+import time
+import xml.dom.minidom
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import xpath
+
+FIELDS = ["id", "name", "price", "stock", "vendor", "color", "size", "weight"]
+
+
+def make_doc(declarations):
+    return xml.dom.minidom.parseString(
+        '<r xmlns="http://example.org/r" %s><record n="1">%s</record></r>'
+        % (
+            " ".join(
+                'xmlns:p%d="http://example.org/p%d"' % (i, i)
+                for i in range(declarations)
+            ),
+            "".join("<%s>%s-value</%s>" % (f, f, f) for f in FIELDS),
+        )
+    )
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    declarations = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    doc = make_doc(declarations)
+    record = doc.documentElement.firstChild
+    exprs = [xpath.XPath("string(*[local-name() = '%s'])" % f) for f in FIELDS]
+    shared = xpath.XPath("*[local-name() = $field]")
+    context = xpath.XPathContext(doc)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for expr in exprs:
+            expr.findvalue(record)
+    print("%-36s %8.3fs" % ("findvalue(node)", time.perf_counter() - start))
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for field in FIELDS:
+            shared.findvalue(record, context, field=field)
+    print("%-36s %8.3fs" % ("findvalue(node, context, field=...)",
+                            time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""One relative expression evaluated for each node selected by a query.
+
+The document is a list of records, each with a few fields.  The records
+are selected once, then a field is looked up in every record: one call
+at a time with the module functions, one call at a time with a compiled
+XPath, and in one call with find_each() and findvalue_each().
+
+    python benchmarks/bench_each.py [records]
+
+"""
+
+import os
+import sys
+import time
+import xml.dom.minidom
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import xpath
+
+
+def make_doc(records):
+    return xml.dom.minidom.parseString(
+        '<r xmlns:a="http://example.org/a" xmlns:b="http://example.org/b">%s</r>'
+        % "".join(
+            '<record n="%d"><name>record %d</name><price>%d</price></record>'
+            % (i, i, i % 100)
+            for i in range(records)
+        )
+    )
+
+
+def timed(label, f):
+    start = time.perf_counter()
+    result = f()
+    print("%-28s %8.3fs" % (label, time.perf_counter() - start))
+    return result
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    doc = make_doc(records)
+    nodes = xpath.find("/r/record", doc)
+    for expr in ("name", "price > 50"):
+        compiled = xpath.XPath(expr)
+        print("%s, %d nodes" % (expr, len(nodes)))
+        expected = timed(
+            "xpath.findvalue()", lambda: [xpath.findvalue(expr, n) for n in nodes]
+        )
+        timed("XPath.findvalue()", lambda: [compiled.findvalue(n) for n in nodes])
+        result = timed("XPath.findvalue_each()", lambda: compiled.findvalue_each(nodes))
+        assert result == expected
+        expected = timed("XPath.find()", lambda: [compiled.find(n) for n in nodes])
+        result = timed("XPath.find_each()", lambda: compiled.find_each(nodes))
+        assert result == expected
+
+
+if __name__ == "__main__":
+    main()
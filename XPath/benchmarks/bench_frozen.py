@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""Queries over a minidom document and over a FrozenDocument of it.
+
+The document holds a catalogue of items with attributes, nested parts and
+mixed text.  Each query is run once, then timed over repeated runs.
+
+    python benchmarks/bench_frozen.py [items] [repeat]
+
+"""
+
+import os
+import sys
+import time
+import xml.dom.minidom
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import xpath
+
+QUERIES = [
+    "count(//item[@type = 'b'])",
+    "count(/catalogue/item/part[@n > 2])",
+    "count(//item[contains(., 'needle')])",
+    "count(/catalogue/item[5]/following::part)",
+    "count(//part/ancestor::*)",
+    "count(//text())",
+    "sum(//item/@price)",
+]
+
+
+def make_catalogue(items):
+    parts = "".join('<part n="%d">text <b>bold</b> more</part>' % n for n in range(5))
+    return xml.dom.minidom.parseString(
+        "<catalogue>%s</catalogue>"
+        % "".join(
+            '<item id="%d" type="%s" price="%d">%s%s</item>'
+            % (i, "abc"[i % 3], i % 50, parts, "needle" if i % 10 == 0 else "")
+            for i in range(items)
+        )
+    )
+
+
+def timed(f, repeat):
+    f()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = f()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    doc = make_catalogue(items)
+    start = time.perf_counter()
+    frozen = xpath.FrozenDocument(doc)
+    print("freeze %d nodes: %.3fs" % (frozen.size, time.perf_counter() - start))
+    for query in QUERIES:
+        expr = xpath.XPath(query)
+        dom, result = timed(lambda: expr.find(doc), repeat)
+        arrays, frozen_result = timed(lambda: frozen.find(expr), repeat)
+        assert result == frozen_result
+        print("%-44s %8.4fs %8.4fs  %s" % (query, dom, arrays, result))
+
+
+if __name__ == "__main__":
+    main()
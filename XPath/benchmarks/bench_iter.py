@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Results consumed one at a time, from find() and from iterfind().
+
+The document is a flat list of records, each with a few fields.  For each
+query, the time to the first result, the total time and the peak memory
+allocated while consuming the results are given for findvalues() and for
+iterfindvalues().
+
+    python benchmarks/bench_iter.py [records]
+
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+import xml.dom.minidom
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import xpath
+
+QUERIES = [
+    "//record/name",
+    "/feed/record[@kind = 'b']/price",
+    "//record[price > 50]/name",
+]
+
+
+def make_doc(records):
+    return xml.dom.minidom.parseString(
+        "<feed>%s</feed>"
+        % "".join(
+            '<record kind="%s"><name>record %d</name><price>%d</price></record>'
+            % ("abc"[i % 3], i, i % 100)
+            for i in range(records)
+        )
+    )
+
+
+def consume(method, doc):
+    start = time.perf_counter()
+    first = None
+    count = 0
+    for _ in method(doc):
+        if first is None:
+            first = time.perf_counter() - start
+        count += 1
+    return first, time.perf_counter() - start, count
+
+
+def peak(method, doc):
+    tracemalloc.start()
+    for _ in method(doc):
+        pass
+    size = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return size
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    doc = make_doc(records)
+    for query in QUERIES:
+        expr = xpath.XPath(query)
+        expr.findvalues(doc)
+        for name in ("findvalues", "iterfindvalues"):
+            method = getattr(expr, name)
+            first, total, count = consume(method, doc)
+            print(
+                "%-34s %-15s first %8.4fs total %8.3fs peak %8.1fKB  %d"
+                % (query, name, first, total, peak(method, doc) / 1024.0, count)
+            )
+
+
+if __name__ == "__main__":
+    main()
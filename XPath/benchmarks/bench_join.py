@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""Comparisons between node-sets.
+
+Joins orders against a list of customers, the way a foreign key lookup
+would be written in XPath.
+
+    python benchmarks/bench_join.py [orders] [vips]
+
+"""
+
+import os
+import sys
+import time
+import xml.dom.minidom
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import xpath
+import xpath.expr
+
+QUERIES = [
+    "count(//order[@customer = //vip/@id])",
+    "count(//order[@customer != //vip/@id])",
+    "count(//order[@total > //vip/@limit])",
+    "count(//order[@total = 50])",
+    "//vip/@id = //order/@customer",
+    "//vip/@id = //order/@total",
+    "//vip/@limit < //order/@customer",
+]
+
+
+def make_document(orders, vips):
+    parts = ["<shop><customers>"]
+    for i in range(vips):
+        parts.append('<vip id="c%d" limit="%d"/>' % (i * 7, 50 + i % 50))
+    parts.append("</customers><orders>")
+    for i in range(orders):
+        parts.append('<order customer="c%d" total="%d"/>' % (i, i % 120))
+    parts.append("</orders></shop>")
+    return xml.dom.minidom.parseString("".join(parts))
+
+
+def main():
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    vips = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    doc = make_document(orders, vips)
+    context = xpath.XPathContext(doc)
+    total = 0.0
+    for query in QUERIES:
+        expr = xpath.XPath(query)
+        start = time.perf_counter()
+        result = expr.find(doc, context)
+        elapsed = time.perf_counter() - start
+        total += elapsed
+        print("%-45s %8.3fs  %s" % (query, elapsed, result))
+    print("%-45s %8.3fs" % ("total", total))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+"""Merging of per-node step results in PathExpr.evaluate.
+
+Evaluates //section//para over a document with many paragraphs.
+
+    python benchmarks/bench_merge.py [paragraphs]
+
+"""
+
+import os
+import sys
+import time
+import xml.dom.minidom
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import xpath
+
+
+def make_document(paragraphs, per_section=50):
+    parts = ["<book>"]
+    for i in range(0, paragraphs, per_section):
+        parts.append("<section>")
+        parts.extend("<para>%d</para>" % j for j in range(i, i + per_section))
+        parts.append("</section>")
+    parts.append("</book>")
+    return xml.dom.minidom.parseString("".join(parts))
+
+
+def main():
+    paragraphs = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    doc = make_document(paragraphs)
+    expr = xpath.XPath("//section//para")
+
+    start = time.perf_counter()
+    result = expr.find(doc)
+    elapsed = time.perf_counter() - start
+    assert len(result) == paragraphs
+    print("//section//para, %d paragraphs: %.3fs" % (paragraphs, elapsed))
+
+
+if __name__ == "__main__":
+    main()
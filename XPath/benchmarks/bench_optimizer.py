@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""Queries evaluated with and without optimization of the expression tree.
+
+The first document holds a flat list of items with numeric attributes;
+each query applies a predicate written the way generated queries often
+are, with arithmetic on literals and constant boolean terms, to every
+item.  The second holds small nested sections searched with //.  The
+third is a library whose books are compared with values found elsewhere
+in the document.
+
+    python benchmarks/bench_optimizer.py [items] [books]
+
+"""
+
+import os
+import sys
+import time
+import xml.dom.minidom
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import xpath
+
+QUERIES = [
+    "count(//item[@price > 10 * 2 + 5])",
+    "count(//item[true() and not(false()) and @price < 100 div 4])",
+    "count(//item[@code = concat('c', string(1 + 1))])",
+    "count(//item[not(not(@price >= -(-3))) or 1 = 2])",
+]
+
+DESCENDANT_QUERIES = [
+    "count(//t)",
+    "count(//t[1])",
+    "count(//t[last()])",
+    "count(//s//t[2])",
+]
+
+INVARIANT_QUERIES = [
+    "count(//book[@author = /library/featured/f/@name])",
+    "count(//book[@price > sum(//book[@author = 'a3']/@price) div 100])",
+]
+
+
+def make_doc(items):
+    return xml.dom.minidom.parseString(
+        "<list>%s</list>"
+        % "".join(
+            '<item price="%d" code="c%d"/>' % (i % 50, i % 7) for i in range(items)
+        )
+    )
+
+
+def make_sections(sections):
+    return xml.dom.minidom.parseString(
+        "<r>%s</r>" % ("<s><t>x</t><t>y</t><u><t>z</t></u></s>" * sections)
+    )
+
+
+def make_library(books):
+    return xml.dom.minidom.parseString(
+        "<library><featured>%s</featured>%s</library>"
+        % (
+            "".join('<f name="a%d"/>' % i for i in range(0, 200, 7)),
+            "".join(
+                '<book author="a%d" price="%d"/>' % (i % 200, i % 40)
+                for i in range(books)
+            ),
+        )
+    )
+
+
+def run(doc, queries):
+    for query in queries:
+        times = []
+        for optimized in (False, True):
+            expr = xpath.XPath(query, optimized=optimized)
+            result = expr.find(doc)
+            start = time.perf_counter()
+            expr.find(doc)
+            times.append(time.perf_counter() - start)
+        print("%-64s %8.3fs %8.3fs  %s" % (query, times[0], times[1], result))
+
+
+def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    books = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    run(make_doc(items), QUERIES)
+    run(make_sections(items // 2), DESCENDANT_QUERIES)
+    run(make_library(books), INVARIANT_QUERIES)
+
+
+if __name__ == "__main__":
+    main()
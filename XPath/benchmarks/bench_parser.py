@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""Hand-written parser versus the yapps2 generated parser.
+
+Parses a set of typical expressions repeatedly with each parser, as a
+workload of many one-off expressions would.
+
+    python benchmarks/bench_parser.py [rounds]
+
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import xpath.parser
+import xpath.rdparser
+
+EXPRESSIONS = [
+    "@id",
+    "string(.)",
+    "//item[@price > 10 and @price < 50]/name",
+    "/doc/section[position() = last()]//para[contains(., 'x')]",
+    "count(//a:b[@c = $d]) + sum(ancestor-or-self::*/@n) div 2",
+    "preceding-sibling::row[1]/cell[3]/text()",
+]
+
+
+def yapps_parse(s):
+    return xpath.parser.XPath(xpath.parser.XPathScanner(s)).XPath()
+
+
+def timed(parse, rounds):
+    start = time.perf_counter()
+    for i in range(rounds):
+        for expr in EXPRESSIONS:
+            parse(expr)
+    return time.perf_counter() - start
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    before = timed(yapps_parse, rounds)
+    after = timed(xpath.rdparser.parse, rounds)
+    count = rounds * len(EXPRESSIONS)
+    print("%-10s %8.3fs %8.1fus/expr" % ("yapps", before, before / count * 1e6))
+    print("%-10s %8.3fs %8.1fus/expr" % ("rdparser", after, after / count * 1e6))
+    print("speedup    %8.1fx" % (before / after))
+
+
+if __name__ == "__main__":
+    main()
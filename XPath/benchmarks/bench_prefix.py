@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Queries sharing a prefix evaluated one at a time or as a batch.
+
+The document is a catalog of products in sections, each product with a
+price and a number of fields.  Every query starts with the same four
+steps, /catalog/section[@open]/product[price > 50], which select the
+products, then selects a different field of them.  The queries are
+evaluated with xpath.find(), then together with a QuerySet, which
+evaluates the shared steps once.
+
+    python benchmarks/bench_prefix.py [products] [queries]
+
+"""
+
+import os
+import sys
+import time
+import xml.dom.minidom
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import xpath
+
+SECTIONS = 20
+PREFIX = "/catalog/section[@open]/product[price > 50]"
+
+
+def make_catalog(products, fields):
+    return "<catalog>%s</catalog>" % "".join(
+        '<section id="s%d"%s>%s</section>'
+        % (
+            s,
+            ' open="yes"' if s % 4 else "",
+            "".join(
+                "<product><price>%d</price>%s</product>"
+                % (i % 100, "".join("<f%d>%d</f%d>" % (n, i, n) for n in range(fields)))
+                for i in range(s, products, SECTIONS)
+            ),
+        )
+        for s in range(SECTIONS)
+    )
+
+
+def main():
+    products = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    doc = xml.dom.minidom.parseString(make_catalog(products, count))
+    queries = ["%s/f%d" % (PREFIX, n) for n in range(count)]
+    batch = xpath.QuerySet(queries)
+
+    start = time.perf_counter()
+    expected = [xpath.find(query, doc) for query in queries]
+    single = time.perf_counter() - start
+    start = time.perf_counter()
+    results = batch.find(doc)
+    shared = time.perf_counter() - start
+    assert results == expected
+    print("%d queries, %d products" % (count, products))
+    print("%-10s %8.3fs" % ("find", single))
+    print("%-10s %8.3fs  %d nodes" % ("queryset", shared,
+                                      sum(len(r) for r in results)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""Many rules matched against a document one at a time or in one traversal.
+
+The document is a catalog of products in sections; the rules select
+products by section, by attribute and by position, as a set of extraction
+or validation rules would.  Each rule is evaluated with xpath.find(), with
+and without document indexes kept between the calls, then all of them
+together with a QuerySet, streamed and not streamed.
+
+    python benchmarks/bench_queryset.py [products] [rules]
+
+"""
+
+import os
+import sys
+import time
+import xml.dom.minidom
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import xpath
+
+SECTIONS = 20
+
+
+def make_catalog(products):
+    return "<catalog>%s</catalog>" % "".join(
+        '<section id="s%d">%s</section>'
+        % (
+            s,
+            "".join(
+                '<product sku="%d" kind="%s"><name>p%d</name>'
+                '<price currency="eur">%d</price></product>'
+                % (i, "abcde"[i % 5], i, i % 97)
+                for i in range(s, products, SECTIONS)
+            ),
+        )
+        for s in range(SECTIONS)
+    )
+
+
+def make_rules(count):
+    # All different, so that each is matched on its own.
+    templates = [
+        "/catalog/section[@id = 's%d']/product[%d]/name",
+        "//product[@kind = '%s'][%d]/price/@currency",
+        "/catalog/section/product[%d][@kind = 'a']/@sku",
+        "//section[@id = 's%d']//price[%d]",
+        "//product[@sku = %d]",
+    ]
+    rules = []
+    for i in range(count):
+        n = i // len(templates)
+        rule = templates[i % len(templates)]
+        if rule.count("%") == 2:
+            rule = rule % ("abcde"[n % 5] if "kind" in rule else n % SECTIONS, n + 1)
+        else:
+            rule = rule % (n + 1)
+        rules.append(rule)
+    return rules
+
+
+def main():
+    products = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    doc = xml.dom.minidom.parseString(make_catalog(products))
+    rules = make_rules(count)
+
+    start = time.perf_counter()
+    queries = xpath.QuerySet(rules)
+    assert len(set(rules)) == len(queries.streamed) == count
+    compiled = time.perf_counter() - start
+    print("%d rules, %d products, QuerySet compiled in %.3fs"
+          % (count, products, compiled))
+
+    start = time.perf_counter()
+    expected = [xpath.find(rule, doc) for rule in rules]
+    timings = [("find", time.perf_counter() - start)]
+    indexes = {}
+    start = time.perf_counter()
+    assert [xpath.find(rule, doc, index=indexes) for rule in rules] == expected
+    timings.append(("indexed", time.perf_counter() - start))
+    start = time.perf_counter()
+    results = queries.find(doc)
+    timings.append(("queryset", time.perf_counter() - start))
+    assert results == expected
+    unstreamed = xpath.QuerySet(rules, stream=False)
+    start = time.perf_counter()
+    assert unstreamed.find(doc) == expected
+    timings.append(("unstreamed", time.perf_counter() - start))
+    for name, elapsed in timings:
+        print("%-10s %8.3fs" % (name, elapsed))
+    print("%d nodes" % sum(len(r) for r in results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""Fields extracted from each entry of a feed, from a DOM or by record.
+
+The feed is a list of entries with fifteen fields each.  The fields are
+extracted with findvalue() on each entry of a DOM built by minidom,
+counting the parse, and with iterrecords(), which expands one entry at a
+time.  The time and the peak memory allocated are given for both.
+
+    python benchmarks/bench_records.py [entries]
+
+"""
+
+import io
+import os
+import sys
+import time
+import tracemalloc
+import xml.dom.minidom
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import xpath
+
+NAMES = ["f%d" % i for i in range(12)]
+FIELDS = dict((name, name) for name in NAMES)
+FIELDS.update({"id": "@id", "kind": "@kind", "links": "count(link)"})
+
+
+def make_feed(entries):
+    return (
+        "<feed>%s</feed>"
+        % "".join(
+            '<entry id="%d" kind="%s">%s<link/><link/></entry>'
+            % (i, "abc"[i % 3], "".join("<%s>%s %d</%s>" % (n, n, i, n) for n in NAMES))
+            for i in range(entries)
+        )
+    ).encode("utf-8")
+
+
+def dom(data):
+    doc = xml.dom.minidom.parseString(data)
+    exprs = dict((name, xpath.XPath(expr)) for name, expr in FIELDS.items())
+    count = 0
+    for entry in xpath.find("/feed/entry", doc):
+        dict((name, expr.findvalue(entry)) for name, expr in exprs.items())
+        count += 1
+    return count
+
+
+def records(data):
+    count = 0
+    for record in xpath.iterrecords(io.BytesIO(data), "/feed/entry", FIELDS):
+        count += 1
+    return count
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    data = make_feed(entries)
+    for name, f in (("dom", dom), ("iterrecords", records)):
+        start = time.perf_counter()
+        count = f(data)
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        f(data)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("%-12s %8.3fs peak %10.1fKB  %d" % (name, elapsed, peak / 1024.0, count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""Location paths whose steps have many context nodes.
+
+Each query is run once before being timed, then timed again with a
+context holding the document index, over which steps are joined.
+The document is a tree with the given fan-out at each of four levels,
+with a pair of nested elements of the same name under every element.
+
+    python benchmarks/bench_steps.py [fanout]
+
+"""
+
+import os
+import sys
+import time
+import xml.dom.minidom
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import xpath
+
+QUERIES = [
+    "count(/a/b/c/d)",
+    "count(/a/b/c/d/@id)",
+    "count(//s//s)",
+    "count(//c/descendant::d)",
+    "count(/a/b/c/following::d)",
+    "count(/a/b/c/d/preceding-sibling::d)",
+    "count(//d/..)",
+    "count(//d/ancestor::*)",
+    "count(//c//s/ancestor::b)",
+    "count(/a/b/descendant::node())",
+    "count(//s/following::text())",
+    "count(//d/preceding::s)",
+]
+
+
+def make_tree(fanout):
+    def level(names):
+        if not names:
+            return ""
+        inner = level(names[1:])
+        return (
+            '<%s id="1"><s><s>x</s></s>%s</%s>' % (names[0], inner, names[0])
+        ) * fanout
+
+    return xml.dom.minidom.parseString("<a>%s</a>" % level("bcd"))
+
+
+def main():
+    fanout = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    doc = make_tree(fanout)
+    indexed = xpath.XPathContext(doc, index={})
+    print("%-44s %9s %9s" % ("", "dom", "indexed"))
+    for query in QUERIES:
+        expr = xpath.XPath(query)
+        times = []
+        for context in (None, indexed):
+            expr.find(doc, context)
+            start = time.perf_counter()
+            result = expr.find(doc, context)
+            times.append(time.perf_counter() - start)
+        print("%-44s %8.4fs %8.4fs  %s" % ((query,) + tuple(times) + (result,)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""Values extracted from a feed by parsing it into a DOM or streaming it.
+
+The feed is a list of entries, each with a few fields and attributes.
+Each query is run over a DOM built by minidom, counting the parse, and
+over the serialized feed with StreamingXPath.  The time and the peak
+memory allocated are given for both.
+
+    python benchmarks/bench_stream.py [entries]
+
+"""
+
+import io
+import os
+import sys
+import time
+import tracemalloc
+import xml.dom.minidom
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import xpath
+
+QUERIES = [
+    "/feed/entry/title",
+    "//entry[@kind = 'b']/@id",
+    "/feed/entry[position() mod 10 = 0]/summary",
+]
+
+
+def make_feed(entries):
+    return (
+        "<feed>%s</feed>"
+        % "".join(
+            '<entry id="%d" kind="%s"><title>entry %d</title>'
+            "<summary>%s</summary><link href='/e/%d'/></entry>"
+            % (i, "abc"[i % 3], i, "text " * 10, i)
+            for i in range(entries)
+        )
+    ).encode("utf-8")
+
+
+def dom(data, query):
+    return xpath.findvalues(query, xml.dom.minidom.parseString(data))
+
+
+def stream(data, query):
+    return list(xpath.StreamingXPath(query).iterfindvalues(io.BytesIO(data)))
+
+
+def measure(f, data, query):
+    start = time.perf_counter()
+    f(data, query)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    result = f(data, query)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, len(result)
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    data = make_feed(entries)
+    for query in QUERIES:
+        for name, f in (("dom", dom), ("stream", stream)):
+            elapsed, peak, count = measure(f, data, query)
+            print(
+                "%-44s %-6s %8.3fs peak %10.1fKB  %d"
+                % (query, name, elapsed, peak / 1024.0, count)
+            )
+
+
+if __name__ == "__main__":
+    main()
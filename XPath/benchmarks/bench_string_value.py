@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""String-values of large mixed-content elements.
+
+The document is a book of nested chapters, each holding paragraphs of
+mixed text and inline markup.  Queries are run without memoization and
+with a per-evaluation memo.
+
+    python benchmarks/bench_string_value.py [chapters] [paragraphs]
+
+"""
+
+import os
+import sys
+import time
+import xml.dom.minidom
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import xpath
+
+QUERIES = [
+    "string-length(string(/))",
+    "//chapter[contains(., 'needle')]",
+    "//chapter[contains(., 'needle') or starts-with(., 'x')]",
+    "sum(//chapter[. != ''][not(contains(., 'x'))]/@n)",
+]
+
+
+def make_book(chapters, paragraphs):
+    para = "<p>text <b>bold</b> more <i>it<b>al</b>ic</i> end</p>" * paragraphs
+    parts = []
+    for i in range(chapters):
+        parts.append('<chapter n="%d">' % i + para)
+        if i % 4 == 3:
+            parts.append("needle" + "</chapter>" * 4)
+    parts.append("</chapter>" * (chapters % 4))
+    return xml.dom.minidom.parseString("<book>%s</book>" % "".join(parts))
+
+
+def main():
+    chapters = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    paragraphs = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    doc = make_book(chapters, paragraphs)
+    for query in QUERIES:
+        expr = xpath.XPath(query)
+        for memoize in (False, True):
+            elapsed = None
+            for _ in range(3):
+                start = time.perf_counter()
+                result = expr.find(doc, memoize=memoize)
+                t = time.perf_counter() - start
+                elapsed = t if elapsed is None else min(elapsed, t)
+            if isinstance(result, list):
+                result = len(result)
+            print("%-56s %-5s %8.3fs  %s" % (query, memoize, elapsed, result))
+
+
+if __name__ == "__main__":
+    main()
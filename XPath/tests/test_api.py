@@ -149,3 +149,106 @@ class TestNamespacesAPI(unittest.TestCase):
         result = context.findvalues('//pork:item', self.doc)
         self.assertEqual(result, ['porcupine'])
 
+
+    def test_cached_declarations(self):
+        # Contexts for the same document share its declarations, but not
+        # the mapping holding them.
+        context = xpath.XPathContext(self.doc)
+        context.namespaces['pork'] = 'http://porcupine.example.org/'
+        other = xpath.XPathContext(self.doc.documentElement)
+        self.assertEqual(other.default_namespace, 'http://parrot.example.org/')
+        self.assertEqual(other.namespaces, {})
+
+    def test_invalidate_declarations(self):
+        self.assertEqual(xpath.findvalues('//item', self.doc),
+                         ['argument', 'lumberjack', 'parrot'])
+        self.doc.documentElement.setAttribute(
+            'xmlns', 'http://porcupine.example.org/')
+        self.assertEqual(len(xpath.findvalues('//item', self.doc)), 3)
+        xpath.invalidate(self.doc.documentElement)
+        self.assertEqual(xpath.findvalues('//item', self.doc), ['porcupine'])
+
+class TestContextOverlay(unittest.TestCase):
+    """Contexts updated for a single evaluation."""
+
+    def setUp(self):
+        self.doc = xml.dom.minidom.parseString(
+            '<doc><item id="1"/><item id="2"/></doc>')
+        self.context = xpath.XPathContext(variables={'a': 1}, b=2)
+
+    def test_overlay(self):
+        overlay = self.context.overlay(b=3, c=4)
+        self.assertEqual(overlay.variables['a'], 1)
+        self.assertEqual(overlay.variables['b'], 3)
+        self.assertEqual(overlay.variables['c'], 4)
+        self.assertEqual(self.context.variables, {'a': 1, 'b': 2})
+        self.context.variables['a'] = 5
+        self.assertEqual(overlay.variables['a'], 5)
+
+    def test_overlay_replaces(self):
+        overlay = self.context.overlay(
+            namespaces={'x': 'http://x.example.org/'}, variables={'d': 1})
+        self.assertEqual(overlay.variables, {'d': 1})
+        self.assertEqual(overlay.namespaces, {'x': 'http://x.example.org/'})
+        self.assertEqual(self.context.namespaces, {})
+
+    def test_keyword_variables(self):
+        expr = '//item[@id = $a + $b]/@id'
+        self.assertEqual(self.context.findvalues(expr, self.doc, b=1), ['2'])
+        self.assertEqual(self.context.findvalues(expr, self.doc, b=0), ['1'])
+        self.assertEqual(self.context.variables, {'a': 1, 'b': 2})
+        frozen = xpath.FrozenDocument(self.doc)
+        self.assertEqual(frozen.findvalues(expr, context=self.context, b=1),
+                         ['2'])
+        self.assertIsNone(self.context.frozen)
+        clone = self.context.overlay(b=1).clone()
+        self.assertEqual(clone.variables, {'a': 1, 'b': 1})
+
+class TestEach(unittest.TestCase):
+    """One expression evaluated for many context nodes."""
+
+    xml = """
+<doc xmlns:x="http://x.example.org/">
+    <item id="1"><x:name>argument</x:name></item>
+    <item id="2"><x:name>lumberjack</x:name><x:name>parrot</x:name></item>
+    <item id="3"/>
+</doc>
+"""
+
+    def setUp(self):
+        self.doc = xml.dom.minidom.parseString(self.xml)
+        self.other = xml.dom.minidom.parseString(
+            '<doc xmlns:x="http://y.example.org/">'
+            '<item id="4"><x:name>y</x:name></item></doc>')
+        self.nodes = (xpath.find('//item', self.doc) +
+                      xpath.find('//item', self.other) +
+                      xpath.find('//item/@id', self.doc))
+
+    def test_find_each(self):
+        for expr in ('x:name', 'string(x:name)', 'count(x:name) + $n',
+                     'following-sibling::item', '.'):
+            expected = [xpath.find(expr, node, n=1) for node in self.nodes]
+            compiled = xpath.XPath(expr)
+            self.assertEqual(compiled.find_each(self.nodes, n=1), expected)
+            self.assertEqual(xpath.find_each(expr, iter(self.nodes), n=1),
+                             expected)
+            expected = [xpath.findvalue(expr, node, n=1)
+                        for node in self.nodes]
+            self.assertEqual(compiled.findvalue_each(self.nodes, n=1),
+                             expected, expr)
+
+    def test_context(self):
+        # The prefixes of an explicit context hold for every document.
+        context = xpath.XPathContext(
+            namespaces={'x': 'http://y.example.org/'}, memoize=True)
+        self.assertEqual(context.findvalue_each('x:name', self.nodes[:4]),
+                         [None, None, None, 'y'])
+        self.assertEqual(context.find_each('$n', self.nodes[:2], n=2),
+                         [2, 2])
+        self.assertEqual(xpath.find_each('x:name', []), [])
+
+    def test_errors(self):
+        self.assertRaises(xpath.XPathUnknownVariableError, xpath.find_each,
+                          '$n', self.nodes)
+        self.assertRaises(xpath.XPathTypeError, xpath.findvalue_each,
+                          'string(.)/x', self.nodes)
@@ -113,3 +113,29 @@ class TestAxes(unittest.TestCase):
         self.assertEqual(a, b)
 
 
+
+class TestDeepAxes(unittest.TestCase):
+    """Axes on a document nested deeper than the recursion limit."""
+
+    depth = 3000
+
+    def setUp(self):
+        self.doc = xml.dom.minidom.parseString(
+            '<x><y>t</y>' * self.depth + '</x>' * self.depth)
+
+    def test_descendant(self):
+        self.assertEqual(xpath.find('count(/descendant::x)', self.doc),
+                         self.depth)
+        self.assertEqual(
+            xpath.find('count(/descendant-or-self::node())', self.doc),
+            self.depth * 3 + 1)
+        self.assertEqual(xpath.find('string(/)', self.doc), 't' * self.depth)
+
+    def test_following_and_preceding(self):
+        self.assertEqual(xpath.find('count(/x/y/following::*)', self.doc),
+                         self.depth * 2 - 2)
+        last = xpath.find('/descendant::y', self.doc)[-1]
+        preceding = xpath.find('preceding::node()', last)
+        self.assertEqual(len(preceding), self.depth * 2 - 2)
+        self.assertEqual(preceding[0].nodeName, 'y')
+        self.assertEqual(preceding[-1].data, 't')
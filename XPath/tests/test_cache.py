@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+import threading
+import unittest
+import xml.dom.minidom
+import xpath
+from xpath.cache import ExpressionCache
+
+class TestExpressionCache(unittest.TestCase):
+    """The LRU cache of compiled expressions."""
+
+    def test_hits_and_misses(self):
+        cache = ExpressionCache(maxsize=2)
+        a = cache.get('//a', xpath.XPath)
+        self.assertIs(cache.get('//a', xpath.XPath), a)
+        self.assertEqual(tuple(cache.info()), (1, 1, 0, 2, 1))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ExpressionCache(maxsize=2)
+        cache.get('//a', xpath.XPath)
+        cache.get('//b', xpath.XPath)
+        cache.get('//a', xpath.XPath)
+        cache.get('//c', xpath.XPath)
+        self.assertIn('//a', cache)
+        self.assertNotIn('//b', cache)
+        self.assertIn('//c', cache)
+        info = cache.info()
+        self.assertEqual((info.evictions, info.currsize), (1, 2))
+
+    def test_working_set_larger_than_old_limit(self):
+        # 101 hot expressions used to flush the cache on every pass.
+        cache = ExpressionCache(maxsize=128)
+        exprs = ['//item[%d]' % i for i in range(101)]
+        for _ in range(3):
+            for expr in exprs:
+                cache.get(expr, xpath.XPath)
+        info = cache.info()
+        self.assertEqual((info.misses, info.hits, info.evictions),
+                         (101, 202, 0))
+
+    def test_resize(self):
+        cache = ExpressionCache(maxsize=4)
+        for name in 'abcd':
+            cache.get('//' + name, xpath.XPath)
+        cache.maxsize = 1
+        self.assertEqual(len(cache), 1)
+        self.assertIn('//d', cache)
+        self.assertEqual(cache.info().evictions, 3)
+        self.assertRaises(ValueError, ExpressionCache, -1)
+
+    def test_zero_size_disables_caching(self):
+        cache = ExpressionCache(maxsize=0)
+        cache.get('//a', xpath.XPath)
+        cache.get('//a', xpath.XPath)
+        self.assertEqual(tuple(cache.info()), (0, 2, 2, 0, 0))
+
+    def test_clear(self):
+        cache = ExpressionCache()
+        cache.get('//a', xpath.XPath)
+        cache.clear(stats=False)
+        self.assertEqual(tuple(cache.info()), (0, 1, 0, 100, 0))
+        cache.clear()
+        self.assertEqual(tuple(cache.info()), (0, 0, 0, 100, 0))
+
+    def test_parse_errors_are_not_cached(self):
+        cache = ExpressionCache()
+        self.assertRaises(xpath.XPathParseError, cache.get, '//[', xpath.XPath)
+        self.assertEqual(len(cache), 0)
+
+    def test_threads(self):
+        cache = ExpressionCache(maxsize=16)
+        exprs = ['//item[%d]' % i for i in range(32)]
+        errors = []
+
+        def worker(offset):
+            try:
+                for i in range(500):
+                    expr = exprs[(i * 7 + offset) % len(exprs)]
+                    self.assertEqual(str(cache.get(expr, xpath.XPath)),
+                                     str(xpath.XPath(expr)))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,))
+                   for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        info = cache.info()
+        self.assertEqual(info.hits + info.misses, 8 * 500)
+        self.assertLessEqual(info.currsize, 16)
+
+    def test_module_functions(self):
+        doc = xml.dom.minidom.parseString('<doc><item/></doc>')
+        old = xpath.cache_info().maxsize
+        try:
+            xpath.set_cache_size(1)
+            xpath.find('//item', doc)
+            before = xpath.cache_info()
+            xpath.find('//item', doc)
+            self.assertEqual(xpath.cache_info().hits, before.hits + 1)
+            xpath.find('//doc', doc)
+            self.assertEqual(xpath.cache_info().evictions,
+                             before.evictions + 1)
+        finally:
+            xpath.set_cache_size(old)
+
+    def test_old_attributes(self):
+        doc = xml.dom.minidom.parseString('<doc><item/></doc>')
+        xpath.find('//item', doc)
+        self.assertIs(xpath.XPath._cache['//item'], xpath.XPath.get('//item'))
+        self.assertEqual(xpath.XPath._max_cache, xpath.cache_info().maxsize)
+        with self.assertRaises(TypeError):
+            xpath.XPath._cache['//item'] = None
+        with self.assertRaises(AttributeError):
+            xpath.XPath._max_cache = 10
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import itertools
+import random
+import unittest
+import xml.dom.minidom
+import xpath
+import xpath.expr as X
+
+def pairwise(op, a, b):
+    """Compare values one pair of string-values at a time."""
+    if X.nodesetp(a):
+        return any(pairwise(op, X.string_value(n), b) for n in a)
+    if X.nodesetp(b):
+        return any(pairwise(op, a, X.string_value(n)) for n in b)
+    if op in ('=', '!='):
+        if X.booleanp(a) or X.booleanp(b):
+            convert = X.boolean
+        elif X.numberp(a) or X.numberp(b):
+            convert = X.number
+        else:
+            convert = X.string
+    else:
+        convert = X.number
+    return X.EqualityExpr.operators[op](convert(a), convert(b))
+
+class TestComparisons(unittest.TestCase):
+    """Node-set comparisons agree with comparing every pair of nodes."""
+
+    values = ['1', '2', '2.0', ' 3 ', '', 'abc', 'NaN', '-1', 'Infinity']
+
+    def setUp(self):
+        doc = xml.dom.minidom.parseString(
+            '<doc>%s</doc>' % ''.join('<v>%s</v>' % v for v in self.values))
+        self.nodes = xpath.find('//v', doc)
+
+    def test_random_nodesets(self):
+        rng = random.Random(0)
+        scalars = [1.0, 2.0, float('nan'), 'abc', '2', '', True, False]
+        for _ in range(500):
+            a = rng.sample(self.nodes, rng.randint(0, 4))
+            b = rng.sample(self.nodes, rng.randint(0, 4))
+            for op in X.EqualityExpr.operators:
+                self.assertEqual(X.compare(op, a, b), pairwise(op, a, b),
+                                 (op, a, b))
+                for v in scalars:
+                    self.assertEqual(X.compare(op, a, v), pairwise(op, a, v))
+                    self.assertEqual(X.compare(op, v, a), pairwise(op, v, a))
+
+    def test_expressions(self):
+        doc = xml.dom.minidom.parseString("""
+<doc>
+    <vip id="c2" limit="10"/><vip id="c4" limit="NaN"/>
+    <order customer="c1" total="5"/><order customer="c2" total="20"/>
+    <order customer="c4" total="abc"/><order customer="c2" total="8"/>
+</doc>
+""")
+        for expr, expected in [
+                ('//order[@customer = //vip/@id]/@total', ['20', 'abc', '8']),
+                ('//order[@customer != //vip/@id]/@total', ['5', '20', 'abc', '8']),
+                ('//order[@total > //vip/@limit]/@total', ['20']),
+                ('//order[@total <= //vip/@limit]/@total', ['5', '8']),
+                ('//order[@total = 20]/@total', ['20']),
+                ('//order["c2" = @customer]/@total', ['20', '8']),
+                ('//order[@total >= "8"]/@total', ['20', '8'])]:
+            for compiled in (True, False):
+                self.assertEqual(
+                    xpath.XPath(expr, compiled=compiled).findvalues(doc),
+                    expected, expr)
+
+if __name__ == '__main__':
+    unittest.main()
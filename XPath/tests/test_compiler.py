@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+import unittest
+import xml.dom.minidom
+import xpath
+
+class TestCompiler(unittest.TestCase):
+    """Compiled expressions agree with the tree-walking interpreter."""
+
+    xml = """
+<doc xmlns:x="http://example.org/x">
+    <item id="1" price="12"><name>argument</name></item>
+    <item id="2" price="40"><name>lumberjack</name><item id="2.1"/></item>
+    <item id="3" sale="yes"><note>spam</note></item>
+    <x:item id="4" price="7">parrot</x:item>
+    <?pi data?>
+    <!-- comment -->
+</doc>
+"""
+
+    exprs = [
+        '//item', '//item[@price > 10 and @price < 50]/@id',
+        '//item[not(@sale)][string-length(name) > 3]',
+        '//item[position() mod 2 = 0]', '//item[last()]/name',
+        'count(//item[@price * 2 > 30])', '//item[name = concat("l", "x")]',
+        '//item[name = "argument"] | //x:item', '//x:*', '//*:item/@id',
+        '/doc/node()[2]', '//processing-instruction()', '//comment()',
+        '//name/text()', '//item/ancestor-or-self::*[1]',
+        '//item[@id = 2]/preceding-sibling::*', '1 + 2 * 3 - -1',
+        '"a" = "a" or 1 div 0 > 5', 'sum(//@price) div count(//@price)',
+        '//item[@price = //item[@sale]/@price]', '//item[true() = @sale]',
+        'string(//item[3])', 'boolean(//note)', '(//item)[2]/@id',
+        '//item[$id = @id]', 'number(//@price[. > $min])',
+    ]
+
+    def setUp(self):
+        self.doc = xml.dom.minidom.parseString(self.xml)
+        self.context = xpath.XPathContext(self.doc, id=2, min=10)
+
+    def test_find(self):
+        for expr in self.exprs:
+            compiled = xpath.XPath(expr)
+            interpreted = xpath.XPath(expr, compiled=False)
+            for node in [self.doc] + xpath.find('//node()', self.doc):
+                expected = interpreted.find(node, context=self.context)
+                result = compiled.find(node, context=self.context)
+                self.assertEqual(result, expected, expr)
+                self.assertEqual(type(result), type(expected), expr)
+
+    def test_findnode_and_findvalue(self):
+        for expr in self.exprs:
+            compiled = xpath.XPath(expr)
+            interpreted = xpath.XPath(expr, compiled=False)
+            self.assertEqual(
+                compiled.findvalue(self.doc, context=self.context),
+                interpreted.findvalue(self.doc, context=self.context), expr)
+
+    def test_interpreter_flag(self):
+        self.assertTrue(xpath.XPath('//item').compiled)
+        self.assertFalse(xpath.XPath('//item', compiled=False).compiled)
+        self.assertEqual(str(xpath.XPath('//item')),
+                         str(xpath.XPath('//item', compiled=False)))
+
+    def test_errors(self):
+        for expr, error in [('//y:item', xpath.XPathUnknownPrefixError),
+                            ('//item[$undefined]',
+                             xpath.XPathUnknownVariableError),
+                            ('string(1)/node()', xpath.XPathTypeError)]:
+            for compiled in (True, False):
+                self.assertRaises(error, xpath.find,
+                                  xpath.XPath(expr, compiled=compiled),
+                                  self.doc)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+import gc
+import unittest
+import weakref
+import xml.dom.minidom
+import xpath
+import xpath.expr
+
+class TestDocumentOrder(unittest.TestCase):
+    """Document order index."""
+
+    xml = """
+<doc>
+    <chapter id="c1" b="2" a="1">
+        <para id="p1"/>
+        <para id="p2"><note id="n1"/></para>
+    </chapter>
+    <chapter id="c2">
+        <para id="p3"/>
+    </chapter>
+</doc>
+"""
+
+    def setUp(self):
+        self.doc = xml.dom.minidom.parseString(self.xml)
+
+    def ids(self, nodes):
+        return [x.getAttribute("id") for x in nodes]
+
+    def test_preorder_ranks(self):
+        nodes = xpath.find('//*', self.doc)
+        ranks = [xpath.expr.document_order(n) for n in nodes]
+        self.assertEqual(ranks, sorted(ranks))
+        self.assertEqual(xpath.expr.document_order(self.doc), 0)
+
+    def test_attributes_precede_children(self):
+        chapter = xpath.findnode('//chapter[1]', self.doc)
+        para = xpath.findnode('//para[1]', self.doc)
+        attrs = xpath.find('//chapter[1]/@*', self.doc)
+        self.assertEqual([a.name for a in attrs], ['id', 'b', 'a'])
+        for attr in attrs:
+            self.assertTrue(xpath.expr.document_order(chapter) <
+                            xpath.expr.document_order(attr) <
+                            xpath.expr.document_order(para))
+
+    def test_union_order(self):
+        result = xpath.find('//note | //chapter | //para[@id="p3"]', self.doc)
+        self.assertEqual(self.ids(result), ['c1', 'n1', 'c2', 'p3'])
+
+    def test_union_attributes(self):
+        result = xpath.find('//chapter[1]/@b | //chapter[1] | //chapter[1]/@a',
+                            self.doc)
+        self.assertEqual([n.nodeName for n in result], ['chapter', 'b', 'a'])
+
+    def test_added_node(self):
+        xpath.find('//para', self.doc)
+        chapter = xpath.findnode('//chapter[1]', self.doc)
+        para = self.doc.createElement('para')
+        para.setAttribute('id', 'p0')
+        chapter.insertBefore(para, chapter.firstChild)
+        result = xpath.find('//para | //note', self.doc)
+        self.assertEqual(self.ids(result), ['p0', 'p1', 'p2', 'n1', 'p3'])
+
+    def test_moved_nodes(self):
+        xpath.find('//chapter | //para', self.doc)
+        c1, c2 = xpath.find('//chapter', self.doc)
+        self.doc.documentElement.insertBefore(c2, c1)
+        result = xpath.find('//chapter | //para', self.doc)
+        self.assertEqual(self.ids(result), ['c2', 'p3', 'c1', 'p1', 'p2'])
+
+    def test_sort_after_change(self):
+        xpath.find('//chapter | //para', self.doc)
+        c1 = xpath.findnode('//chapter[1]', self.doc)
+        section = self.doc.createElement('section')
+        for i in range(3):
+            section.appendChild(self.doc.createElement('para'))
+        p0 = section.lastChild
+        p0.setAttribute('id', 'p0')
+        root = self.doc.documentElement
+        root.insertBefore(section, root.firstChild)
+        nodes = [c1, p0]
+        xpath.expr.sort_nodeset(nodes)
+        self.assertEqual(self.ids(nodes), ['p0', 'c1'])
+
+    def test_sort_without_index(self):
+        order = xpath.expr.document_index(self.doc).order
+        nodes = sorted(order, key=order.get)
+        shuffled = nodes[::-1]
+        xpath.expr.sort_nodeset(shuffled)
+        self.assertEqual(shuffled, nodes)
+        self.assertEqual(xpath.find('/ | //node() | //@*', self.doc), nodes)
+        self.assertEqual(
+            xpath.find('/ | //node() | //@*', self.doc, index=True), nodes)
+
+    def test_detached_tree(self):
+        chapter = xpath.findnode('//chapter[1]', self.doc)
+        chapter.parentNode.removeChild(chapter)
+        result = xpath.find('.//note | .//para', chapter)
+        self.assertEqual(self.ids(result), ['p1', 'p2', 'n1'])
+
+    def test_collectable(self):
+        # Indexes are not kept after an evaluation, so they do not keep
+        # their documents alive.
+        xpath.find('//chapter | //para', self.doc)
+        self.assertIsNone(xpath.expr._document_indexes.get(self.doc))
+        ref = weakref.ref(self.doc)
+        del self.doc
+        gc.collect()
+        self.assertIsNone(ref())
+
+    def test_merge_into_nodeset(self):
+        p1, p2, p3 = xpath.find('//para', self.doc)
+        target = []
+        seen = set()
+        xpath.expr.merge_into_nodeset(target, [p2, p3], seen=seen)
+        xpath.expr.merge_into_nodeset(target, [p1, p2], seen=seen)
+        self.assertEqual(target, [p1, p2, p3])
+        self.assertEqual(seen, set(target))
+
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+import unittest
+import xml.dom.minidom
+import xpath
+import xpath.expr
+
+class TestElementIndex(unittest.TestCase):
+    """Per-document index of elements by expanded name."""
+
+    xml = """
+<doc xmlns:x="http://example.org/x">
+    <item id="1"><item id="1.1"/><name>one</name></item>
+    <x:item id="2"><item id="2.1"><x:item id="2.1.1"/></item></x:item>
+    <other id="3"><item id="3.1"/></other>
+</doc>
+"""
+
+    def setUp(self):
+        self.doc = xml.dom.minidom.parseString(self.xml)
+
+    def ids(self, nodes):
+        return [x.getAttribute('id') for x in nodes]
+
+    def index(self):
+        return xpath.expr._document_indexes.get(self.doc)
+
+    def test_matches_interpreter(self):
+        for index in (False, True):
+            context = xpath.XPathContext(self.doc, index=index)
+            for expr in ['//item', '//x:item', '//*:item', '//x:*', '//*',
+                         '//item//item', '/doc/*//item', '//item[@id > 2]',
+                         '//*[name]//item', '//other//*', 'count(//item)',
+                         '//item[1]', '//name//item', '//@id', '//text()']:
+                for node in [self.doc] + xpath.find('//*', self.doc):
+                    self.assertEqual(
+                        xpath.XPath(expr).find(node, context),
+                        xpath.XPath(expr, compiled=False).find(node, context),
+                        expr)
+
+    def test_descendants_of_element(self):
+        item = xpath.findnode('//x:item', self.doc)
+        self.assertEqual(self.ids(xpath.find('.//item', item)), ['2.1'])
+        self.assertEqual(self.ids(xpath.find('.//x:item', item)), ['2.1.1'])
+        self.assertEqual(self.ids(xpath.find('.//*:item', item)),
+                         ['2.1', '2.1.1'])
+
+    def test_not_built_by_default(self):
+        with xpath.expr._document_indexes.scope():
+            item = xpath.findnode('//x:item', self.doc)
+            self.assertEqual(self.ids(xpath.find('.//item', item)), ['2.1'])
+            self.assertEqual(len(xpath.find('//item | //name', self.doc)), 5)
+            self.assertIsNone(self.index())
+
+    def test_built_lazily(self):
+        with xpath.expr._document_indexes.scope():
+            xpath.find('/doc/item', self.doc, index=True)
+            self.assertIsNone(self.index())
+            xpath.find('//name', self.doc, index=True)
+            self.assertIsNotNone(self.index().names)
+        self.assertIsNone(self.index())
+
+    def test_findnode_uses_existing_index(self):
+        with xpath.expr._document_indexes.scope():
+            self.assertEqual(xpath.findvalue('//item/@id', self.doc,
+                                             index=True), '1')
+            self.assertIsNone(self.index())
+            xpath.find('//item', self.doc, index=True)
+            for expr in ['//item/@id', '//item[@id > 2]/@id',
+                         '//x:item//x:item/@id']:
+                self.assertEqual(xpath.findvalue(expr, self.doc),
+                                 xpath.find(expr, self.doc)[0].value, expr)
+
+    def test_index_dict(self):
+        indexes = {}
+        context = xpath.XPathContext(self.doc, index=indexes)
+        self.assertEqual(len(context.find('//item', self.doc)), 4)
+        index = indexes[self.doc]
+        self.assertIsNotNone(index.names)
+        context.find('//x:item', self.doc)
+        self.assertIs(indexes[self.doc], index)
+        other = xpath.findnode('//other', self.doc)
+        other.appendChild(self.doc.createElement('item'))
+        indexes.clear()
+        self.assertEqual(len(context.find('//item', self.doc)), 5)
+
+    def test_results_are_copies(self):
+        result = xpath.find('//item', self.doc)
+        result.pop()
+        self.assertEqual(len(xpath.find('//item', self.doc)), 4)
+
+    def test_added_element(self):
+        self.assertEqual(len(xpath.find('//item', self.doc)), 4)
+        other = xpath.findnode('//other', self.doc)
+        other.appendChild(self.doc.createElement('item'))
+        self.assertEqual(len(xpath.find('//item', self.doc)), 5)
+
+    def test_detached_tree(self):
+        root = self.doc.createElement('item')
+        root.appendChild(self.doc.createElement('item'))
+        self.assertEqual(len(xpath.find('.//item', root)), 1)
+
+    def test_unknown_prefix(self):
+        self.assertRaises(xpath.XPathUnknownPrefixError,
+                          xpath.find, '//y:item', self.doc)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+import unittest
+import xml.dom.minidom
+import xpath
+import xpath.expr
+
+class TestFrozenDocument(unittest.TestCase):
+    """Array-backed read-only documents."""
+
+    xml = """<?xml version="1.0"?>
+<!DOCTYPE doc>
+<doc xmlns:x="http://example.org/x" a="1" x:b="2">
+    <!-- note -->
+    <x:item id="1">one<![CDATA[ <two> ]]><x:sub x:id="s">three</x:sub></x:item>
+    <item id="2"><item id="3">four<b/>five</item>tail<?pi data?></item>
+    <other id="4"><x:item/>six</other>
+</doc>
+"""
+
+    def setUp(self):
+        self.doc = xml.dom.minidom.parseString(self.xml)
+        self.frozen = xpath.FrozenDocument(self.doc)
+
+    def test_arrays(self):
+        frozen = self.frozen
+        nodes = xpath.find('/ | //node() | //@*', self.doc)
+        self.assertEqual(frozen.nodes, nodes)
+        self.assertEqual(frozen.size, len(nodes))
+        for i, node in enumerate(nodes):
+            self.assertEqual(xpath.expr.document_order(node), i)
+            self.assertEqual(frozen.kind[i], node.nodeType)
+            if node.nodeType == node.ATTRIBUTE_NODE:
+                self.assertEqual(nodes[frozen.parent[i]], node.ownerElement)
+                continue
+            for array, related in ((frozen.parent, node.parentNode),
+                                   (frozen.first_child, node.firstChild),
+                                   (frozen.next_sibling, node.nextSibling)):
+                if related is None:
+                    self.assertEqual(array[i], -1)
+                else:
+                    self.assertEqual(nodes[array[i]], related)
+            if node.nodeType == node.ELEMENT_NODE:
+                self.assertEqual(
+                    frozen.expanded_names[frozen.name[i]],
+                    (node.namespaceURI, node.localName))
+                attrs = nodes[i + 1:frozen.attributes_end[i]]
+                self.assertEqual(attrs, xpath.find('@*', node))
+            descendants = xpath.find('descendant::node()', node)
+            if descendants:
+                self.assertLess(nodes.index(descendants[-1]), frozen.end[i])
+            self.assertEqual(
+                frozen.text[frozen.text_start[i]:
+                            frozen.text_start[frozen.end[i]]],
+                xpath.expr.string_value(node)
+                if node.nodeType in (node.ELEMENT_NODE, node.DOCUMENT_NODE,
+                                     node.TEXT_NODE, node.CDATA_SECTION_NODE)
+                else '')
+
+    def test_matches_dom(self):
+        context = xpath.XPathContext(self.doc)
+        nodes = xpath.find('/ | //node() | //@*', self.doc)
+        for axis in ['child', 'descendant', 'descendant-or-self', 'self',
+                     'attribute', 'parent', 'ancestor', 'ancestor-or-self',
+                     'following', 'preceding', 'following-sibling',
+                     'preceding-sibling']:
+            for test in ['node()', '*', 'item', 'x:item', 'x:*', '*:item',
+                         'id', 'x:id', 'text()', 'comment()',
+                         'processing-instruction()',
+                         "processing-instruction('pi')"]:
+                for expr in ['%s::%s', '%s::%s[1]', '%s::%s[last()]',
+                             'count(%s::%s)', 'string(%s::%s[2])']:
+                    expr = xpath.XPath(expr % (axis, test))
+                    for node in nodes:
+                        self.assertEqual(
+                            self.frozen.find(expr, node, context),
+                            expr.find(node, context), (str(expr), node))
+
+    def test_paths(self):
+        for expr in ['//item', '//x:item//text()', '//*[contains(., "four")]',
+                     '//item[. = "fourfivetail"]/@id', 'string(/)',
+                     'string(//x:item)', '//@*', '//comment()',
+                     '(//node())[last()]/preceding::node()',
+                     '//item/following::node()', 'sum(//@id)']:
+            self.assertEqual(self.frozen.find(expr),
+                             xpath.find(expr, self.doc), expr)
+        self.assertEqual(self.frozen.findnode('//x:sub/text()').data,
+                         'three')
+        self.assertEqual(self.frozen.findvalue('//item'), 'fourfivetail')
+        self.assertEqual(self.frozen.findvalues('//@id'),
+                         ['1', '2', '3', '4'])
+
+    def test_unknown_prefix(self):
+        self.assertRaises(xpath.XPathUnknownPrefixError,
+                          self.frozen.find, '//y:item')
+
+    def test_other_document(self):
+        other = xml.dom.minidom.parseString('<doc><item id="9"/></doc>')
+        self.assertEqual(
+            self.frozen.findvalues('//@id', other), ['9'])
+
+    def test_index(self):
+        # The frozen copy is the index of the document in its own queries.
+        with xpath.expr._document_indexes.scope():
+            self.frozen.find('/')
+            self.assertIs(xpath.expr.document_index(self.doc), self.frozen)
+        self.assertIsNot(xpath.expr.document_index(self.doc), self.frozen)
+        self.assertEqual(self.frozen.findvalues('//@id'),
+                         ['1', '2', '3', '4'])
+
+    def test_interpreted(self):
+        expr = xpath.XPath('//item[. = "six"] | //other[. = "six"]',
+                           compiled=False)
+        self.assertEqual(self.frozen.find(expr),
+                         xpath.find('//other', self.doc))
+
+
+if __name__ == '__main__':
+    unittest.main()
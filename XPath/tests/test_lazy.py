@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+import unittest
+import xml.dom.minidom
+import xpath
+import xpath.expr
+
+class TestLazyEvaluation(unittest.TestCase):
+    """Early-terminating evaluation of findnode() and boolean contexts."""
+
+    xml = """
+<doc>
+    <item id="1"><name>argument</name></item>
+    <item id="2"><name>lumberjack</name><item id="2.1"/></item>
+    <item id="3"><note/></item>
+    <other id="4"><item id="4.1"/></other>
+</doc>
+"""
+
+    def setUp(self):
+        self.doc = xml.dom.minidom.parseString(self.xml)
+
+    def test_findnode_matches_find(self):
+        for expr in ['//item', '//item[name]', '/doc/item[note]',
+                     '//item/@id', '//item//item', '/doc/*/item',
+                     '//item[2]', '//name/ancestor::item', '//nothing',
+                     '//item[position() = last()]', '(//item)[3]']:
+            result = xpath.find(expr, self.doc)
+            expected = result[0] if result else None
+            self.assertEqual(xpath.findnode(expr, self.doc), expected, expr)
+
+    def test_findnode_stops_at_first_node(self):
+        # The predicate raises an error for every item but the first.
+        expr = '//item[@id = 1 or $undefined]'
+        self.assertEqual(xpath.findnode(expr, self.doc).getAttribute('id'),
+                         '1')
+        self.assertEqual(xpath.findvalue(expr, self.doc), 'argument')
+        self.assertRaises(xpath.XPathUnknownVariableError,
+                          xpath.find, expr, self.doc)
+
+    def test_boolean_stops_at_first_node(self):
+        expr = 'boolean(//item[@id = 1 or $undefined])'
+        self.assertEqual(xpath.find(expr, self.doc), True)
+        expr = 'not(//item[@id = 1 or $undefined])'
+        self.assertEqual(xpath.find(expr, self.doc), False)
+
+    def test_existence_predicate(self):
+        result = xpath.find('//item[item or note]/@id', self.doc)
+        self.assertEqual([x.value for x in result], ['2', '3'])
+
+    def test_findnode_type_error(self):
+        self.assertRaises(xpath.XPathTypeError,
+                          xpath.findnode, 'count(//item)', self.doc)
+
+class TestIterators(unittest.TestCase):
+    """iterfind() and iterfindvalues()."""
+
+    xml = TestLazyEvaluation.xml
+
+    exprs = ['//item', '//item[name]', '/doc/item[note]', '//item/@id',
+             '//item//item', '/doc/*/item', '//item[2]', '//name/ancestor::item',
+             '//nothing', '//item[position() = last()]', '(//item)[3]',
+             '//item[@id = $n] | //other', '//item[string(.) = "argument"]',
+             '//*/item', '//*/*/@id', 'descendant-or-self::*/*[1]']
+
+    def setUp(self):
+        self.doc = xml.dom.minidom.parseString(self.xml)
+
+    def test_iterfind_matches_find(self):
+        for expr in self.exprs:
+            for compiled in (True, False):
+                x = xpath.XPath(expr, compiled)
+                self.assertEqual(list(x.iterfind(self.doc, n=2)),
+                                 x.find(self.doc, n=2), expr)
+                self.assertEqual(list(x.iterfindvalues(self.doc, n=2)),
+                                 x.findvalues(self.doc, n=2), expr)
+            self.assertEqual(list(xpath.iterfind(expr, self.doc, n=2)),
+                             xpath.find(expr, self.doc, n=2), expr)
+
+    def test_iterfind_is_lazy(self):
+        # The predicate raises an error for every item but the first.
+        for compiled in (True, False):
+            x = xpath.XPath('//item[@id = 1 or $undefined]', compiled)
+            for results in (x.iterfind(self.doc),
+                            x.iterfindvalues(self.doc, memoize=True)):
+                self.assertTrue(next(results))
+                self.assertRaises(xpath.XPathUnknownVariableError,
+                                  next, results)
+
+    def test_nested_children_are_lazy(self):
+        # Children of nested nodes are merged into document order as the
+        # nodes are found, rather than after finding them all.
+        x = xpath.XPath('//*/*[@id = 1 or @id = 2.1 or $undefined]')
+        results = x.iterfind(self.doc)
+        self.assertEqual(next(results).getAttribute('id'), '1')
+        self.assertRaises(xpath.XPathUnknownVariableError, next, results)
+
+    def test_memo_scope(self):
+        # The memo is only installed while the iterator runs.
+        results = xpath.iterfindvalues('//item[. = "argument" or @id > 2]',
+                                       self.doc, memoize=True)
+        self.assertEqual(next(results), 'argument')
+        self.assertIsNone(getattr(xpath.expr._memo, 'strings', None))
+        self.assertEqual(list(results), ['', '', ''])
+
+    def test_type_error(self):
+        self.assertRaises(xpath.XPathTypeError,
+                          xpath.iterfind, 'count(//item)', self.doc)
+        self.assertRaises(xpath.XPathTypeError,
+                          xpath.iterfindvalues, '"a"', self.doc)
+
+    def test_context_and_frozen(self):
+        context = xpath.XPathContext(n=1)
+        frozen = xpath.FrozenDocument(self.doc)
+        for expr in self.exprs:
+            expected = xpath.findvalues(expr, self.doc, n=1)
+            self.assertEqual(
+                list(context.iterfindvalues(expr, self.doc)), expected, expr)
+            self.assertEqual(
+                list(frozen.iterfindvalues(expr, context=context)), expected,
+                expr)
+            self.assertEqual(list(frozen.iterfind(expr, n=1)),
+                             xpath.find(expr, self.doc, n=1), expr)
+        xpath.invalidate(self.doc)
+
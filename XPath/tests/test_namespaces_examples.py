@@ -30,3 +30,55 @@ class TestNamespaceExamples(unittest.TestCase):
     def test_namespace_axis_not_implemented(self):
         with self.assertRaises(xpath.XPathNotImplementedError):
             xpath.find('//book/namespace::*', self.doc)
+
+
+class TestNamespaceBinding(unittest.TestCase):
+    """Expressions bound to namespace declarations ahead of evaluation."""
+
+    namespaces = {'b': 'http://example.com/book'}
+
+    @classmethod
+    def setUpClass(cls):
+        data_dir = os.path.join(os.path.dirname(__file__), 'w3c_data')
+        cls.doc = xml.dom.minidom.parse(os.path.join(data_dir, 'ns_books.xml'))
+
+    def test_bound_prefix(self):
+        for compiled in (True, False):
+            expr = xpath.XPath('//b:book/b:title', compiled,
+                               namespaces=self.namespaces)
+            self.assertEqual(expr.findvalues(self.doc),
+                             ['Book One', 'Book Two'])
+            # The declarations of the context are ignored.
+            self.assertEqual(
+                expr.findvalues(self.doc, namespaces={'b': 'http://other/'}),
+                ['Book One', 'Book Two'])
+
+    def test_bound_default_namespace(self):
+        expr = xpath.XPath('count(//book/@category)',
+                           default_namespace='http://example.com/book')
+        self.assertEqual(expr.find(self.doc, default_namespace='x'), 2)
+        # Unprefixed names are in no namespace unless one is given.
+        expr = xpath.XPath('count(//book)', namespaces={})
+        self.assertEqual(expr.find(self.doc), 0)
+
+    def test_bind_context(self):
+        context = xpath.XPathContext(self.doc)
+        expr = xpath.XPath('//bk:title[@lang = "en"]').bind(context)
+        self.assertEqual(expr.findvalues(self.doc, xpath.XPathContext()),
+                         ['Book One', 'Book Two'])
+        self.assertEqual(str(expr),
+                         '/descendant::bk:title[(attribute::lang = \'en\')]')
+
+    def test_bound_variable(self):
+        expr = xpath.XPath('//b:price[. > $b:min]', namespaces=self.namespaces)
+        variables = {('http://example.com/book', 'min'): 15}
+        self.assertEqual(expr.findvalues(self.doc, variables=variables),
+                         ['20'])
+        with self.assertRaises(xpath.XPathUnknownVariableError):
+            expr.find(self.doc)
+
+    def test_unknown_prefix_at_bind_time(self):
+        with self.assertRaises(xpath.XPathUnknownPrefixError):
+            xpath.XPath('//book | //un:book', namespaces=self.namespaces)
+        with self.assertRaises(xpath.XPathUnknownPrefixError):
+            xpath.XPath('1 + $un:x').bind(xpath.XPathContext())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+import unittest
+import xml.dom.minidom
+import xpath
+import xpath.expr
+
+class TestNodesetSteps(unittest.TestCase):
+    """Steps evaluated for a whole node-set of context nodes at once."""
+
+    xml = """
+<doc>
+    <s id="1"><s id="2"><t id="3"/><s id="4"><t id="5"/></s></s><t id="6"/></s>
+    <s id="7"><t id="8"/><t id="9"/><u id="10"/></s>
+    <u id="11"><s id="12"><t id="13"/></s></u>
+</doc>
+"""
+
+    def setUp(self):
+        self.doc = xml.dom.minidom.parseString(self.xml)
+
+    def ids(self, expr, **kwargs):
+        return [n.getAttribute('id')
+                for n in xpath.find(expr, self.doc, **kwargs)]
+
+    def per_node(self, expr):
+        # The same expression, with every step evaluated node by node.
+        evaluate_nodeset = xpath.expr.evaluate_nodeset
+        xpath.expr.evaluate_nodeset = lambda *args: None
+        try:
+            return xpath.find(expr, self.doc)
+        finally:
+            xpath.expr.evaluate_nodeset = evaluate_nodeset
+
+    def test_nested_descendants(self):
+        self.assertEqual(self.ids('//s/descendant::t'),
+                         ['3', '5', '6', '8', '9', '13'])
+        self.assertEqual(self.ids('//s//s'), ['2', '4'])
+        self.assertEqual(self.ids('//s/descendant-or-self::s'),
+                         ['1', '2', '4', '7', '12'])
+
+    def test_nested_children(self):
+        self.assertEqual(self.ids('//s/*'),
+                         ['2', '3', '4', '5', '6', '8', '9', '10', '13'])
+
+    def test_following_preceding(self):
+        self.assertEqual(self.ids('//t/following::*'),
+                         ['4', '5', '6', '7', '8', '9', '10', '11', '12', '13'])
+        self.assertEqual(self.ids('//t/preceding::*'),
+                         ['1', '2', '3', '4', '5', '6', '7', '8', '9', '10'])
+
+    def test_siblings(self):
+        self.assertEqual(self.ids('//t/following-sibling::*'),
+                         ['4', '9', '10'])
+        self.assertEqual(self.ids('//t/preceding-sibling::*'),
+                         ['2', '8'])
+
+    def test_parents(self):
+        self.assertEqual(self.ids('//t/..'), ['1', '2', '4', '7', '12'])
+        self.assertEqual(self.ids('//t/ancestor::*[@id]'),
+                         ['1', '2', '4', '7', '11', '12'])
+
+    def test_positional_predicates(self):
+        for expr in ['//t/following::*[1]', '//s/descendant::t[last()]',
+                     '//t/preceding-sibling::*[1]', '//s//t[2]',
+                     '//t/following-sibling::*[position() > 1]',
+                     '//t/ancestor::*[2]', '//s/*[1]']:
+            self.assertEqual(xpath.find(expr, self.doc), self.per_node(expr),
+                             expr)
+
+    def test_matches_per_node(self):
+        for axis in ['child', 'descendant', 'descendant-or-self', 'self',
+                     'attribute', 'parent', 'ancestor', 'ancestor-or-self',
+                     'following', 'preceding', 'following-sibling',
+                     'preceding-sibling']:
+            for expr in ['//*/%s::*', '//s/%s::t[@id > 4]', '//@id/%s::*',
+                         '(//t | //s)/%s::node()']:
+                expr = expr % axis
+                for index in (False, True):
+                    self.assertEqual(xpath.find(expr, self.doc, index=index),
+                                     self.per_node(expr), expr)
+
+
+    def test_regions(self):
+        index = xpath.expr.document_index(self.doc)
+        index.regions()
+        nodes = xpath.find('/ | //node() | //@*', self.doc)
+        self.assertEqual(index.nodes, nodes)
+        for rank, node in enumerate(nodes):
+            depth = len(xpath.find('ancestor::node()', node))
+            if node.nodeType == node.ATTRIBUTE_NODE:
+                depth = len(xpath.find('ancestor::node()', node.ownerElement)) + 1
+            self.assertEqual(index.level[rank], depth)
+            inside = xpath.find('descendant::node() | descendant::*/@*', node)
+            if node.nodeType == node.ATTRIBUTE_NODE:
+                inside = []
+            elif node.nodeType == node.ELEMENT_NODE:
+                inside = xpath.find('@*', node) + inside
+            self.assertEqual(
+                nodes[rank + 1:index.post[rank] + index.level[rank] + 1],
+                inside)
+
+    def test_joins(self):
+        # The joins are only made over an index.
+        for index in (False, True):
+            ids = lambda expr: self.ids(expr, index=index)
+            self.assertEqual(ids('//t/ancestor::s'), ['1', '2', '4', '7', '12'])
+            self.assertEqual(ids('//t/ancestor-or-self::*[@id < 4]'),
+                             ['1', '2', '3'])
+            self.assertEqual(
+                [n.nodeName for n in xpath.find(
+                    '//@id/ancestor-or-self::node()', self.doc,
+                    index=index)][:3],
+                ['id', 'id', 'id'])
+            self.assertEqual(ids('//s/descendant::node()[@id > 8]'),
+                             ['9', '10', '13'])
+            self.assertEqual(ids('//s/following::*[self::u]'), ['10', '11'])
+            self.assertEqual(ids('//t/preceding::s'), ['1', '2', '4', '7'])
+
+    def test_added_nodes(self):
+        xpath.find('//t/ancestor::s', self.doc, index=True)
+        s7 = xpath.findnode('//s[@id = 7]', self.doc)
+        t = self.doc.createElement('t')
+        t.setAttribute('id', '14')
+        s7.appendChild(t)
+        self.assertEqual(
+            self.ids('//s[@id = 7]/descendant-or-self::t', index=True),
+            ['8', '9', '14'])
+
+
+if __name__ == '__main__':
+    unittest.main()
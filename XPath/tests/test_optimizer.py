@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+import unittest
+import xml.dom.minidom
+import xpath
+import xpath.expr
+import xpath.optimizer
+
+class TestOptimizer(unittest.TestCase):
+    """Optimized expressions agree with the trees they were derived from."""
+
+    xml = """
+<doc>
+    <item id="1" price="12">argument</item>
+    <item id="2" price="40">lumberjack<item id="2.1"/></item>
+    <item id="3" sale="yes">spam</item>
+</doc>
+"""
+
+    folded = [
+        ('1 + 2 * 3', '7'),
+        ('4 + -5', '(-1)'),
+        ('-(-1)', '1'),
+        ("concat('a', 'b', 1 div 2)", "'ab0.5'"),
+        ('not(true())', 'false()'),
+        ('not(not(item))', 'boolean(child::item)'),
+        ('item and true()', 'boolean(child::item)'),
+        ('1 = 2 or item', 'boolean(child::item)'),
+        ('0 and $x', 'false()'),
+        ('"a" or $x', 'true()'),
+        ('boolean(1 < 2)', 'true()'),
+        ('item[1 = 1]', 'child::item'),
+        ('item[@price > 10 * 2 and true()]',
+         'child::item[(attribute::price > 20)]'),
+        ('item[position() = 1 + 1]', 'child::item[(position() = 2)]'),
+        ('//item', '/descendant::item'),
+        ('a//b[@id]/c', 'child::a/descendant::b[attribute::id]/child::c'),
+        ('//item[1]', '/descendant-or-self::node()/child::item[1]'),
+        ('//@id', '/descendant-or-self::node()/attribute::id'),
+    ]
+
+    unfolded = [
+        '0 mod 0', '1 div 0', 'count(1)', 'string-length()',
+        'position() = 1', "concat('\"', \"'\")", '$x + 1', 'item[2]',
+        'item[false()]', 'lang("en")',
+    ]
+
+    exprs = [
+        '//item[@price > 10 * 2 and true()]', '//item[not(not(@sale))]',
+        '//item[position() = 1 + 1]', 'count(//item[1 = 1][@id > 1 - 1])',
+        '//item[string(.) = concat("spa", "m")]', '-(-(//item/@price))',
+        '//item[. = "spam" or false()]', '//item[0 div 0 = 0 div 0]',
+        '//item[1 div 0 > 5]', 'number("1" or 0) + -(2 - 5)',
+        'string-length("abc")', 'floor(-1.5)', '//item[1]/@id',
+        '//item[last()]', '//item[position() > 1]', '//node()[2]',
+        'count(//item[not(@sale)][2])', '//item//text()[1]', '//item[$n]',
+    ]
+
+    def setUp(self):
+        self.doc = xml.dom.minidom.parseString(self.xml)
+
+    def test_folded(self):
+        for expr, expected in self.folded:
+            self.assertEqual(str(xpath.XPath(expr)), expected, expr)
+
+    def test_unfolded(self):
+        for expr in self.unfolded:
+            self.assertEqual(str(xpath.XPath(expr)),
+                             str(xpath.XPath(expr, optimized=False)), expr)
+
+    def test_reparse(self):
+        for expr, _ in self.folded:
+            s = str(xpath.XPath(expr))
+            self.assertEqual(str(xpath.XPath(s)), s, expr)
+
+    def test_find(self):
+        for expr in self.exprs:
+            expected = xpath.XPath(expr, optimized=False).find(self.doc, n=1)
+            for compiled in (True, False):
+                result = xpath.XPath(expr, compiled).find(self.doc, n=1)
+                self.assertEqual(result, expected, expr)
+                self.assertEqual(type(result), type(expected), expr)
+
+    def test_grouped(self):
+        step = xpath.XPath('//item[1]').expr.path.steps[0]
+        self.assertIsInstance(step, xpath.expr.GroupedStep)
+        for expr, expected in (
+                ('//item[1]/@id', ['1', '2.1']),
+                ('//item[last()]/@id', ['2.1', '3']),
+                ('descendant-or-self::node()/child::item[1]/@id', ['1', '2.1'])):
+            for compiled in (True, False):
+                self.assertEqual(
+                    xpath.XPath(expr, compiled).findvalues(self.doc),
+                    expected, expr)
+
+    def test_dependencies(self):
+        X = xpath.expr
+        cases = [
+            ('1 + 2', set()),
+            ('$x', {X.VARIABLES}),
+            ('/doc/item[@id = $x]', {X.DOCUMENT, X.VARIABLES}),
+            ('item[position() = last()]', {X.CONTEXT_NODE}),
+            ('position() = last()', {X.CONTEXT_POSITION, X.CONTEXT_SIZE}),
+            ('string-length()', {X.CONTEXT_NODE}),
+            ('concat($x, id("a"))', {X.VARIABLES, X.DOCUMENT}),
+            ('($x)[. = 1]/@id', {X.VARIABLES}),
+        ]
+        for expr, expected in cases:
+            parsed = xpath.XPath(expr, optimized=False).expr
+            self.assertEqual(X.dependencies(parsed), expected, expr)
+
+    def test_invariants(self):
+        expr = xpath.XPath('//item[@price = /doc/item[1]/@price + $n]')
+        self.assertIsInstance(expr.expr, xpath.expr.InvariantScope)
+        self.assertEqual(str(expr),
+                         '/descendant::item[(attribute::price = '
+                         '(/child::doc/child::item[1]/attribute::price + $n))]')
+        for expr in ('//item', '//item[@price > 10]', 'count(/doc/item)'):
+            self.assertNotIsInstance(xpath.XPath(expr).expr,
+                                     xpath.expr.InvariantScope, expr)
+
+    def test_invariant_values(self):
+        # Invariant values are kept for one evaluation only, and for each
+        # document separately.
+        expr = xpath.XPath('$items[@id = /doc/item[last()]/@id]/@price')
+        for compiled in (True, False):
+            expr = xpath.XPath(str(expr), compiled)
+            items = xpath.find('//item', self.doc)
+            self.assertEqual(expr.find(self.doc, items=items), [])
+            other = xml.dom.minidom.parseString(
+                '<doc><item id="3" price="5"/></doc>')
+            items += xpath.find('//item', other)
+            result = expr.find(self.doc, items=items)
+            self.assertEqual([n.value for n in result], ['5'])
+            context = xpath.XPathContext(self.doc, items=items[:1])
+            self.assertEqual(expr.find(self.doc, context), [])
+            context.variables['items'] = items
+            self.assertEqual(len(expr.find(self.doc, context)), 1)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, xpath.find, '0 mod 0', self.doc)
+        self.assertRaises(xpath.XPathTypeError, xpath.find, 'count(1)',
+                          self.doc)
+        self.assertRaises(xpath.XPathUnknownVariableError, xpath.find,
+                          '$x and true()', self.doc)
+
+    def test_flag(self):
+        self.assertTrue(xpath.XPath('1').optimized)
+        self.assertFalse(xpath.XPath('1', optimized=False).optimized)
+        parsed = xpath.XPath('1 + 1', optimized=False).expr
+        self.assertEqual(str(xpath.optimizer.optimize(parsed)), '2')
+        self.assertEqual(str(parsed), '(1 + 1)')
+
+if __name__ == '__main__':
+    unittest.main()
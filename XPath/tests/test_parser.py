@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+import random
+import unittest
+import xpath
+import xpath.parser
+import xpath.rdparser
+from yapps import runtime
+
+def dump(expr):
+    """Return a comparable form of an expression tree."""
+    if isinstance(expr, (list, tuple)):
+        return [dump(x) for x in expr]
+    if type(expr).__module__ == 'xpath.expr' and hasattr(expr, '__dict__'):
+        return (type(expr).__name__,
+                sorted((k, dump(v)) for k, v in vars(expr).items()
+                       if not k.startswith('_') and not callable(v)
+                       and k != 'selectors'))
+    return expr
+
+def reference(s):
+    try:
+        parser = xpath.parser.XPath(xpath.parser.XPathScanner(s))
+        return dump(parser.XPath())
+    except runtime.SyntaxError:
+        return xpath.XPathParseError
+    except xpath.XPathError as e:
+        return type(e)
+
+def parse(s):
+    try:
+        return dump(xpath.rdparser.parse(s))
+    except xpath.XPathError as e:
+        return type(e)
+
+class TestParser(unittest.TestCase):
+    """The hand-written parser accepts the language of parser.g."""
+
+    exprs = [
+        '//item[@price > 10 and @price < 50]/name', '/', '/ | /a', '/*',
+        '/ * 2', '/and', '/andx', '/or', '/div', '/mod', '/ - 1', '/.5',
+        '1 andy', 'a order', 'x divy', '1div 2', 'and and and',
+        'div div div', 'child', '//child', 'child::child', 'children',
+        '@child', '$child', 'child (1)', 'node', 'node()', 'node ()',
+        'nodes()', '//text', 'text ( )', 'comment()', '@node()',
+        'processing-instruction()', 'processing-instruction("p")',
+        'processing-instruction(p)', 'processing-instruction(p())',
+        'a-', 'a-(1)', '@x-(1)', '$x-(1)', '$x-1', 'x-y', 'a.b', '_a',
+        'count (a)', 'count(a)', 'f(,)', 'f()', 'concat(1, 2, 3)',
+        'a:b', 'a : b', 'a:*', '*:b', '*:*', 'a::b', 'a:b(', 'x:foo()',
+        '$a:b', '$a::b', '$ a', '$node()', '.5', '5.', '1e3', '1.5E-2',
+        '..', '..[1]', '.[1]', '. 5', '..5', '-1', '--1', '1--1', '- -1',
+        '-a|b', '1 = 2 = 3', '1 < 2 = 3 > 4', '1 + 2 * 3 - 4 div 5 mod 6',
+        'a | b | c', '(a)[1]/b', '(1)', '()', '"a"', "'b'", '"unterminated',
+        'a[1][2]', 'a[]', 'a[1', '@*', '@', '!', '!=', 'a != b', '#',
+        'namespace::x', 'namespace::x[', 'unknown()', 'unknown(', 'é',
+        'aé', 'éa', ' a ', '\na\n', 'a\n', '1 e5', 'ancestor-or-self::*',
+        'preceding-sibling::a[last()]', 'a//b/c', 'a///b', '/ /a', '// a',
+    ]
+
+    def test_examples(self):
+        for expr in self.exprs:
+            self.assertEqual(parse(expr), reference(expr), repr(expr))
+
+    def test_random(self):
+        atoms = ['a', 'b:c', '*', 'and', 'or', 'div', 'mod', 'andy',
+                 'child', 'self', 'parent', 'node', 'text', 'comment',
+                 'a-', 'x.y', '1', '.5', '5.', '"s"', "'t'", '$v', '.',
+                 '..', '@', 'count', 'last', 'f', '(', ')', '[', ']', ',',
+                 '/', '//', '|', '+', '-', '=', '!=', '<', '>=', '::', ':',
+                 '!']
+        rng = random.Random(0)
+        for _ in range(3000):
+            expr = ''.join(rng.choice(atoms) + rng.choice(['', ' '])
+                           for _ in range(rng.randint(1, 8)))
+            self.assertEqual(parse(expr), reference(expr), repr(expr))
+
+    def test_error_position(self):
+        try:
+            xpath.XPath('//item[@id = ]')
+        except xpath.XPathParseError as e:
+            self.assertEqual(e.pos, 13)
+            self.assertEqual(str(e).splitlines()[-1], '-' * 13 + '^')
+        else:
+            self.fail('no exception raised')
+
+if __name__ == '__main__':
+    unittest.main()
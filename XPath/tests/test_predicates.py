@@ -87,3 +87,30 @@ class TestPredicates(unittest.TestCase):
         self.assertEqual([x.getAttribute("id") for x in result],
                              ["2"])
 
+
+    def test_last_reverse_axis(self):
+        result = xpath.find('//item[@id="3"]/ancestor::*[last()]', self.doc)
+        self.assertEqual([x.getAttribute("id") for x in result],
+                             ["0"])
+
+    def test_position_equality(self):
+        result = xpath.find('//group/item[position() = 2]', self.doc)
+        self.assertEqual([x.getAttribute("id") for x in result],
+                             ["4"])
+
+    def test_non_integer_position(self):
+        result = xpath.find('//item[1.5]', self.doc)
+        self.assertEqual(result, [])
+        result = xpath.find('//item[0]', self.doc)
+        self.assertEqual(result, [])
+
+    def test_position_after_filter(self):
+        result = xpath.find('//group/item[@id > 2][2]', self.doc)
+        self.assertEqual([x.getAttribute("id") for x in result],
+                             ["5"])
+
+    def test_position_of_position(self):
+        result = xpath.find('/doc/descendant::item[position() > 1][1]',
+                            self.doc)
+        self.assertEqual([x.getAttribute("id") for x in result],
+                             ["2"])
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+import unittest
+import xml.dom.minidom
+import xpath
+
+class TestQuerySet(unittest.TestCase):
+    """Many expressions evaluated in one traversal."""
+
+    xml = """<?xml version="1.0"?>
+<feed xmlns:x="http://x.example.org/">
+    <entry id="1" kind="a"><title>one</title><x:link href="h1"/></entry>
+    <entry id="2" kind="b">
+        <title>two</title>
+        <entry id="2.1" kind="a"><title>nested two</title></entry>
+    </entry>
+    <entry id="3" kind="a" x:lang="en"><title>three</title></entry>
+    <other><entry id="4"><title>four</title></entry></other>
+</feed>
+"""
+
+    namespaces = {'x': 'http://x.example.org/'}
+
+    exprs = [
+        '/feed/entry', '//entry', '//entry/title', 'feed/entry[2]/entry',
+        '//entry[1]', '//entry[@kind = "a"]/title', '/descendant::entry[3]',
+        '//entry[@id > 1][2]', '//entry/@id', '//entry/@*[1]', '//@x:lang',
+        '//x:link/@href', '//entry[@x:lang]', '//entry[not(@kind)]',
+        '//*[local-name() = "link"]', '//entry[position() > 1]/title',
+        '//entry/descendant-or-self::entry[@kind = $kind]/@id',
+        '//entry/self::entry[1]/title', '/feed/*/entry', '//node()/title',
+        '//entry[@id = 2]//title', '//entry/@kind[. = "b"]',
+        # Not streamable.
+        '//entry[last()]', '//entry[title = "two"]', 'count(//entry)',
+        '//title/text()', '//entry/..',
+    ]
+
+    def setUp(self):
+        self.doc = xml.dom.minidom.parseString(self.xml)
+
+    def expected(self, node):
+        return [xpath.find(expr, node, namespaces=self.namespaces, kind='a')
+                for expr in self.exprs]
+
+    def test_document(self):
+        queries = xpath.QuerySet(self.exprs, namespaces=self.namespaces)
+        self.assertEqual(queries.find(self.doc, kind='a'),
+                         self.expected(self.doc))
+
+    def test_element(self):
+        # Relative paths which do not go down from the context element are
+        # evaluated on their own.
+        self.exprs = self.exprs + ['entry', './/title', 'title', '*/entry',
+                                   'self::entry/title', '@id', '../entry']
+        queries = xpath.QuerySet(self.exprs, namespaces=self.namespaces)
+        for node in xpath.find('//entry | /feed', self.doc):
+            self.assertEqual(queries.find(node, kind='a'),
+                             self.expected(node))
+
+    def test_trie(self):
+        # Location paths which are not streamed share their steps.
+        self.exprs = self.exprs + ['entry', './/title', 'title', '*/entry',
+                                   '/feed/entry/title', '/feed/entry/x:link',
+                                   '/feed/entry/entry', '/feed/entry/*',
+                                   '/feed/entry/entry/title', '/']
+        queries = xpath.QuerySet(self.exprs, namespaces=self.namespaces,
+                                 stream=False)
+        self.assertEqual(len(queries.streamed), 0)
+        for node in xpath.find('/ | //entry | /feed', self.doc):
+            self.assertEqual(queries.find(node, kind='a'),
+                             self.expected(node))
+
+    def test_shared_children(self):
+        # Children selected by name for several paths at once, from nodes
+        # nested in each other, along with steps evaluated on their own.
+        doc = xml.dom.minidom.parseString(
+            '<d><s><c id="1"/><s><a id="2"/><c id="3"/></s><a id="4"/></s>'
+            '<s><b id="5"/></s></d>')
+        exprs = ['//s/a', '//s/c', '//s/b', '//s/a[2]', '//s/*[@id > 3]',
+                 '//s/c/@id', '/d/s/a', '/d/s/b', '/d/s[2]/b', '/d/*/c']
+        queries = xpath.QuerySet(exprs, stream=False)
+        self.assertEqual(queries.find(doc),
+                         [xpath.find(expr, doc) for expr in exprs])
+        self.assertEqual([n.getAttribute('id') for n in queries.find(doc)[0]],
+                         ['2', '4'])
+
+    def test_attribute_values(self):
+        # Steps looked up by the value of an attribute compared with a
+        # literal, with positions counted among the nodes it selects.
+        doc = xml.dom.minidom.parseString(
+            '<d><e a="x" b="x"/><e a="1" b="x"/><e a="01" b="y"/>'
+            '<e a="1"><e a="1" b="x"/></e></d>')
+        exprs = ['//e[@a = 1]', '//e[@a = "1"]', '//e["x" = @a]',
+                 '//e[@a = 1][2]', '//e[@a = "1"][@b = "x"][1]',
+                 '//e[@* = "x"][2]', '//e[@a = 1]/e[@a = 1]', '//e[@a = 2]',
+                 '/d/e[@b = "x"][2]', '//e[@a = $a]', '//e[@b != "x"]']
+        queries = xpath.QuerySet(exprs)
+        self.assertEqual(len(queries.streamed), len(exprs))
+        self.assertEqual(queries.find(doc, a='x'),
+                         [xpath.find(expr, doc, a='x') for expr in exprs])
+
+    def test_dict(self):
+        queries = xpath.QuerySet({'titles': '//title', 'ids': '//entry/@id',
+                                  'count': 'count(//entry)'})
+        results = queries.find(self.doc)
+        self.assertEqual(sorted(results), ['count', 'ids', 'titles'])
+        self.assertEqual([xpath.expr.string_value(n)
+                          for n in results['titles']],
+                         ['one', 'two', 'nested two', 'three', 'four'])
+        self.assertEqual([a.value for a in results['ids']],
+                         ['1', '2', '2.1', '3', '4'])
+        self.assertEqual(results['count'], 5)
+
+    def test_context(self):
+        queries = xpath.QuerySet(['//entry[@kind = $kind]/@id'])
+        context = xpath.XPathContext(kind='b')
+        [ids] = queries.find(self.doc, context)
+        self.assertEqual([a.value for a in ids], ['2'])
+        [ids] = queries.find(self.doc, context, kind='a')
+        self.assertEqual([a.value for a in ids], ['1', '2.1', '3'])
+
+    def test_errors(self):
+        self.assertRaises(xpath.XPathParseError, xpath.QuerySet,
+                          ['//entry', 'title['])
+        self.assertRaises(xpath.XPathUnknownPrefixError, xpath.QuerySet,
+                          ['//y:entry'])
+        queries = xpath.QuerySet(['//entry', 'string(.)/title'])
+        self.assertRaises(xpath.XPathTypeError, queries.find, self.doc)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+import io
+import os
+import tempfile
+import unittest
+import xml.dom.minidom
+import xml.sax
+import xml.sax.handler
+import xpath
+
+class TestStreamingXPath(unittest.TestCase):
+    """Location paths evaluated over parser events."""
+
+    xml = """<?xml version="1.0"?>
+<feed xmlns:x="http://x.example.org/">
+    <entry id="1" kind="a"><title>one</title><x:link href="h1"/></entry>
+    <entry id="2" kind="b">
+        <title>two</title>
+        <entry id="2.1" kind="a"><title>nested <!-- c --> two</title></entry>
+    </entry>
+    <entry id="3" kind="a" x:lang="en"><title><![CDATA[<three>]]></title></entry>
+    <other><entry id="4"><title>four</title></entry></other>
+</feed>
+"""
+
+    namespaces = {'x': 'http://x.example.org/'}
+
+    exprs = [
+        '/feed/entry', '//entry', '//entry/title', 'feed/entry[2]/entry',
+        '//entry[1]', '//entry[@kind = "a"]/title', '/descendant::entry[3]',
+        '//entry[@id > 1][2]', '//entry/@id', '//entry/@*[1]', '//@x:lang',
+        '//x:link/@href', '//entry[@x:lang]', '//entry[not(@kind)]',
+        '//*[local-name() = "link"]', '//entry[position() > 1]/title',
+        '//entry/descendant-or-self::entry[@kind = $kind]/@id',
+        '//entry/self::entry[1]/title', '/feed/*/entry', '//node()/title',
+        '//entry[@id = 2]//title', '//entry/@kind[. = "b"]',
+    ]
+
+    def setUp(self):
+        self.doc = xml.dom.minidom.parseString(self.xml)
+
+    def source(self):
+        return io.BytesIO(self.xml.encode('utf-8'))
+
+    def test_values(self):
+        for expr in self.exprs:
+            stream = xpath.StreamingXPath(expr, namespaces=self.namespaces,
+                                          variables={'kind': 'a'})
+            expected = xpath.findvalues(expr, self.doc,
+                                        namespaces=self.namespaces, kind='a')
+            self.assertEqual(
+                list(stream.iterfindvalues(self.source(), chunk_size=16)),
+                expected, expr)
+
+    def test_nodes(self):
+        for expr in ('//entry', '//entry/@id', '//x:link'):
+            stream = xpath.StreamingXPath(expr, namespaces=self.namespaces)
+            nodes = list(stream.iterfind(self.source()))
+            expected = xpath.find(expr, self.doc, namespaces=self.namespaces)
+            self.assertEqual([n.nodeType for n in nodes],
+                             [n.nodeType for n in expected], expr)
+            self.assertEqual([xpath.expr.string_value(n) for n in nodes],
+                             [xpath.expr.string_value(n) for n in expected],
+                             expr)
+        nodes = list(xpath.StreamingXPath('//entry[@id = 2]').iterfind(
+            self.source()))
+        self.assertEqual(xpath.findvalues('title | entry/@id', nodes[0]),
+                         ['two', '2.1'])
+        self.assertIsNone(nodes[0].parentNode)
+
+    def test_file_name(self):
+        fd, name = tempfile.mkstemp(suffix='.xml')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.xml.encode('utf-8'))
+            stream = xpath.StreamingXPath('/feed/entry/@id')
+            self.assertEqual(list(stream.iterfindvalues(name)),
+                             ['1', '2', '3'])
+        finally:
+            os.remove(name)
+
+    def test_sax(self):
+        stream = xpath.StreamingXPath('//entry[@kind = "a"]/title')
+        handler = stream.handler(values=True)
+        parser = xml.sax.make_parser()
+        parser.setFeature(xml.sax.handler.feature_namespaces, True)
+        parser.setContentHandler(handler)
+        parser.parse(self.source())
+        self.assertEqual(list(handler.results),
+                         ['one', 'nested  two', '<three>'])
+
+    def test_sax_nodes(self):
+        stream = xpath.StreamingXPath('//entry[@kind = "a"]')
+        handler = stream.handler()
+        parser = xml.sax.make_parser()
+        parser.setFeature(xml.sax.handler.feature_namespaces, True)
+        parser.setContentHandler(handler)
+        parser.parse(self.source())
+        entries = list(handler.results)
+        self.assertEqual([(e.tagName, e.localName) for e in entries],
+                         [('entry', 'entry')] * 3)
+        self.assertEqual([e.getAttribute('id') for e in entries],
+                         ['1', '2.1', '3'])
+        self.assertEqual([e.firstChild.localName for e in entries],
+                         ['title', 'title', 'title'])
+
+    def test_sax_prefixes(self):
+        for expr in ('//x:link', '//@x:lang'):
+            stream = xpath.StreamingXPath(expr, namespaces=self.namespaces)
+            handler = stream.handler()
+            parser = xml.sax.make_parser()
+            parser.setFeature(xml.sax.handler.feature_namespaces, True)
+            parser.setContentHandler(handler)
+            parser.parse(self.source())
+            expected = xpath.find(expr, self.doc, namespaces=self.namespaces)
+            self.assertEqual([n.nodeName for n in handler.results],
+                             [n.nodeName for n in expected], expr)
+
+    def test_not_implemented(self):
+        for expr in ('//entry[last()]', '//title/..', '//entry[title]',
+                     '//title/text()', '//entry/node()', '//title[. = "one"]',
+                     'count(//entry)', '//entry/@id/x', '//entry | //title',
+                     '/', '//entry[string-length()]', '//entry/following::x',
+                     '(//entry)[1]', '//entry[lang("en")]'):
+            self.assertRaises(xpath.XPathNotImplementedError,
+                              xpath.StreamingXPath, expr)
+        self.assertRaises(xpath.XPathUnknownPrefixError,
+                          xpath.StreamingXPath, '//y:entry')
+        self.assertRaises(xpath.XPathUnknownPrefixError,
+                          xpath.StreamingXPath, '//entry[@y:id]')
+
+class TestRecords(unittest.TestCase):
+    """Records expanded one at a time with pulldom."""
+
+    xml = TestStreamingXPath.xml
+
+    def source(self):
+        return io.BytesIO(self.xml.encode('utf-8'))
+
+    def test_dict(self):
+        fields = {'id': '@id', 'title': 'title', 'href': 'x:link/@href',
+                  'nested': 'count(entry)', 'kind': 'string(@kind = $kind)'}
+        records = list(xpath.iterrecords(
+            self.source(), '/feed/entry', fields,
+            namespaces=TestStreamingXPath.namespaces, kind='a'))
+        self.assertEqual(records, [
+            {'id': '1', 'title': 'one', 'href': 'h1', 'nested': 0,
+             'kind': 'true'},
+            {'id': '2', 'title': 'two', 'href': None, 'nested': 1,
+             'kind': 'false'},
+            {'id': '3', 'title': '<three>', 'href': None, 'nested': 0,
+             'kind': 'true'},
+        ])
+
+    def test_tuple(self):
+        # Records inside a record are not searched.
+        records = xpath.iterrecords(self.source(), '//entry[@id > 1]',
+                                    [xpath.XPath('@id'), 'title'])
+        self.assertEqual(list(records),
+                         [('2', 'two'), ('3', '<three>'), ('4', 'four')])
+
+    def test_errors(self):
+        self.assertRaises(xpath.XPathTypeError, xpath.iterrecords,
+                          self.source(), '//entry/@id', [])
+        self.assertRaises(xpath.XPathNotImplementedError, xpath.iterrecords,
+                          self.source(), '//entry[title]', [])
+        self.assertRaises(xpath.XPathParseError, xpath.iterrecords,
+                          self.source(), '//entry', ['title['])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+import unittest
+import xml.dom.minidom
+import xpath
+import xpath.expr
+
+class TestStringValue(unittest.TestCase):
+    """String-values of elements, and their memoization."""
+
+    xml = """<book><chapter id="c1">one <b>two</b><![CDATA[ <three> ]]><!-- no
+--><?pi no?><chapter id="c2">four<i>five</i></chapter></chapter><chapter id="c3">six</chapter></book>"""
+
+    def setUp(self):
+        self.doc = xml.dom.minidom.parseString(self.xml)
+
+    def test_string_value(self):
+        self.assertEqual(xpath.expr.string_value(self.doc),
+                         'one two <three> fourfivesix')
+        c1, c2, c3 = xpath.find('//chapter', self.doc)
+        self.assertEqual(xpath.expr.string_value(c1),
+                         'one two <three> fourfive')
+        self.assertEqual(xpath.expr.string_value(c2), 'fourfive')
+        empty = self.doc.createElement('empty')
+        self.assertEqual(xpath.expr.string_value(empty), '')
+
+    def test_deep(self):
+        depth = 5000
+        doc = xml.dom.minidom.parseString('<a>x' * depth + '</a>' * depth)
+        self.assertEqual(xpath.expr.string_value(doc), 'x' * depth)
+
+    def test_memoize(self):
+        for memoize in (False, True, {}):
+            self.assertEqual(
+                xpath.findvalues('//chapter[contains(., "five")]', self.doc,
+                                 memoize=memoize),
+                ['one two <three> fourfive', 'fourfive'])
+            self.assertEqual(
+                xpath.findvalue('//chapter[. = "six"]/@id', self.doc,
+                                memoize=memoize), 'c3')
+
+    def test_memo_scope(self):
+        c1 = xpath.findnode('//chapter', self.doc)
+        with xpath.expr.string_value_memo(self.doc):
+            self.assertEqual(xpath.expr.string_value(c1),
+                             'one two <three> fourfive')
+            # Values are not recomputed within the block.
+            c1.firstChild.data = 'ONE '
+            self.assertEqual(xpath.expr.string_value(c1),
+                             'one two <three> fourfive')
+        self.assertEqual(xpath.expr.string_value(c1),
+                         'ONE two <three> fourfive')
+
+    def test_memo_reused_for_ancestors(self):
+        c1, c2, c3 = xpath.find('//chapter', self.doc)
+        with xpath.expr.string_value_memo(self.doc):
+            xpath.expr.string_value(c2)
+            c2.firstChild.data = 'FOUR'
+            self.assertEqual(xpath.expr.string_value(c1),
+                             'one two <three> fourfive')
+
+    def test_evaluation_memo(self):
+        context = xpath.XPathContext(memoize=True)
+        self.assertEqual(context.findvalue('string(//chapter[@id = "c3"])', self.doc),
+                         'six')
+        xpath.findnode('//chapter[@id = "c3"]', self.doc).firstChild.data = 'seven'
+        self.assertEqual(context.findvalue('string(//chapter[@id = "c3"])', self.doc),
+                         'seven')
+        self.assertEqual(context.clone().memoize, True)
+
+    def test_dict_memo(self):
+        memo = {}
+        context = xpath.XPathContext(memoize=memo)
+        self.assertEqual(context.find('//chapter[. = "six"]/@id', self.doc)[0]
+                         .value, 'c3')
+        c3 = xpath.findnode('//chapter[@id = "c3"]', self.doc)
+        self.assertEqual(memo[c3], 'six')
+        c3.firstChild.data = 'seven'
+        self.assertEqual(context.find('//chapter[. = "seven"]', self.doc), [])
+        memo.clear()
+        self.assertEqual(context.find('//chapter[. = "seven"]', self.doc),
+                         [c3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,12 @@
 from __future__ import annotations
 
-from typing import Any, Dict, Optional, Sequence, Union, List
+import collections
+import copy
+import itertools
+import types
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence, Union, List
 
+import weakref
 import xml.dom
 
 from xpath.exceptions import (
@@ -15,11 +20,28 @@ from xpath.exceptions import (
 )
 import xpath.exceptions
 from functools import wraps
+from xpath.cache import CacheInfo, ExpressionCache
+import xpath.compiler
 import xpath.expr
-import xpath.parser
-from yapps import runtime as yappsrt
-
-__all__ = ["find", "findnode", "findvalue", "XPathContext", "XPath"]
+from xpath.frozen import FrozenDocument
+import xpath.optimizer
+import xpath.rdparser
+from xpath.stream import StreamingXPath, iterrecords
+from xpath.queryset import QuerySet
+
+__all__ = [
+    "find",
+    "findnode",
+    "findvalue",
+    "invalidate",
+    "cache_info",
+    "set_cache_size",
+    "XPathContext",
+    "XPath",
+    "FrozenDocument",
+    "StreamingXPath",
+    "QuerySet",
+]
 __all__.extend((x for x in dir(xpath.exceptions) if not x.startswith("_")))
 
 
@@ -31,34 +53,70 @@ def api(f):
     interesting to the user.  This decorator rethrows XPathErrors to
     trim the stack.
 
+    The document indexes built during the call are kept until it returns.
+
     """
 
     @wraps(f)
     def api_function(*args, **kwargs):
         try:
-            return f(*args, **kwargs)
+            with xpath.expr._document_indexes.scope():
+                return f(*args, **kwargs)
         except XPathError as e:
             raise e
 
     return api_function
 
 
+# The namespace declarations on the document element of each document, as
+# (default_namespace, namespaces) pairs, read by XPathContext.  They are
+# kept until the document is passed to invalidate().
+_document_namespaces: "weakref.WeakKeyDictionary[Any, Any]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _declarations(document: Any) -> Any:
+    try:
+        return _document_namespaces[document]
+    except (KeyError, TypeError):
+        pass
+    default_namespace = None
+    namespaces = {}
+    if document.documentElement is not None:
+        attrs = document.documentElement.attributes
+        for attr in (attrs.item(i) for i in range(attrs.length)):
+            if attr.name == "xmlns":
+                default_namespace = attr.value
+            elif attr.name.startswith("xmlns:"):
+                namespaces[attr.name[6:]] = attr.value
+    declarations = (default_namespace, namespaces)
+    try:
+        _document_namespaces[document] = declarations
+    except TypeError:
+        pass
+    return declarations
+
+
 class XPathContext(object):
     def __init__(self, document: Optional[xml.dom.Node] = None, **kwargs: Any) -> None:
         self.default_namespace: Optional[str] = None
         self.namespaces: Dict[str, str] = {}
         self.variables: Dict[Any, Any] = {}
+        self.memoize: Union[bool, Dict[Any, str]] = False
+        self.index: Union[bool, Dict[Any, Any]] = False
+        # The FrozenDocument whose arrays compiled steps may walk, set by
+        # its find() et al. methods.
+        self.frozen: Optional[Any] = None
+        # The values of the invariant subexpressions of the expression
+        # being evaluated, set on a copy of the context by InvariantScope.
+        self.invariants: Optional[Dict[Any, Any]] = None
 
         if document is not None:
             if document.nodeType != document.DOCUMENT_NODE:
                 document = document.ownerDocument
-            if document.documentElement is not None:
-                attrs = document.documentElement.attributes
-                for attr in (attrs.item(i) for i in range(attrs.length)):
-                    if attr.name == "xmlns":
-                        self.default_namespace = attr.value
-                    elif attr.name.startswith("xmlns:"):
-                        self.namespaces[attr.name[6:]] = attr.value
+            self.default_namespace, namespaces = _declarations(document)
+            self.namespaces.update(namespaces)
 
         self.update(**kwargs)
 
@@ -67,6 +125,9 @@ class XPathContext(object):
         dup.default_namespace = self.default_namespace
         dup.namespaces.update(self.namespaces)
         dup.variables.update(self.variables)
+        dup.memoize = self.memoize
+        dup.index = self.index
+        dup.frozen = self.frozen
         return dup
 
     def update(
@@ -74,6 +135,8 @@ class XPathContext(object):
         default_namespace: Optional[str] = None,
         namespaces: Optional[Dict[str, str]] = None,
         variables: Optional[Dict[Any, Any]] = None,
+        memoize: Optional[Union[bool, Dict[Any, str]]] = None,
+        index: Optional[Union[bool, Dict[Any, Any]]] = None,
         **kwargs: Any,
     ) -> None:
         if default_namespace is not None:
@@ -82,8 +145,36 @@ class XPathContext(object):
             self.namespaces = namespaces
         if variables is not None:
             self.variables = variables
+        if memoize is not None:
+            self.memoize = memoize
+        if index is not None:
+            self.index = index
         self.variables.update(kwargs)
 
+    def overlay(
+        self,
+        default_namespace: Optional[str] = None,
+        namespaces: Optional[Dict[str, str]] = None,
+        variables: Optional[Dict[Any, Any]] = None,
+        memoize: Optional[Union[bool, Dict[Any, str]]] = None,
+        index: Optional[Union[bool, Dict[Any, Any]]] = None,
+        **kwargs: Any,
+    ) -> "XPathContext":
+        """Return a context for a single evaluation, updated as by
+        update() without changing this one.
+
+        Unlike clone(), the namespace and variable mappings are shared
+        rather than copied: variables given as keyword arguments are
+        looked up before those of this context, and mappings given as
+        arguments replace those of this context.
+
+        """
+        dup = copy.copy(self)
+        dup.update(default_namespace, namespaces, variables, memoize, index)
+        if kwargs:
+            dup.variables = collections.ChainMap(kwargs, dup.variables)
+        return dup
+
     @api
     def find(self, expr: Any, node: xml.dom.Node, **kwargs: Any) -> Any:
         return xpath.find(expr, node, context=self, **kwargs)
@@ -102,70 +193,303 @@ class XPathContext(object):
     def findvalues(self, expr: Any, node: xml.dom.Node, **kwargs: Any) -> List[str]:
         return xpath.findvalues(expr, node, context=self, **kwargs)
 
+    @api
+    def find_each(
+        self, expr: Any, nodes: Iterable[xml.dom.Node], **kwargs: Any
+    ) -> List[Any]:
+        return xpath.find_each(expr, nodes, context=self, **kwargs)
 
-class XPath(object):
-    _max_cache: int = 100
-    _cache: Dict[str, "XPath"] = {}
+    @api
+    def findvalue_each(
+        self, expr: Any, nodes: Iterable[xml.dom.Node], **kwargs: Any
+    ) -> List[Any]:
+        return xpath.findvalue_each(expr, nodes, context=self, **kwargs)
 
-    def __init__(self, expr: Any) -> None:
-        """Compile an XPath expression."""
-        try:
-            parser = xpath.parser.XPath(xpath.parser.XPathScanner(str(expr)))
-            self.expr = parser.XPath()
-        except yappsrt.SyntaxError as e:
-            raise XPathParseError(str(expr), e.pos, e.msg)
+    @api
+    def iterfind(
+        self, expr: Any, node: xml.dom.Node, **kwargs: Any
+    ) -> Iterator[xml.dom.Node]:
+        return xpath.iterfind(expr, node, context=self, **kwargs)
+
+    @api
+    def iterfindvalues(
+        self, expr: Any, node: xml.dom.Node, **kwargs: Any
+    ) -> Iterator[str]:
+        return xpath.iterfindvalues(expr, node, context=self, **kwargs)
+
+
+class _XPathType(type):
+    # Read-only views of XPath.cache under the names of the dict and the
+    # size limit it replaced, for code which inspected them.
+
+    @property
+    def _cache(cls) -> "types.MappingProxyType[Any, XPath]":
+        return types.MappingProxyType(cls.cache.entries())
+
+    @property
+    def _max_cache(cls) -> int:
+        return cls.cache.maxsize
+
+
+class XPath(object, metaclass=_XPathType):
+    # Expressions compiled by XPath.get(), shared by the module-level
+    # find() et al. functions.
+    cache: ExpressionCache = ExpressionCache(maxsize=100)
+
+    # Evaluate expressions with closures built by xpath.compiler.  When
+    # false, the expression tree is interpreted directly, which is slower
+    # but easier to debug.
+    compiled: bool = True
+
+    # Fold constant subexpressions and simplify the tree with
+    # xpath.optimizer before evaluating it.  When false, the tree is
+    # evaluated as parsed.
+    optimized: bool = True
+
+    def __init__(
+        self,
+        expr: Any,
+        compiled: Optional[bool] = None,
+        optimized: Optional[bool] = None,
+        namespaces: Optional[Dict[str, str]] = None,
+        default_namespace: Optional[str] = None,
+    ) -> None:
+        """Compile an XPath expression.
+
+        If namespaces or default_namespace is given, the expression is
+        bound to these declarations, as by bind().
+
+        """
+        self.expr = xpath.rdparser.parse(str(expr))
+
+        if optimized is not None:
+            self.optimized = optimized
+        if self.optimized:
+            self.expr = xpath.optimizer.optimize(self.expr)
+        if namespaces is not None or default_namespace is not None:
+            self.expr = xpath.optimizer.bind(
+                self.expr, namespaces or {}, default_namespace
+            )
+        if compiled is not None:
+            self.compiled = compiled
+        self._compile()
+
+    def _compile(self) -> None:
+        if self.compiled:
+            self._evaluate = xpath.compiler.compile(self.expr)
+            self._iterate = xpath.compiler.compile_iter(self.expr)
+        else:
+            self._evaluate = self.expr.evaluate
+            self._iterate = self.expr.iterate
+
+    @api
+    def bind(
+        self,
+        context: Optional[XPathContext] = None,
+        namespaces: Optional[Dict[str, str]] = None,
+        default_namespace: Optional[str] = None,
+    ) -> "XPath":
+        """Return a copy of the expression with the namespace prefixes of
+        its names resolved ahead of time, with the declarations of context
+        or the given namespaces and default namespace.  The declarations
+        of the context the copy is evaluated in are then ignored.
+
+        Raises XPathUnknownPrefixError if a prefix is not declared.
+
+        """
+        if context is not None:
+            if namespaces is None:
+                namespaces = context.namespaces
+            if default_namespace is None:
+                default_namespace = context.default_namespace
+        bound = copy.copy(self)
+        bound.expr = xpath.optimizer.bind(self.expr, namespaces or {}, default_namespace)
+        bound._compile()
+        return bound
 
     @classmethod
     def get(cls, s: Union[str, "XPath"]) -> "XPath":
         if isinstance(s, cls):
             return s
-        try:
-            return cls._cache[s]  # type: ignore[index]
-        except KeyError:
-            if len(cls._cache) > cls._max_cache:
-                cls._cache.clear()
-            expr = cls(s)
-            cls._cache[s] = expr
-            return expr
+        return cls.cache.get(s, cls)
+
+    @staticmethod
+    def _context(
+        node: xml.dom.Node, context: Optional[XPathContext], kwargs: Dict[str, Any]
+    ) -> XPathContext:
+        if context is None:
+            context = XPathContext(node, **kwargs)
+        elif kwargs:
+            context = context.overlay(**kwargs)
+        return context
 
     @api
     def find(
         self, node: xml.dom.Node, context: Optional[XPathContext] = None, **kwargs: Any
     ) -> Any:
-        if context is None:
-            context = XPathContext(node, **kwargs)
-        elif kwargs:
-            context = context.clone()
-            context.update(**kwargs)
-        return self.expr.evaluate(node, 1, 1, context)
+        context = self._context(node, context, kwargs)
+        with xpath.expr.evaluation(node, context):
+            return self._evaluate(node, 1, 1, context)
 
     @api
     def findnode(
         self, node: xml.dom.Node, context: Optional[XPathContext] = None, **kwargs: Any
     ) -> Optional[xml.dom.Node]:
-        result = self.find(node, context, **kwargs)
-        if not xpath.expr.nodesetp(result):
-            raise XPathTypeError("expression is not a node-set")
-        if len(result) == 0:
+        # Only the first node is needed, so evaluate lazily.
+        context = self._context(node, context, kwargs)
+        with xpath.expr.evaluation(node, context):
+            for result in self._iterate(node, 1, 1, context):
+                return result
             return None
-        return result[0]
 
     @api
     def findvalue(
         self, node: xml.dom.Node, context: Optional[XPathContext] = None, **kwargs: Any
     ) -> Any:
-        result = self.find(node, context, **kwargs)
+        if xpath.expr.expr_type(self.expr) == "node-set":
+            result = self.findnode(node, context, **kwargs)
+            if result is None:
+                return None
+            return xpath.expr.string_value(result)
+        return self._value(self.find(node, context, **kwargs))
+
+    @staticmethod
+    def _value(result: Any) -> Any:
         if xpath.expr.nodesetp(result):
             if len(result) == 0:
                 return None
             result = xpath.expr.string(result)
         return result
 
+    @api
+    def find_each(
+        self,
+        nodes: Iterable[xml.dom.Node],
+        context: Optional[XPathContext] = None,
+        **kwargs: Any,
+    ) -> List[Any]:
+        """Evaluate the expression with each of nodes as the context node,
+        as find() does, and return the list of the results, in the order
+        of the nodes.  The context is set up, and the string-values of
+        nodes are memoized, once for each run of nodes in one document.
+
+        """
+        evaluate = self._evaluate
+        results: List[Any] = []
+        for run, run_context in self._runs(nodes, context, kwargs):
+            results.extend(evaluate(node, 1, 1, run_context) for node in run)
+        return results
+
+    @api
+    def findvalue_each(
+        self,
+        nodes: Iterable[xml.dom.Node],
+        context: Optional[XPathContext] = None,
+        **kwargs: Any,
+    ) -> List[Any]:
+        """Return the values findvalue() returns with each of nodes as the
+        context node, in the order of the nodes, as find_each() does.
+
+        """
+        results: List[Any] = []
+        if xpath.expr.expr_type(self.expr) == "node-set":
+            iterate = self._iterate
+            string_value = xpath.expr.string_value
+            for run, run_context in self._runs(nodes, context, kwargs):
+                for node in run:
+                    result = next(iterate(node, 1, 1, run_context), None)
+                    if result is not None:
+                        result = string_value(result)
+                    results.append(result)
+            return results
+        evaluate = self._evaluate
+        value = self._value
+        for run, run_context in self._runs(nodes, context, kwargs):
+            results.extend(value(evaluate(node, 1, 1, run_context)) for node in run)
+        return results
+
+    def _runs(
+        self,
+        nodes: Iterable[xml.dom.Node],
+        context: Optional[XPathContext],
+        kwargs: Dict[str, Any],
+    ) -> Iterator[Any]:
+        # Produce the runs of nodes in one document, with the context to
+        # evaluate them in, while the indexes and memo of the context are
+        # installed.
+        for document, run in itertools.groupby(nodes, _owner_document):
+            run_context = self._context(document, context, kwargs)
+            with xpath.expr.evaluation(document, run_context):
+                yield run, run_context
+
     @api
     def findvalues(
         self, node: xml.dom.Node, context: Optional[XPathContext] = None, **kwargs: Any
     ) -> List[str]:
-        result = self.find(node, context, **kwargs)
+        context = self._context(node, context, kwargs)
+        with xpath.expr.evaluation(node, context):
+            return self._values(self._evaluate(node, 1, 1, context))
+
+    @api
+    def iterfind(
+        self, node: xml.dom.Node, context: Optional[XPathContext] = None, **kwargs: Any
+    ) -> Iterator[xml.dom.Node]:
+        """Return an iterator over the nodes of the resulting node-set, in
+        document order.  Where the axes of the path allow, nodes are
+        produced as they are found, without building the node-set first.
+
+        """
+        context = self._context(node, context, kwargs)
+        return self._iter(node, context, False)
+
+    @api
+    def iterfindvalues(
+        self, node: xml.dom.Node, context: Optional[XPathContext] = None, **kwargs: Any
+    ) -> Iterator[str]:
+        """Return an iterator over the string-values of the nodes of the
+        resulting node-set, in document order, as iterfind() does.
+
+        """
+        context = self._context(node, context, kwargs)
+        return self._iter(node, context, True)
+
+    def _iter(self, node: xml.dom.Node, context: XPathContext, values: bool) -> Any:
+        if xpath.expr.expr_type(self.expr) not in (None, "node-set"):
+            raise XPathTypeError("expression is not a node-set")
+        memo = context.memoize
+        if memo is True:
+            memo = {}
+        with xpath.expr._document_indexes.scope(context.index):
+            state = xpath.expr._document_indexes.current()
+        return self._iter_scoped(node, context, values, state, memo)
+
+    def _iter_scoped(
+        self,
+        node: xml.dom.Node,
+        context: XPathContext,
+        values: bool,
+        state: Any,
+        memo: Any,
+    ) -> Iterator[Any]:
+        # The document indexes of the call and the memo last for the whole
+        # iteration, but are only installed while the iterator runs, so
+        # that other evaluations between results neither see nor fill them.
+        string_value = xpath.expr.string_value
+        restore = xpath.expr._document_indexes.restore
+        string_value_memo = xpath.expr.string_value_memo
+        with restore(state), string_value_memo(node, memo):
+            nodes = self._iterate(node, 1, 1, context)
+        while True:
+            with restore(state), string_value_memo(node, memo):
+                result = next(nodes, None)
+                if result is not None and values:
+                    result = string_value(result)
+            if result is None:
+                return
+            yield result
+
+    @staticmethod
+    def _values(result: Any) -> List[str]:
         if not xpath.expr.nodesetp(result):
             raise XPathTypeError("expression is not a node-set")
         return [xpath.expr.string_value(x) for x in result]
@@ -181,6 +505,45 @@ class XPath(object):
         return str(self.expr)
 
 
+def _owner_document(node: xml.dom.Node) -> Any:
+    if node.nodeType == node.DOCUMENT_NODE:
+        return node
+    return node.ownerDocument
+
+
+def invalidate(node: Optional[xml.dom.Node] = None) -> None:
+    """Discard the cached namespace declarations of the document
+    containing node, or of all documents.  Call this after changing the
+    namespace declarations on the document element of a document that has
+    already been queried.
+
+    """
+    if node is None:
+        _document_namespaces.clear()
+    else:
+        document = node.ownerDocument
+        if node.nodeType == node.DOCUMENT_NODE:
+            document = node
+        if document is not None:
+            _document_namespaces.pop(document, None)
+
+
+def cache_info() -> CacheInfo:
+    """Return the hit, miss and eviction counters of the expression cache
+    used by find() et al., along with its maximum and current size.
+
+    """
+    return XPath.cache.info()
+
+
+def set_cache_size(maxsize: int) -> None:
+    """Set the maximum number of compiled expressions kept by find() et
+    al.  Least recently used expressions are evicted first.
+
+    """
+    XPath.cache.maxsize = maxsize
+
+
 @api
 def find(expr: Any, node: xml.dom.Node, **kwargs: Any) -> Any:
     return XPath.get(expr).find(node, **kwargs)
@@ -199,3 +562,25 @@ def findvalue(expr: Any, node: xml.dom.Node, **kwargs: Any) -> Any:
 @api
 def findvalues(expr: Any, node: xml.dom.Node, **kwargs: Any) -> List[str]:
     return XPath.get(expr).findvalues(node, **kwargs)
+
+
+@api
+def find_each(expr: Any, nodes: Iterable[xml.dom.Node], **kwargs: Any) -> List[Any]:
+    return XPath.get(expr).find_each(nodes, **kwargs)
+
+
+@api
+def findvalue_each(
+    expr: Any, nodes: Iterable[xml.dom.Node], **kwargs: Any
+) -> List[Any]:
+    return XPath.get(expr).findvalue_each(nodes, **kwargs)
+
+
+@api
+def iterfind(expr: Any, node: xml.dom.Node, **kwargs: Any) -> Iterator[xml.dom.Node]:
+    return XPath.get(expr).iterfind(node, **kwargs)
+
+
+@api
+def iterfindvalues(expr: Any, node: xml.dom.Node, **kwargs: Any) -> Iterator[str]:
+    return XPath.get(expr).iterfindvalues(node, **kwargs)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, NamedTuple
+import threading
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    maxsize: int
+    currsize: int
+
+
+class ExpressionCache(object):
+    """A bounded, thread-safe cache of compiled expressions.
+
+    When the cache is full, the least recently used entry is evicted.
+    All access to the entries and counters is serialized by a lock, so
+    the cache does not rely on the GIL and is safe to share between
+    threads on free-threaded builds.  Expressions are compiled outside
+    the lock; if two threads miss on the same key at once, both compile
+    it and the first result stored is the one returned to both.
+
+    """
+
+    def __init__(self, maxsize: int = 100) -> None:
+        if maxsize < 0:
+            raise ValueError("maxsize must not be negative")
+        self._maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def maxsize(self) -> int:
+        return self._maxsize
+
+    @maxsize.setter
+    def maxsize(self, maxsize: int) -> None:
+        if maxsize < 0:
+            raise ValueError("maxsize must not be negative")
+        with self._lock:
+            self._maxsize = maxsize
+            self._evict()
+
+    def get(self, key: Hashable, factory: Callable[[Hashable], Any]) -> Any:
+        """Return the entry for key, calling factory(key) to create it
+        on a miss."""
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        value = factory(key)
+
+        with self._lock:
+            value = self._entries.setdefault(key, value)
+            self._entries.move_to_end(key)
+            self._evict()
+        return value
+
+    def _evict(self) -> None:
+        # Called with the lock held.
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def info(self) -> CacheInfo:
+        """Return the hit, miss and eviction counters and the cache size."""
+        with self._lock:
+            return CacheInfo(
+                self.hits,
+                self.misses,
+                self.evictions,
+                self._maxsize,
+                len(self._entries),
+            )
+
+    def clear(self, stats: bool = True) -> None:
+        """Discard all entries, and reset the counters unless stats is
+        false."""
+        with self._lock:
+            self._entries.clear()
+            if stats:
+                self.hits = self.misses = self.evictions = 0
+
+    def entries(self) -> Dict[Hashable, Any]:
+        """Return a copy of the entries, least recently used first."""
+        with self._lock:
+            return dict(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
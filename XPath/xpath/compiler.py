@@ -0,0 +1,953 @@
+"""Compilation of expression trees into Python closures.
+
+The classes in xpath.expr evaluate an expression by walking its tree:
+every node is visited through a method call, operators are looked up by
+name, and function arguments pass through a generic conversion wrapper on
+every evaluation.  compile() turns a tree into nested closures in which
+these decisions have been made once, ahead of time: operators, argument
+conversions and node tests are bound when the expression is compiled.
+
+Compiled functions have the signature of Expr.evaluate(): f(node, pos,
+size, context).  Expressions without a specialised compiler fall back to
+their evaluate() method, so the tree-walking interpreter remains the
+reference implementation.
+
+"""
+
+import xml.dom
+
+import xpath.expr as X
+from xpath.exceptions import (
+    XPathTypeError,
+    XPathUnknownPrefixError,
+    XPathUnknownVariableError,
+)
+
+# Compilers for each expression class, by the kind of function they build.
+_compilers = {}
+_iter_compilers = {}
+_filter_compilers = {}
+
+
+def compiles(cls, table=_compilers):
+    """Decorator registering a compiler for an expression class."""
+
+    def decorate(f):
+        table[cls] = f
+        return f
+
+    return decorate
+
+
+def compile(expr):
+    """Compile an expression into a function evaluate(node, pos, size,
+    context) returning the value of the expression.
+
+    """
+    try:
+        compiler = _compilers[type(expr)]
+    except KeyError:
+        return expr.evaluate
+    return compiler(expr)
+
+
+def compile_iter(expr):
+    """Compile a node-set expression into a function iterate(node, pos,
+    size, context) returning an iterator over the resulting nodes in
+    document order, as Expr.iterate() does.
+
+    """
+    try:
+        compiler = _iter_compilers[type(expr)]
+    except KeyError:
+        return _eager_iter(compile(expr))
+    return compiler(expr)
+
+
+def compile_filter(step):
+    """Compile a location step into a function filter(nodes, context), as
+    AxisStep.filter() does.
+
+    """
+    try:
+        compiler = _filter_compilers[type(step)]
+    except KeyError:
+        return step.filter
+    return compiler(step)
+
+
+def compile_boolean(expr):
+    """Compile an expression into a function returning the boolean value
+    of the expression.  Node-set expressions stop at their first node.
+
+    """
+    rtype = X.expr_type(expr)
+    if rtype == "node-set":
+        iterate = compile_iter(expr)
+        nonempty = X.nonempty
+
+        def test(node, pos, size, context):
+            return nonempty(iterate(node, pos, size, context))
+
+        return test
+
+    evaluate = compile(expr)
+    if rtype == "boolean":
+        return evaluate
+    boolean = X.boolean
+    return lambda node, pos, size, context: boolean(
+        evaluate(node, pos, size, context)
+    )
+
+
+def compile_string(expr):
+    """Compile an expression into a function returning the string value
+    of the expression.
+
+    """
+    rtype = X.expr_type(expr)
+    if rtype == "node-set":
+        iterate = compile_iter(expr)
+        string_value = X.string_value
+
+        def first_string(node, pos, size, context):
+            for n in iterate(node, pos, size, context):
+                return string_value(n)
+            return ""
+
+        return first_string
+
+    evaluate = compile(expr)
+    if rtype == "string":
+        return evaluate
+    string = X.string
+    return lambda node, pos, size, context: string(evaluate(node, pos, size, context))
+
+
+def compile_number(expr):
+    """Compile an expression into a function returning the numeric value
+    of the expression.
+
+    """
+    evaluate = compile(expr)
+    if X.expr_type(expr) == "number":
+        return lambda node, pos, size, context: float(
+            evaluate(node, pos, size, context)
+        )
+    number = X.number
+    return lambda node, pos, size, context: number(evaluate(node, pos, size, context))
+
+
+def _eager_iter(evaluate):
+    nodesetp = X.nodesetp
+
+    def iterate(node, pos, size, context):
+        result = evaluate(node, pos, size, context)
+        if not nodesetp(result):
+            raise XPathTypeError("expression is not a node-set")
+        return iter(result)
+
+    return iterate
+
+
+#
+# Operators and primary expressions.
+#
+
+
+@compiles(X.LiteralExpr)
+def _literal(expr):
+    value = expr.literal
+    return lambda node, pos, size, context: value
+
+
+@compiles(X.VariableReference)
+def _variable(expr):
+    name = expr.name
+    prefix = expr.prefix
+    text = str(expr)
+
+    if prefix is None:
+
+        def variable(node, pos, size, context):
+            try:
+                return context.variables[name]
+            except KeyError:
+                raise XPathUnknownVariableError(text)
+
+    else:
+
+        def variable(node, pos, size, context):
+            try:
+                namespaceURI = context.namespaces[prefix]
+            except KeyError:
+                raise XPathUnknownPrefixError(prefix)
+            try:
+                return context.variables[(namespaceURI, name)]
+            except KeyError:
+                raise XPathUnknownVariableError(text)
+
+    return variable
+
+
+@compiles(X.BoundVariableReference)
+def _bound_variable(expr):
+    key = expr.key
+    text = str(expr)
+
+    def variable(node, pos, size, context):
+        try:
+            return context.variables[key]
+        except KeyError:
+            raise XPathUnknownVariableError(text)
+
+    return variable
+
+
+@compiles(X.NegationExpr)
+def _negation(expr):
+    operand = compile_number(expr.expr)
+    return lambda node, pos, size, context: -operand(node, pos, size, context)
+
+
+@compiles(X.AndExpr)
+def _and(expr):
+    left = compile_boolean(expr.left)
+    right = compile_boolean(expr.right)
+    return lambda node, pos, size, context: left(
+        node, pos, size, context
+    ) and right(node, pos, size, context)
+
+
+@compiles(X.OrExpr)
+def _or(expr):
+    left = compile_boolean(expr.left)
+    right = compile_boolean(expr.right)
+    return lambda node, pos, size, context: left(
+        node, pos, size, context
+    ) or right(node, pos, size, context)
+
+
+@compiles(X.ArithmeticalExpr)
+def _arithmetic(expr):
+    op = expr.operators[expr.op]
+    left = compile_number(expr.left)
+    right = compile_number(expr.right)
+    return lambda node, pos, size, context: op(
+        left(node, pos, size, context), right(node, pos, size, context)
+    )
+
+
+@compiles(X.EqualityExpr)
+def _equality(expr):
+    ltype = X.expr_type(expr.left)
+    rtype = X.expr_type(expr.right)
+    if ltype is None or rtype is None or ltype == rtype == "node-set":
+        # The conversion depends on the values.
+        return _binary(expr)
+    if ltype == "node-set":
+        return _compare_nodes(expr.op, expr.left, expr.right, rtype, False)
+    if rtype == "node-set":
+        return _compare_nodes(expr.op, expr.right, expr.left, ltype, True)
+
+    # Both types are known: choose the conversion now, as operate() would.
+    if expr.op in ("=", "!="):
+        if "boolean" in (ltype, rtype):
+            convert = compile_boolean
+        elif "number" in (ltype, rtype):
+            convert = compile_number
+        else:
+            convert = compile_string
+    else:
+        convert = compile_number
+    op = expr.operators[expr.op]
+    left = convert(expr.left)
+    right = convert(expr.right)
+    return lambda node, pos, size, context: op(
+        left(node, pos, size, context), right(node, pos, size, context)
+    )
+
+
+def _compare_nodes(op, nodes, other, otype, swap):
+    # Compare a node-set with a value of a known type other than node-set.
+    # The comparison is true if it is true for the string-value of any
+    # node, converted as EqualityExpr.operate() would convert it.
+    literal = X.unwrap(other)
+    if isinstance(literal, X.LiteralExpr):
+        # Convert the literal once, now.
+        convert, constant = X.comparison_conversion(op, literal.literal)
+        value = lambda node, pos, size, context: constant
+    elif op in ("=", "!="):
+        if otype == "boolean":
+            convert, value = X.boolean, compile_boolean(other)
+        elif otype == "number":
+            convert, value = X.number, compile_number(other)
+        else:
+            convert, value = None, compile_string(other)
+    else:
+        convert, value = X.number, compile_number(other)
+    op = X.EqualityExpr.operators[op]
+    if swap:
+        op = (lambda f: lambda a, b: f(b, a))(op)
+    iterate = compile_iter(nodes)
+    string_value = X.string_value
+
+    if convert is None:
+
+        def compare(node, pos, size, context):
+            b = value(node, pos, size, context)
+            for n in iterate(node, pos, size, context):
+                if op(string_value(n), b):
+                    return True
+            return False
+
+    else:
+
+        def compare(node, pos, size, context):
+            b = value(node, pos, size, context)
+            for n in iterate(node, pos, size, context):
+                if op(convert(string_value(n)), b):
+                    return True
+            return False
+
+    return compare
+
+
+@compiles(X.UnionExpr)
+def _binary(expr):
+    operate = expr.operate
+    left = compile(expr.left)
+    right = compile(expr.right)
+    return lambda node, pos, size, context: operate(
+        left(node, pos, size, context), right(node, pos, size, context)
+    )
+
+
+#
+# Functions.
+#
+
+# Compilers for individual functions, by name.
+_function_compilers = {}
+
+
+def _function(name):
+    def decorate(f):
+        _function_compilers[name] = f
+        return f
+
+    return decorate
+
+
+@_function("position")
+def _position(expr):
+    return lambda node, pos, size, context: pos
+
+
+@_function("last")
+def _last(expr):
+    return lambda node, pos, size, context: size
+
+
+@_function("true")
+def _true(expr):
+    return lambda node, pos, size, context: True
+
+
+@_function("false")
+def _false(expr):
+    return lambda node, pos, size, context: False
+
+
+@_function("boolean")
+def _boolean(expr):
+    return compile_boolean(expr.args[0])
+
+
+@_function("not")
+def _not(expr):
+    operand = compile_boolean(expr.args[0])
+    return lambda node, pos, size, context: not operand(node, pos, size, context)
+
+
+@_function("string")
+def _string(expr):
+    if not expr.args:
+        string_value = X.string_value
+        return lambda node, pos, size, context: string_value(node)
+    return compile_string(expr.args[0])
+
+
+@_function("number")
+def _number(expr):
+    if not expr.args:
+        number, string_value = X.number, X.string_value
+        return lambda node, pos, size, context: number(string_value(node))
+    return compile_number(expr.args[0])
+
+
+@_function("contains")
+def _contains(expr):
+    a, b = [compile_string(x) for x in expr.args]
+    return lambda node, pos, size, context: b(node, pos, size, context) in a(
+        node, pos, size, context
+    )
+
+
+@_function("starts-with")
+def _starts_with(expr):
+    a, b = [compile_string(x) for x in expr.args]
+    return lambda node, pos, size, context: a(node, pos, size, context).startswith(
+        b(node, pos, size, context)
+    )
+
+
+def _argument(expr, impl):
+    # Compile a function argument with the conversion the function
+    # decorator applies to it.
+    convert = impl.convert
+    if impl.first:
+        iterate = compile_iter(expr)
+
+        def first(node, pos, size, context):
+            for n in iterate(node, pos, size, context):
+                return n
+            return None
+
+        return first
+    elif convert is X.boolean:
+        return compile_boolean(expr)
+    elif convert is X.string:
+        return compile_string(expr)
+    elif convert is X.number:
+        return compile_number(expr)
+
+    evaluate = compile(expr)
+    if convert is None:
+        return evaluate
+    return lambda node, pos, size, context: convert(evaluate(node, pos, size, context))
+
+
+def _implicit_argument(impl):
+    # The argument of a function such as string() called without one: the
+    # context node.
+    string_value = X.string_value
+    if impl.first:
+        return lambda node, pos, size, context: node
+    elif impl.convert is X.string:
+        return lambda node, pos, size, context: string_value(node)
+    elif impl.convert is X.number:
+        number = X.number
+        return lambda node, pos, size, context: number(string_value(node))
+    convert = impl.convert or (lambda x: x)
+    return lambda node, pos, size, context: convert([node])
+
+
+@compiles(X.Function)
+def _call(expr):
+    try:
+        return _function_compilers[expr.name](expr)
+    except KeyError:
+        pass
+
+    impl = expr.evaluate
+    f = impl.function
+    if impl.implicit and not expr.args:
+        args = [_implicit_argument(impl)]
+    else:
+        args = [_argument(x, impl) for x in expr.args]
+
+    if len(args) == 0:
+        return lambda node, pos, size, context: f(expr, node, pos, size, context)
+    elif len(args) == 1:
+        (a,) = args
+        return lambda node, pos, size, context: f(
+            expr, node, pos, size, context, a(node, pos, size, context)
+        )
+    elif len(args) == 2:
+        a, b = args
+        return lambda node, pos, size, context: f(
+            expr,
+            node,
+            pos,
+            size,
+            context,
+            a(node, pos, size, context),
+            b(node, pos, size, context),
+        )
+
+    def call(node, pos, size, context):
+        return f(
+            expr, node, pos, size, context, *[a(node, pos, size, context) for a in args]
+        )
+
+    return call
+
+
+@compiles(X.InvariantExpr)
+def _invariant(expr):
+    evaluate = compile(expr.expr)
+    document = expr.document
+    DOCUMENT_NODE = xml.dom.Node.DOCUMENT_NODE
+
+    def invariant(node, pos, size, context):
+        values = context.invariants
+        if values is None:
+            return evaluate(node, pos, size, context)
+        key = expr
+        if document:
+            if node.nodeType == DOCUMENT_NODE:
+                key = (expr, node)
+            else:
+                key = (expr, node.ownerDocument)
+        try:
+            return values[key]
+        except KeyError:
+            value = values[key] = evaluate(node, pos, size, context)
+            return value
+
+    return invariant
+
+
+@compiles(X.InvariantScope)
+def _invariant_scope(expr):
+    evaluate = compile(expr.expr)
+    invariant_scope = X.invariant_scope
+    return lambda node, pos, size, context: evaluate(
+        node, pos, size, invariant_scope(context)
+    )
+
+
+@compiles(X.InvariantScope, _iter_compilers)
+def _iter_invariant_scope(expr):
+    iterate = compile_iter(expr.expr)
+    invariant_scope = X.invariant_scope
+    return lambda node, pos, size, context: iterate(
+        node, pos, size, invariant_scope(context)
+    )
+
+
+#
+# Location paths.
+#
+
+
+@compiles(X.AbsolutePathExpr)
+def _absolute_path(expr):
+    path = compile(expr.path) if expr.path is not None else None
+    DOCUMENT_NODE = xml.dom.Node.DOCUMENT_NODE
+
+    def absolute_path(node, pos, size, context):
+        if node.nodeType != DOCUMENT_NODE:
+            node = node.ownerDocument
+        if path is None:
+            return [node]
+        return path(node, 1, 1, context)
+
+    return absolute_path
+
+
+@compiles(X.AbsolutePathExpr, _iter_compilers)
+def _iter_absolute_path(expr):
+    path = compile_iter(expr.path) if expr.path is not None else None
+    DOCUMENT_NODE = xml.dom.Node.DOCUMENT_NODE
+
+    def absolute_path(node, pos, size, context):
+        if node.nodeType != DOCUMENT_NODE:
+            node = node.ownerDocument
+        if path is None:
+            return iter([node])
+        return path(node, 1, 1, context)
+
+    return absolute_path
+
+
+def _descendants_step(dos, step):
+    """Return true if two steps are descendant-or-self::node() followed
+    by a child step whose predicates do not depend on the position.
+
+    """
+    return (
+        isinstance(dos, X.AxisStep)
+        and dos.axis is X.axes["descendant-or-self"]
+        and isinstance(dos.test, X.AnyKindTest)
+        and X.step_axis(step) == "child"
+        and step.streamable
+    )
+
+
+def _descendant_step(step):
+    """Return true if a step is a descendant step whose predicates do not
+    depend on the position.
+
+    """
+    return X.step_axis(step) == "descendant" and step.streamable
+
+
+def _compile_steps(steps):
+    # The steps of a location path as evaluate_steps() takes them, with
+    # each descendant-or-self::node() step fused with the child step after
+    # it.
+    compiled = []
+    i = 0
+    while i < len(steps):
+        fused = i + 1 < len(steps) and _descendants_step(steps[i], steps[i + 1])
+        if fused or _descendant_step(steps[i]):
+            # Searches by name read the element index of each root rather
+            # than joining with every descendant.
+            step = steps[i + 1] if fused else steps[i]
+            filter = None
+            test = (step.expr if isinstance(step, X.PredicateList) else step).test
+            if not isinstance(test, X.NameTest):
+                filter = compile_filter(step)
+            compiled.append((_descendants(step), "descendant", filter))
+            i += 2 if fused else 1
+        else:
+            step = steps[i]
+            filter = None
+            if X.nodeset_filter(step) is not None:
+                filter = compile_filter(step)
+            compiled.append((compile(step), X.nodeset_axis(step), filter))
+            i += 1
+    return compiled
+
+
+def _descendants(step, build=True):
+    # Select the descendants matching a child or descendant step directly,
+    # from the element index of the document when the step has a name
+    # test and the evaluation has an index.  Unless build is true, the
+    # element lists are only used if they exist.
+    tests = []
+    if isinstance(step, X.PredicateList):
+        tests = [compile_boolean(p) for p in step.predicates]
+        step = step.expr
+    test = step.test
+    matcher = test.matcher
+    child = X.axes["child"]
+    descendant = X.axes["descendant"]
+    named_descendants = X.named_descendants
+    stream_predicates = X.stream_predicates
+    indexed = isinstance(test, X.NameTest)
+
+    def descendants(node, pos, size, context):
+        nodes = None
+        if indexed:
+            nodes = named_descendants(node, test, context, build)
+        if nodes is None and context.frozen is not None:
+            nodes = _frozen_step(node, descendant, test, context)
+        if nodes is None:
+            match = matcher(child, context)
+            nodes = [n for n in descendant(node) if match(n)]
+        if tests and nodes:
+            nodes = list(stream_predicates(nodes, tests, context))
+        return nodes
+
+    return descendants
+
+
+@compiles(X.PathExpr)
+def _path(expr):
+    if len(expr.steps) == 1:
+        # The parser wraps every primary expression in a PathExpr.
+        return compile(expr.steps[0])
+
+    if X.step_axis(expr.steps[0]) is not None:
+        # Axis steps do not depend on the context position and size, so
+        # the first step can be planned along with the others.
+        steps = _compile_steps(expr.steps)
+        evaluate_steps = X.evaluate_steps
+        return lambda node, pos, size, context: evaluate_steps(
+            [node], steps, context
+        )
+
+    first = compile(expr.steps[0])
+    steps = _compile_steps(expr.steps[1:])
+    nodesetp = X.nodesetp
+    evaluate_steps = X.evaluate_steps
+
+    def path(node, pos, size, context):
+        result = first(node, pos, size, context)
+        if not nodesetp(result):
+            raise XPathTypeError("path step is not a node-set")
+        return evaluate_steps(result, steps, context, ordered=False)
+
+    return path
+
+
+@compiles(X.PathExpr, _iter_compilers)
+def _iter_path(expr):
+    if len(expr.steps) == 1:
+        return compile_iter(expr.steps[0])
+    plan = expr.stream_plan()
+    if not plan:
+        return _eager_iter(compile(expr))
+
+    first = None
+    if X.step_axis(expr.steps[0]) is None:
+        first = compile_iter(expr.steps[0])
+    stages = [
+        _stream_descendants(step)
+        if stage == "descendants"
+        else (
+            X.stream_children if stage == "children" else X.stream_each,
+            compile_iter(step),
+        )
+        for stage, step in plan
+    ]
+
+    def path(node, pos, size, context):
+        if first is None:
+            nodes = iter([node])
+        else:
+            nodes = first(node, pos, size, context)
+        for stage, step in stages:
+            nodes = stage(step, nodes, context)
+        return nodes
+
+    return path
+
+
+def _stream_descendants(step):
+    # A stage applying a child step to the descendants of each node.  A
+    # lazy search is usually cut short, so the element index is used only
+    # if it has already been built.
+    filter = compile_filter(step)
+    test = (step.expr if isinstance(step, X.PredicateList) else step).test
+    indexed = isinstance(test, X.NameTest)
+    descendant = X.axes["descendant"]
+    named_descendants = X.named_descendants
+
+    def stream(filter, nodes, context):
+        frozen = context.frozen
+        for node in nodes:
+            found = None
+            if indexed:
+                found = named_descendants(node, test, context, build=False)
+            if found is None and frozen is not None:
+                found = frozen.select(node, descendant, test, context)
+            if found is None:
+                found = descendant(node)
+            for n in filter(found, context):
+                yield n
+
+    return stream, filter
+
+
+@compiles(X.GroupedStep)
+def _grouped_step(expr):
+    # Like the child steps they stand for, steps such as //x[1] use the
+    # element index only if it exists.
+    descendants = _descendants(expr.descendant, build=False)
+    selectors = [_selector(p) for p in expr.step.predicates]
+    apply_grouped_predicates = X.apply_grouped_predicates
+
+    def grouped(node, pos, size, context):
+        nodes = descendants(node, pos, size, context)
+        if not nodes:
+            return nodes
+        return apply_grouped_predicates(nodes, selectors, context)
+
+    return grouped
+
+
+@compiles(X.AxisStep)
+def _axis_step(expr):
+    axis = expr.axis
+    reverse = axis.reverse
+    if axis is X.axes["descendant"]:
+        return _descendants(expr)
+
+    test = expr.test
+
+    if isinstance(test, X.AnyKindTest):
+        if reverse:
+
+            def step(node, pos, size, context):
+                if context.frozen is not None:
+                    result = _frozen_step(node, axis, test, context)
+                    if result is not None:
+                        result.reverse()
+                        return result
+                result = list(axis(node))
+                result.reverse()
+                return result
+
+        else:
+
+            def step(node, pos, size, context):
+                if context.frozen is not None:
+                    result = _frozen_step(node, axis, test, context)
+                    if result is not None:
+                        return result
+                return list(axis(node))
+
+        return step
+
+    matcher = test.matcher
+    if axis is X.axes["child"]:
+
+        def step(node, pos, size, context):
+            if context.frozen is not None:
+                result = _frozen_step(node, axis, test, context)
+                if result is not None:
+                    return result
+            match = matcher(axis, context)
+            return [n for n in node.childNodes if match(n)]
+
+        return step
+
+    def step(node, pos, size, context):
+        result = None
+        if context.frozen is not None:
+            result = _frozen_step(node, axis, test, context)
+        if result is None:
+            match = matcher(axis, context)
+            result = [n for n in axis(node) if match(n)]
+        if reverse:
+            result.reverse()
+        return result
+
+    return step
+
+
+def _frozen_step(node, axis, test, context):
+    # The nodes along an axis which pass a node test, in the order of the
+    # axis, found in the FrozenDocument of the context; or None if the step
+    # must be evaluated over the DOM.
+    nodes = context.frozen.select(node, axis, test, context)
+    if nodes is None:
+        return None
+    return list(nodes)
+
+
+def _iter_descendants(step):
+    # Lazily select the descendants matching a descendant step.
+    stream, filter = _stream_descendants(step)
+    return lambda node, pos, size, context: stream(filter, [node], context)
+
+
+@compiles(X.AxisStep, _iter_compilers)
+def _iter_axis_step(expr):
+    if expr.axis.reverse:
+        return _eager_iter(compile(expr))
+    if expr.axis is X.axes["descendant"]:
+        return _iter_descendants(expr)
+    axis = expr.axis
+    test = expr.test
+    matcher = test.matcher
+
+    def step(node, pos, size, context):
+        if context.frozen is not None:
+            nodes = context.frozen.select(node, axis, test, context)
+            if nodes is not None:
+                return nodes
+        match = matcher(axis, context)
+        return (n for n in axis(node) if match(n))
+
+    return step
+
+
+@compiles(X.AxisStep, _filter_compilers)
+def _filter_axis_step(expr):
+    axis = expr.axis
+    matcher = expr.test.matcher
+
+    def step(nodes, context):
+        match = matcher(axis, context)
+        return (n for n in nodes if match(n))
+
+    return step
+
+
+def _selector(pred):
+    kind, value = X.predicate_selector(pred, None, None)
+    if kind == "test":
+        value = compile_boolean(pred)
+    elif kind == "value":
+        value = compile(pred)
+    return kind, value
+
+
+@compiles(X.PredicateList)
+def _predicate_list(expr):
+    if _descendant_step(expr):
+        return _descendants(expr)
+    selectors = [_selector(p) for p in expr.predicates]
+    reverse = expr.axis.reverse
+    apply_predicates = X.apply_predicates
+
+    if isinstance(expr.expr, X.AxisStep):
+        # Walk the axis in proximity order, as PredicateList.evaluate does.
+        axis = expr.expr.axis
+        test = expr.expr.test
+        matcher = test.matcher
+
+        if selectors[0][0] == "position":
+            # Stop walking the axis at the selected position.
+            def predicates(node, pos, size, context):
+                nodes = None
+                if context.frozen is not None:
+                    nodes = context.frozen.select(node, axis, test, context)
+                if nodes is None:
+                    match = matcher(axis, context)
+                    nodes = (n for n in axis(node) if match(n))
+                result = apply_predicates(nodes, selectors, context)
+                if reverse:
+                    result.reverse()
+                return result
+
+            return predicates
+
+        def predicates(node, pos, size, context):
+            nodes = None
+            if context.frozen is not None:
+                nodes = _frozen_step(node, axis, test, context)
+            if nodes is None:
+                match = matcher(axis, context)
+                nodes = [n for n in axis(node) if match(n)]
+            if not nodes:
+                return nodes
+            result = apply_predicates(nodes, selectors, context)
+            if reverse:
+                result.reverse()
+            return result
+
+        return predicates
+
+    inner = compile(expr.expr)
+    nodesetp = X.nodesetp
+
+    def predicates(node, pos, size, context):
+        nodes = inner(node, pos, size, context)
+        if not nodesetp(nodes):
+            raise XPathTypeError("predicate input is not a node-set")
+        result = apply_predicates(nodes, selectors, context)
+        if reverse:
+            result.reverse()
+        return result
+
+    return predicates
+
+
+@compiles(X.PredicateList, _iter_compilers)
+def _iter_predicate_list(expr):
+    if not expr.streamable:
+        return _eager_iter(compile(expr))
+    if _descendant_step(expr):
+        return _iter_descendants(expr)
+    inner = compile_iter(expr.expr)
+    tests = [compile_boolean(p) for p in expr.predicates]
+    stream_predicates = X.stream_predicates
+    return lambda node, pos, size, context: stream_predicates(
+        inner(node, pos, size, context), tests, context
+    )
+
+
+@compiles(X.PredicateList, _filter_compilers)
+def _filter_predicate_list(expr):
+    inner = compile_filter(expr.expr)
+    tests = [compile_boolean(p) for p in expr.predicates]
+    stream_predicates = X.stream_predicates
+    return lambda nodes, context: stream_predicates(
+        inner(nodes, context), tests, context
+    )
@@ -1,7 +1,12 @@
-from itertools import chain, count
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+import copy
+from itertools import chain, count, islice
 import math
 import operator
 import re
+import sys
+import threading
 import xml.dom
 import weakref
 
@@ -29,13 +34,14 @@ def _round(n):
 def string_value(node):
     """Compute the string-value of a node."""
     if node.nodeType == node.DOCUMENT_NODE or node.nodeType == node.ELEMENT_NODE:
-        s = u""
-        for n in axes["descendant"](node):
-            if n.nodeType == n.TEXT_NODE:
-                s += n.data
-            elif n.nodeType == n.CDATA_SECTION_NODE:
-                s += n.nodeValue
-        return s
+        memo = getattr(_memo, "strings", None)
+        if memo is None:
+            return _text_content(node, None)
+        try:
+            return memo[node]
+        except KeyError:
+            s = memo[node] = _text_content(node, memo)
+            return s
 
     elif node.nodeType == node.ATTRIBUTE_NODE:
         return node.value
@@ -51,42 +57,460 @@ def string_value(node):
         return node.nodeValue
 
 
-def document_order(node):
-    """Compute a document order value for the node.
+def _text_content(node, memo):
+    # Join the text descendants of a node, walking the tree with a stack of
+    # child iterators.  Subtrees whose string-value is already in the memo
+    # are not walked again.
+    TEXT_NODE = node.TEXT_NODE
+    CDATA_SECTION_NODE = node.CDATA_SECTION_NODE
+    if not memo:
+        memo = None
+    parts = []
+    stack = [iter(node.childNodes)]
+    while stack:
+        for child in stack[-1]:
+            nodeType = child.nodeType
+            if nodeType == TEXT_NODE:
+                parts.append(child.data)
+            elif nodeType == CDATA_SECTION_NODE:
+                parts.append(child.nodeValue)
+            elif child.childNodes:
+                if memo is not None and child in memo:
+                    parts.append(memo[child])
+                    continue
+                stack.append(iter(child.childNodes))
+                break
+        else:
+            stack.pop()
+    return "".join(parts)
+
+
+# The string-value memo of the evaluation running in this thread, if any.
+_memo = threading.local()
+
+
+@contextmanager
+def string_value_memo(node, mode=True):
+    """Memoize the string-values of elements and documents while the
+    block runs.
+
+    If mode is a dict, it is used as the memo, so that the caller may pass
+    it to later evaluations over the same document for as long as the text
+    of the document does not change.  Otherwise the memo only lasts for the
+    block.  If mode is False, nothing is memoized.  A block nested in
+    another one uses the memo of the outer block.
+
+    """
+    if mode is False or getattr(_memo, "strings", None) is not None:
+        yield
+        return
+    if isinstance(mode, dict):
+        _memo.strings = mode
+    else:
+        _memo.strings = {}
+    try:
+        yield
+    finally:
+        _memo.strings = None
+
+
+@contextmanager
+def evaluation(node, context):
+    """Install the document indexes and the string-value memo asked for by
+    the index and memoize attributes of context while the block runs.
+
+    """
+    with _document_indexes.scope(context.index):
+        with string_value_memo(node, context.memoize):
+            yield
+
+
+#
+# Document order.
+#
+# A DocumentIndex ranks every node of a tree, attributes included, in one
+# preorder traversal.  An index refers to every node of its tree and is not
+# told when the tree changes, and building one costs a walk of the whole
+# tree, so indexes are only built when the context of an evaluation asks
+# for them, with its index attribute.  They are then kept for the
+# evaluation, or in the dict given as the index attribute, keyed by the
+# roots of the trees.  The first time an evaluation searches an indexed
+# document for descendants by name (e.g. "//item"), the index is extended
+# with lists of the elements of each expanded name.
+#
+# Without an index, nodes are ordered by the positions of their ancestors
+# among their siblings.  The children of a node are listed once in an
+# evaluation, the first time one of them is ordered.
+#
 
-    cmp(document_order(a), document_order(b)) will return -1, 0, or 1 if
-    a is before, identical to, or after b in the document respectively.
 
-    We represent document order as a list of sibling indexes.  That is,
-    the third child of the document node has an order of [2].  The first
-    child of that node has an order of [2,0].
+class DocumentIndex(object):
+    """Preorder index of the nodes in one tree.
 
-    Attributes have a sibling index of -1 (coming before all children of
-    their node) and are further ordered by name--e.g., [2,0,-1,'href'].
+    Attributes are ranked after their owner element and before its
+    children, in the order the attribute axis returns them.
 
     """
 
-    # Attributes: parent-order + [-1, attribute-name]
+    def __init__(self, root):
+        self.root = root
+        self.order = order = {}
+        rank = 0
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            order[node] = rank
+            rank += 1
+            attrs = node.attributes
+            if attrs:
+                for i in range(attrs.length):
+                    order[attrs.item(i)] = rank
+                    rank += 1
+            if node.childNodes:
+                stack.extend(reversed(node.childNodes))
+        self.size = rank
+        self.names = None
+        self._ranks = {}
+        # The region encoding, see regions().
+        self.nodes = None
+        self.post = None
+        self.level = None
+
+    def elements(self, namespaceURI, localName):
+        """Return the elements with the given expanded name, in document
+        order.  Either part of the name may be "*" to match any value.
+
+        """
+        names = self.names
+        if names is None:
+            # Other threads may read the lists as soon as they are published.
+            names = {}
+            ELEMENT_NODE = xml.dom.Node.ELEMENT_NODE
+            for node in self.order:
+                if node.nodeType == ELEMENT_NODE:
+                    ns = node.namespaceURI
+                    local = node.localName
+                    for key in ((ns, local), ("*", local), (ns, "*"), ("*", "*")):
+                        elements = names.get(key)
+                        if elements is None:
+                            names[key] = [node]
+                        else:
+                            elements.append(node)
+            self.names = names
+        return names.get((namespaceURI, localName), [])
+
+    def descendant_elements(self, node, namespaceURI, localName):
+        """Return the descendants of a node with the given expanded name,
+        as a new list in document order.
+
+        """
+        elements = self.elements(namespaceURI, localName)
+        if node is self.root and node.nodeType == node.DOCUMENT_NODE:
+            return list(elements)
+        key = (namespaceURI, localName)
+        ranks = self._ranks.get(key)
+        if ranks is None:
+            order = self.order
+            self._ranks[key] = ranks = [order[n] for n in elements]
+        start = bisect_right(ranks, self.order[node])
+        end = bisect_left(ranks, self.subtree_end(node), start)
+        return elements[start:end]
+
+    def subtree_end(self, node):
+        """Return the rank following the last descendant of a node."""
+        if self.post is None:
+            self.regions()
+        rank = self.order[node]
+        post = self.post[rank]
+        if post is not None:
+            return post + self.level[rank] + 1
+        # A node detached from the tree after it was indexed.
+        while node is not None:
+            sibling = node.nextSibling
+            if sibling is not None:
+                return self.order[sibling]
+            node = node.parentNode
+        return self.size
+
+    def regions(self):
+        """Build the region encoding of the tree.
+
+        The nodes attribute becomes the list of nodes by rank, and post and
+        level the lists of their postorder ranks and depths, attributes
+        being children of their element.  The attributes and descendants of
+        the node of rank r have the ranks from r + 1 to post[r] + level[r].
+
+        """
+        size = self.size
+        order = self.order
+        nodes = [None] * size
+        for node, rank in order.items():
+            nodes[rank] = node
+        post = [None] * size
+        level = [None] * size
+        count = 0
+
+        def enter(node, depth):
+            # Rank a node's attributes, which are leaves, on entering it.
+            # Nodes added since the tree was indexed have no rank.
+            nonlocal count
+            rank = order.get(node)
+            if rank is None:
+                return None
+            level[rank] = depth
+            attrs = node.attributes
+            if attrs:
+                for i in range(attrs.length):
+                    r = order[attrs.item(i)]
+                    level[r] = depth + 1
+                    post[r] = count
+                    count += 1
+            return rank
+
+        stack = [(enter(self.root, 0), iter(self.root.childNodes))]
+        while stack:
+            rank, children = stack[-1]
+            for child in children:
+                r = enter(child, level[rank] + 1)
+                if r is None:
+                    continue
+                if child.childNodes:
+                    stack.append((r, iter(child.childNodes)))
+                    break
+                post[r] = count
+                count += 1
+            else:
+                stack.pop()
+                post[rank] = count
+                count += 1
+        # Readers test post, so it is published last.
+        self.nodes = nodes
+        self.level = level
+        self.post = post
+
+
+class _IndexCache(object):
+    # The state of the evaluation running in this thread, as a tuple of the
+    # dicts of the DocumentIndexes it may use, keyed by the roots of the
+    # trees, innermost first; whether it builds the indexes it needs; and
+    # the path keys of the nodes it has ordered without an index.
+
+    def __init__(self):
+        self.local = threading.local()
+
+    @contextmanager
+    def scope(self, mode=False):
+        """Let the block use the indexes of the enclosing block, if any.
+
+        If mode is true, the block builds the indexes it needs, which are
+        kept until the outermost block ends.  If mode is a dict, they are
+        kept in it instead, and those already in it are used.
+
+        """
+        local = self.local
+        outer = getattr(local, "state", None)
+        if outer is None:
+            dicts, keys = ({},), {}
+        else:
+            dicts, _, keys = outer
+        if isinstance(mode, dict):
+            dicts = (mode,) + dicts
+        local.state = (dicts, mode is not False, keys)
+        try:
+            yield
+        finally:
+            local.state = outer
+
+    @contextmanager
+    def restore(self, state):
+        """Run the block in a state returned by current()."""
+        local = self.local
+        outer = getattr(local, "state", None)
+        local.state = state
+        try:
+            yield
+        finally:
+            local.state = outer
+
+    def current(self):
+        """Return the state of the running block, or None."""
+        return getattr(self.local, "state", None)
+
+    def building(self):
+        """Return true if the running block builds the indexes it needs."""
+        state = getattr(self.local, "state", None)
+        return state is not None and state[1]
+
+    def path_keys(self):
+        """Return the path keys of nodes kept by the running block."""
+        state = getattr(self.local, "state", None)
+        return {} if state is None else state[2]
+
+    def get(self, root):
+        state = getattr(self.local, "state", None)
+        if state is None:
+            return None
+        for indexes in state[0]:
+            index = indexes.get(root)
+            if index is not None:
+                return index
+        return None
+
+    def __setitem__(self, root, index):
+        state = getattr(self.local, "state", None)
+        if state is not None:
+            state[0][0][root] = index
+
+
+_document_indexes = _IndexCache()
+
+
+def _tree_root(node):
     if node.nodeType == node.ATTRIBUTE_NODE:
-        order = document_order(node.ownerElement)
-        order.extend((-1, node.name))
-        return order
+        if node.ownerElement is None:
+            return node
+        node = node.ownerElement
+    while node.parentNode is not None:
+        node = node.parentNode
+    return node
 
-    # The document root (hopefully): []
-    if node.parentNode is None:
-        return []
 
-    # Determine which child this is of its parent.
-    sibpos = 0
-    sib = node
-    while sib.previousSibling is not None:
-        sibpos += 1
-        sib = sib.previousSibling
+def _existing_index(node):
+    # The index of the tree containing the node in the running block.
+    root = node if node.nodeType == node.DOCUMENT_NODE else node.ownerDocument
+    index = _document_indexes.get(root) if root is not None else None
+    if index is not None and node in index.order:
+        return index
+
+    # Nodes detached from their document.
+    index = _document_indexes.get(_tree_root(node))
+    if index is not None and node in index.order:
+        return index
+    return None
+
+
+def document_index(node):
+    """Return the DocumentIndex of the tree containing the node, building
+    it if the running evaluation has none.
+
+    """
+    index = _existing_index(node)
+    if index is None:
+        root = _tree_root(node)
+        index = DocumentIndex(root)
+        if _document_indexes.building():
+            _document_indexes[root] = index
+    return index
+
 
-    # Order: parent-order + [sibling-position]
-    order = document_order(node.parentNode)
-    order.append(sibpos)
-    return order
+def usable_index(node):
+    """Return the DocumentIndex of the tree containing the node if the
+    running evaluation has one or builds them, or None.
+
+    """
+    index = _existing_index(node)
+    if index is None and _document_indexes.building():
+        index = document_index(node)
+    return index
+
+
+def named_descendants(node, test, context, build=True):
+    """Return the descendant elements of a node which match a NameTest on
+    the child axis, in document order, using the element index of the
+    document.
+
+    Returns None if the index cannot be used.  Unless build is true, or the
+    index already has the element lists, they are not built.
+
+    """
+    if node.nodeType not in _indexed_node_types:
+        return None
+    name = test.expanded_name(context)
+    if name is None:
+        return None
+    index = usable_index(node) if build else _existing_index(node)
+    if index is None or index.names is None and not build:
+        return None
+    return index.descendant_elements(node, *name)
+
+
+_indexed_node_types = (
+    xml.dom.Node.ELEMENT_NODE,
+    xml.dom.Node.DOCUMENT_NODE,
+    xml.dom.Node.DOCUMENT_FRAGMENT_NODE,
+)
+
+
+def document_order(node):
+    """Compute a document order value for the node.
+
+    cmp(document_order(a), document_order(b)) will return -1, 0, or 1 if
+    a is before, identical to, or after b in the document respectively.
+
+    The value is the rank of the node in the DocumentIndex of its tree.
+
+    """
+    return document_index(node).order[node]
+
+
+def _path_key(node, keys):
+    # The positions of the node and its ancestors among their siblings,
+    # from the root down.  Attributes come before the children of their
+    # element, in the order of the attribute axis.  keys holds the keys
+    # computed before; the children of a node are given keys together.
+    key = keys.get(node)
+    if key is not None:
+        return key
+    if node.nodeType == node.ATTRIBUTE_NODE:
+        owner = node.ownerElement
+        if owner is None:
+            return ()
+        attrs = owner.attributes
+        for i in range(attrs.length):
+            if attrs.item(i) is node:
+                break
+        return _path_key(owner, keys) + (-1, i)
+    parents = []
+    ancestor = node
+    while ancestor not in keys:
+        parent = ancestor.parentNode
+        if parent is None:
+            keys[ancestor] = ()
+            break
+        parents.append(parent)
+        ancestor = parent
+    for parent in reversed(parents):
+        prefix = keys[parent]
+        for i, child in enumerate(parent.childNodes):
+            keys[child] = prefix + (i,)
+    return keys[node]
+
+
+def precedes(a, b):
+    """Return true if node a comes before node b in document order."""
+    index = usable_index(a)
+    if index is not None:
+        order = index.order
+        if b in order:
+            return order[a] < order[b]
+    keys = _document_indexes.path_keys()
+    return _path_key(a, keys) < _path_key(b, keys)
+
+
+def sort_nodeset(nodes):
+    """Sort a list of nodes into document order, in place."""
+    if len(nodes) < 2:
+        return
+    index = usable_index(nodes[0])
+    if index is not None:
+        try:
+            nodes.sort(key=index.order.__getitem__)
+            return
+        except KeyError:
+            # Nodes of other trees.
+            pass
+    keys = _document_indexes.path_keys()
+    nodes.sort(key=lambda node: _path_key(node, keys))
 
 
 #
@@ -185,6 +609,27 @@ class Expr(object):
 
         """
 
+    def iterate(self, node, pos, size, context):
+        """Evaluate a node-set expression, returning an iterator over the
+        resulting nodes in document order.
+
+        Subclasses which can produce nodes lazily override this, so that
+        callers which only need the first node do not evaluate the rest.
+
+        """
+        result = self.evaluate(node, pos, size, context)
+        if not nodesetp(result):
+            raise XPathTypeError("expression is not a node-set")
+        return iter(result)
+
+    def evaluate_boolean(self, node, pos, size, context):
+        """Evaluate the expression and convert the result to a boolean.
+
+        Node-set expressions override this to stop at the first node.
+
+        """
+        return boolean(self.evaluate(node, pos, size, context))
+
 
 class BinaryOperatorExpr(Expr):
     """Base class for all binary operators."""
@@ -210,10 +655,9 @@ class AndExpr(BinaryOperatorExpr):
 
     def evaluate(self, node, pos, size, context):
         # Note that XPath boolean operations short-circuit.
-        return boolean(
-            self.left.evaluate(node, pos, size, context)
-            and boolean(self.right.evaluate(node, pos, size, context))
-        )
+        return self.left.evaluate_boolean(
+            node, pos, size, context
+        ) and self.right.evaluate_boolean(node, pos, size, context)
 
 
 class OrExpr(BinaryOperatorExpr):
@@ -221,10 +665,9 @@ class OrExpr(BinaryOperatorExpr):
 
     def evaluate(self, node, pos, size, context):
         # Note that XPath boolean operations short-circuit.
-        return boolean(
-            self.left.evaluate(node, pos, size, context)
-            or boolean(self.right.evaluate(node, pos, size, context))
-        )
+        return self.left.evaluate_boolean(
+            node, pos, size, context
+        ) or self.right.evaluate_boolean(node, pos, size, context)
 
 
 class EqualityExpr(BinaryOperatorExpr):
@@ -240,30 +683,102 @@ class EqualityExpr(BinaryOperatorExpr):
     }
 
     def operate(self, a, b):
-        if nodesetp(a):
-            for node in a:
-                if self.operate(string_value(node), b):
-                    return True
-            return False
+        return compare(self.op, a, b)
 
+
+def compare(op, a, b):
+    """Compare two values with one of the EqualityExpr operators.
+
+    A comparison involving a node-set is true if it is true for the
+    string-value of some node in the set.
+
+    """
+    if nodesetp(a):
         if nodesetp(b):
-            for node in b:
-                if self.operate(a, string_value(node)):
-                    return True
+            return compare_nodesets(op, a, b)
+        return compare_nodeset(op, a, b, False)
+    if nodesetp(b):
+        return compare_nodeset(op, b, a, True)
+
+    if op in ("=", "!="):
+        if booleanp(a) or booleanp(b):
+            convert = boolean
+        elif numberp(a) or numberp(b):
+            convert = number
+        else:
+            convert = string
+    else:
+        convert = number
+
+    return EqualityExpr.operators[op](convert(a), convert(b))
+
+
+def comparison_conversion(op, value):
+    """Return the conversion applied to the string-values of a node-set
+    compared with a value, and the converted value.  The conversion is
+    None when the string-values are compared as they are.
+
+    """
+    if op in ("=", "!="):
+        if booleanp(value):
+            return boolean, value
+        if numberp(value):
+            return number, number(value)
+        return None, string(value)
+    return number, number(value)
+
+
+def compare_nodeset(op, nodes, value, swap=False):
+    """Compare a node-set with a value which is not a node-set.  If swap
+    is true, the value is the left operand.
+
+    """
+    convert, value = comparison_conversion(op, value)
+    f = EqualityExpr.operators[op]
+    if convert is None:
+        if op == "=":
+            return any(string_value(n) == value for n in nodes)
+        return any(string_value(n) != value for n in nodes)
+    if swap:
+        return any(f(value, convert(string_value(n))) for n in nodes)
+    return any(f(convert(string_value(n)), value) for n in nodes)
+
+
+def compare_nodesets(op, a, b):
+    """Compare two node-sets, computing each string-value only once.
+
+    Equality is tested by looking up the string-values of one set in a hash
+    set of those of the other; the relational operators only need the
+    smallest and largest numbers of each set.
+
+    """
+    if op == "=":
+        if len(a) > len(b):
+            a, b = b, a
+        if not a:
             return False
+        values = set(string_value(n) for n in a)
+        return any(string_value(n) in values for n in b)
 
-        if self.op in ("=", "!="):
-            if booleanp(a) or booleanp(b):
-                convert = boolean
-            elif numberp(a) or numberp(b):
-                convert = number
-            else:
-                convert = string
-        else:
-            convert = number
+    if op == "!=":
+        # Some pair differs unless every node has the same string-value.
+        if not a or not b:
+            return False
+        first = string_value(a[0])
+        return any(string_value(n) != first for n in chain(a, b))
 
-        a, b = convert(a), convert(b)
-        return self.operators[self.op](a, b)
+    # NaN compares false with everything, so it can be left out.
+    xs = [x for x in (number(string_value(n)) for n in a) if x == x]
+    ys = [y for y in (number(string_value(n)) for n in b) if y == y]
+    if not xs or not ys:
+        return False
+    if op == "<":
+        return min(xs) < max(ys)
+    if op == "<=":
+        return min(xs) <= max(ys)
+    if op == ">":
+        return max(xs) > min(ys)
+    return max(xs) >= min(ys)
 
 
 def divop(x, y):
@@ -300,8 +815,13 @@ class UnionExpr(BinaryOperatorExpr):
         if not nodesetp(a) or not nodesetp(b):
             raise XPathTypeError("union operand is not a node-set")
 
-        # Need to sort the result to preserve document order.
-        return sorted(set(chain(a, b)), key=document_order)
+        # Both operands are in document order, so the concatenation is two
+        # sorted runs and the sort below is a linear merge.
+        seen = set(a)
+        result = list(a)
+        result.extend(n for n in b if n not in seen)
+        sort_nodeset(result)
+        return result
 
 
 class NegationExpr(Expr):
@@ -362,6 +882,23 @@ class VariableReference(Expr):
             return "$%s:%s" % (self.prefix, self.name)
 
 
+class BoundVariableReference(VariableReference):
+    """A reference to a variable in a namespace, whose prefix was resolved
+    when the expression was bound to a set of namespace declarations.
+
+    """
+
+    def __init__(self, prefix, name, namespaceURI):
+        VariableReference.__init__(self, prefix, name)
+        self.key = (namespaceURI, name)
+
+    def evaluate(self, node, pos, size, context):
+        try:
+            return context.variables[self.key]
+        except KeyError:
+            raise XPathUnknownVariableError(str(self))
+
+
 class Function(Expr):
     """Functions."""
 
@@ -385,7 +922,9 @@ class Function(Expr):
     # parameters.
     #
 
-    def function(minargs, maxargs, implicit=False, first=False, convert=None):
+    def function(
+        minargs, maxargs, implicit=False, first=False, convert=None, rtype=None
+    ):
         """Function decorator.
 
         minargs -- Minimum number of arguments taken by the function.
@@ -394,12 +933,21 @@ class Function(Expr):
                     of the current context node when passed no argument.
                     (e.g., string() and number().)
         convert -- When non-None, a function used to filter function arguments.
+        rtype -- The type of the function result, as returned by expr_type().
         """
 
         def decorator(f):
             def new_f(self, node, pos, size, context):
                 if implicit and len(self.args) == 0:
                     args = [[node]]
+                elif convert is boolean:
+                    # Node-set arguments only need to be tested for
+                    # emptiness.
+                    args = [
+                        x.evaluate_boolean(node, pos, size, context)
+                        for x in self.args
+                    ]
+                    return f(self, node, pos, size, context, *args)
                 else:
                     args = [x.evaluate(node, pos, size, context) for x in self.args]
                 if first:
@@ -414,6 +962,11 @@ class Function(Expr):
 
             new_f.minargs = minargs
             new_f.maxargs = maxargs
+            new_f.rtype = rtype
+            new_f.implicit = implicit
+            new_f.first = first
+            new_f.convert = convert
+            new_f.function = f
             new_f.__name__ = f.__name__
             new_f.__doc__ = f.__doc__
             return new_f
@@ -422,19 +975,19 @@ class Function(Expr):
 
     # Node Set Functions
 
-    @function(0, 0)
+    @function(0, 0, rtype="number")
     def f_last(self, node, pos, size, context):
         return size
 
-    @function(0, 0)
+    @function(0, 0, rtype="number")
     def f_position(self, node, pos, size, context):
         return pos
 
-    @function(1, 1, convert=nodeset)
+    @function(1, 1, convert=nodeset, rtype="number")
     def f_count(self, node, pos, size, context, nodes):
         return len(nodes)
 
-    @function(1, 1)
+    @function(1, 1, rtype="node-set")
     def f_id(self, node, pos, size, context, arg):
         if nodesetp(arg):
             ids = (string_value(x) for x in arg)
@@ -444,7 +997,7 @@ class Function(Expr):
             node = node.ownerDocument
         return list([_f for _f in (node.getElementById(id) for id in ids) if _f])
 
-    @function(0, 1, implicit=True, first=True)
+    @function(0, 1, implicit=True, first=True, rtype="string")
     def f_local_name(self, node, pos, size, context, argnode):
         if argnode is None:
             return ""
@@ -457,13 +1010,13 @@ class Function(Expr):
             return argnode.target
         return ""
 
-    @function(0, 1, implicit=True, first=True)
+    @function(0, 1, implicit=True, first=True, rtype="string")
     def f_namespace_uri(self, node, pos, size, context, argnode):
         if argnode is None:
             return ""
         return argnode.namespaceURI
 
-    @function(0, 1, implicit=True, first=True)
+    @function(0, 1, implicit=True, first=True, rtype="string")
     def f_name(self, node, pos, size, context, argnode):
         if argnode is None:
             return ""
@@ -477,37 +1030,37 @@ class Function(Expr):
 
     # String Functions
 
-    @function(0, 1, implicit=True, convert=string)
+    @function(0, 1, implicit=True, convert=string, rtype="string")
     def f_string(self, node, pos, size, context, arg):
         return arg
 
-    @function(2, None, convert=string)
+    @function(2, None, convert=string, rtype="string")
     def f_concat(self, node, pos, size, context, *args):
         return "".join((x for x in args))
 
-    @function(2, 2, convert=string)
+    @function(2, 2, convert=string, rtype="boolean")
     def f_starts_with(self, node, pos, size, context, a, b):
         return a.startswith(b)
 
-    @function(2, 2, convert=string)
+    @function(2, 2, convert=string, rtype="boolean")
     def f_contains(self, node, pos, size, context, a, b):
         return b in a
 
-    @function(2, 2, convert=string)
+    @function(2, 2, convert=string, rtype="string")
     def f_substring_before(self, node, pos, size, context, a, b):
         try:
             return a[0 : a.index(b)]
         except ValueError:
             return ""
 
-    @function(2, 2, convert=string)
+    @function(2, 2, convert=string, rtype="string")
     def f_substring_after(self, node, pos, size, context, a, b):
         try:
             return a[a.index(b) + len(b) :]
         except ValueError:
             return ""
 
-    @function(2, 3)
+    @function(2, 3, rtype="string")
     def f_substring(self, node, pos, size, context, s, start, count=None):
         s = string(s)
         start = _round(number(start))
@@ -533,15 +1086,15 @@ class Function(Expr):
             return ""
         return s[int(start) - 1 : int(end) - 1]
 
-    @function(0, 1, implicit=True, convert=string)
+    @function(0, 1, implicit=True, convert=string, rtype="number")
     def f_string_length(self, node, pos, size, context, s):
         return len(s)
 
-    @function(0, 1, implicit=True, convert=string)
+    @function(0, 1, implicit=True, convert=string, rtype="string")
     def f_normalize_space(self, node, pos, size, context, s):
         return re.sub(r"\s+", " ", s.strip())
 
-    @function(3, 3, convert=lambda x: str(string(x)))
+    @function(3, 3, convert=lambda x: str(string(x)), rtype="string")
     def f_translate(self, node, pos, size, context, s, source, target):
         # str.translate() and unicode.translate() are completely different.
         # The translate() arguments are coerced to unicode.
@@ -559,23 +1112,23 @@ class Function(Expr):
 
     # Boolean functions
 
-    @function(1, 1, convert=boolean)
+    @function(1, 1, convert=boolean, rtype="boolean")
     def f_boolean(self, node, pos, size, context, b):
         return b
 
-    @function(1, 1, convert=boolean)
+    @function(1, 1, convert=boolean, rtype="boolean")
     def f_not(self, node, pos, size, context, b):
         return not b
 
-    @function(0, 0)
+    @function(0, 0, rtype="boolean")
     def f_true(self, node, pos, size, context):
         return True
 
-    @function(0, 0)
+    @function(0, 0, rtype="boolean")
     def f_false(self, node, pos, size, context):
         return False
 
-    @function(1, 1, convert=string)
+    @function(1, 1, convert=string, rtype="boolean")
     def f_lang(self, node, pos, size, context, s):
         s = s.lower()
         for n in axes["ancestor-or-self"](node):
@@ -588,23 +1141,23 @@ class Function(Expr):
 
     # Number functions
 
-    @function(0, 1, implicit=True, convert=number)
+    @function(0, 1, implicit=True, convert=number, rtype="number")
     def f_number(self, node, pos, size, context, n):
         return n
 
-    @function(1, 1, convert=nodeset)
+    @function(1, 1, convert=nodeset, rtype="number")
     def f_sum(self, node, pos, size, context, nodes):
         return sum((number(string_value(x)) for x in nodes))
 
-    @function(1, 1, convert=number)
+    @function(1, 1, convert=number, rtype="number")
     def f_floor(self, node, pos, size, context, n):
         return math.floor(n)
 
-    @function(1, 1, convert=number)
+    @function(1, 1, convert=number, rtype="number")
     def f_ceiling(self, node, pos, size, context, n):
         return math.ceil(n)
 
-    @function(1, 1, convert=number)
+    @function(1, 1, convert=number, rtype="number")
     def f_round(self, node, pos, size, context, n):
         # XXX round(-0.0) should be -0.0, not 0.0.
         # XXX round(-1.5) should be -1.0, not -2.0.
@@ -648,9 +1201,17 @@ def make_axes():
 
     @axisfn()
     def descendant(node):
-        for child in node.childNodes:
-            for node in descendant_or_self(child):
-                yield node
+        # Preorder walk with a stack of child iterators, so that the cost
+        # per node does not grow with its depth.
+        stack = [iter(node.childNodes)]
+        while stack:
+            for child in stack[-1]:
+                yield child
+                if child.childNodes:
+                    stack.append(iter(child.childNodes))
+                    break
+            else:
+                stack.pop()
 
     @axisfn()
     def parent(node):
@@ -680,8 +1241,10 @@ def make_axes():
         while node is not None:
             while node.nextSibling is not None:
                 node = node.nextSibling
-                for n in descendant_or_self(node):
-                    yield n
+                yield node
+                if node.childNodes:
+                    for n in descendant(node):
+                        yield n
             node = node.parentNode
 
     @axisfn(reverse=True)
@@ -689,15 +1252,33 @@ def make_axes():
         while node is not None:
             while node.previousSibling is not None:
                 node = node.previousSibling
-                # Could be more efficient here.
-                for n in reversed(list(descendant_or_self(node))):
-                    yield n
+                if node.childNodes:
+                    for n in reverse_descendant_or_self(node):
+                        yield n
+                else:
+                    yield node
             node = node.parentNode
 
+    def reverse_descendant_or_self(node):
+        # The nodes of a subtree in reverse document order: a postorder
+        # walk taking the children from last to first.
+        stack = [(node, reversed(node.childNodes))]
+        while stack:
+            parent, children = stack[-1]
+            for child in children:
+                if child.childNodes:
+                    stack.append((child, reversed(child.childNodes)))
+                    break
+                yield child
+            else:
+                stack.pop()
+                yield parent
+
     @axisfn(principal_node_type=xml.dom.Node.ATTRIBUTE_NODE)
     def attribute(node):
-        if node.attributes is not None:
-            return (node.attributes.item(i) for i in range(node.attributes.length))
+        attrs = node.attributes
+        if attrs is not None:
+            return (attrs.item(i) for i in range(attrs.length))
         return ()
 
     @axisfn()
@@ -711,9 +1292,8 @@ def make_axes():
     @axisfn()
     def descendant_or_self(node):
         yield node
-        for child in node.childNodes:
-            for node in descendant_or_self(child):
-                yield node
+        for n in descendant(node):
+            yield n
 
     @axisfn(reverse=True)
     def ancestor_or_self(node):
@@ -721,39 +1301,47 @@ def make_axes():
 
     # Place each axis function defined here into the 'axes' dict.
     for axis in list(locals().values()):
-        axes[axis.__name__] = axis
+        if hasattr(axis, "principal_node_type"):
+            axes[axis.__name__] = axis
 
 
 make_axes()
 
 
-def merge_into_nodeset(target, source, dontsort=False):
+def merge_into_nodeset(target, source, dontsort=False, seen=None):
     """Place all the nodes from the source node-set into the target
     node-set, preserving document order.  Both node-sets must be in
     document order to begin with.
     If dontsort is True the resulting list isn't sorted, but in stead a True
     value is returned to indicate sorting needs to be done later.
+    If seen is not None it must be a set containing the nodes of target; it
+    is kept up to date, so that merging many node-sets into one target only
+    costs a hash lookup per node.
     """
+    if seen is None:
+        seen = set(target)
     if len(target) == 0:
         target.extend(source)
+        seen.update(target)
         return
 
-    source = [n for n in source if n not in target]
+    source = [n for n in source if n not in seen]
     if len(source) == 0:
         return
+    seen.update(source)
 
     # If the last node in the target set comes before the first node in the
     # source set, then we can just concatenate the sets.  Otherwise, we
     # will need to sort.  (We could also check to see if the last node in
     # the source set comes before the first node in the target set, but this
     # situation is very unlikely in practice.)
-    if document_order(target[-1]) < document_order(source[0]):
+    if precedes(target[-1], source[0]):
         target.extend(source)
     else:
         target.extend(source)
         if dontsort:
             return True
-        target.sort(key=document_order)
+        sort_nodeset(target)
 
 
 class AbsolutePathExpr(Expr):
@@ -769,6 +1357,16 @@ class AbsolutePathExpr(Expr):
             return [node]
         return self.path.evaluate(node, 1, 1, context)
 
+    def iterate(self, node, pos, size, context):
+        if node.nodeType != node.DOCUMENT_NODE:
+            node = node.ownerDocument
+        if self.path is None:
+            return iter([node])
+        return self.path.iterate(node, 1, 1, context)
+
+    def evaluate_boolean(self, node, pos, size, context):
+        return nonempty(self.iterate(node, pos, size, context))
+
     def __str__(self):
         return "/%s" % (self.path or "")
 
@@ -785,30 +1383,541 @@ class PathExpr(Expr):
         # unimportant.  If there are other steps, however, it must be a
         # node-set.
         result = self.steps[0].evaluate(node, pos, size, context)
-        if len(self.steps) > 1 and not nodesetp(result):
+        if len(self.steps) == 1:
+            return result
+        if not nodesetp(result):
             raise XPathTypeError("path step is not a node-set")
+        return evaluate_steps(
+            result,
+            [(s.evaluate, nodeset_axis(s), nodeset_filter(s)) for s in self.steps[1:]],
+            context,
+            ordered=step_axis(self.steps[0]) is not None,
+        )
 
-        # Subsequent steps are evaluated for each node in the node-set
-        # resulting from the previous step.
-        needSort = False
-        for step in self.steps[1:]:
-            aggregate = []
-            for i in range(len(result)):
-                nodes = step.evaluate(result[i], i + 1, len(result), context)
-                if not nodesetp(nodes):
-                    raise XPathTypeError("path step is not a node-set")
-                needSortNow = merge_into_nodeset(aggregate, nodes, dontsort=True)
-                needSort = needSort or needSortNow
-            result = aggregate
-
-        if needSort:
-            result.sort(key=document_order)
-        return result
+    def iterate(self, node, pos, size, context):
+        if len(self.steps) == 1:
+            return self.steps[0].iterate(node, pos, size, context)
+        plan = self.stream_plan()
+        if not plan:
+            return iter(self.evaluate(node, pos, size, context))
+
+        if step_axis(self.steps[0]) is None:
+            nodes = self.steps[0].iterate(node, pos, size, context)
+        else:
+            nodes = iter([node])
+        for stage, step in plan:
+            if stage == "descendants":
+                nodes = stream_descendants(step.filter, nodes, context)
+            elif stage == "children":
+                nodes = stream_children(step.iterate, nodes, context)
+            else:
+                nodes = stream_each(step.iterate, nodes, context)
+        return nodes
+
+    def evaluate_boolean(self, node, pos, size, context):
+        if len(self.steps) == 1:
+            return self.steps[0].evaluate_boolean(node, pos, size, context)
+        return nonempty(self.iterate(node, pos, size, context))
+
+    def stream_plan(self):
+        """Plan the lazy evaluation of the path.
+
+        The nodes selected by one step may be fed to the next step one at
+        a time only if the results come out in document order.  This is
+        the case for forward axis steps as long as no context node is an
+        ancestor of another ("flat" node-sets), which holds for the
+        results of child and attribute steps.
+
+        Child steps applied to node-sets which are not flat can still be
+        fed one node at a time, if the results for each node are held
+        back until the subtrees of the nodes which follow it have been
+        passed; see stream_children().
+
+        Returns a list of (stage, step) pairs, or an empty list if the path
+        must be evaluated eagerly.  The stage is "descendants" if the step
+        is a descendant step, or a child step following a
+        descendant-or-self::node() step, and is applied to all descendants
+        of each node at once; "children" if it is a child step applied to
+        a node-set which is not flat; and "each" otherwise.
+
+        """
+        if self._stream_plan is not None:
+            return self._stream_plan
+
+        plan = []
+        if step_axis(self.steps[0]) is None:
+            # A filter expression; its result is in document order, but
+            # nothing more is known about it.
+            flat = False
+            steps = self.steps[1:]
+        else:
+            # Axis steps do not depend on the context position and size, so
+            # the first step can be planned like the others, starting from
+            # the context node.
+            flat = True
+            steps = self.steps
+        i = 0
+        while i < len(steps):
+            step = steps[i]
+            axis = step_axis(step)
+            if axis is None:
+                plan = []
+                break
+            if (
+                flat
+                and axis == "descendant-or-self"
+                and isinstance(step, AxisStep)
+                and isinstance(step.test, AnyKindTest)
+                and i + 1 < len(steps)
+                and step_axis(steps[i + 1]) == "child"
+                and steps[i + 1].streamable
+            ):
+                # //name: select the matching descendants directly.
+                plan.append(("descendants", steps[i + 1]))
+                flat = False
+                i += 2
+                continue
+            if flat and axis == "descendant" and step.streamable:
+                plan.append(("descendants", step))
+                flat = False
+                i += 1
+                continue
+            stage = "each"
+            if axis == "attribute":
+                flat = True
+            elif axis in ("descendant", "descendant-or-self"):
+                if not flat:
+                    plan = []
+                    break
+                flat = False
+            elif axis == "child":
+                if not flat:
+                    stage = "children"
+            elif axis != "self":
+                plan = []
+                break
+            plan.append((stage, step))
+            i += 1
+
+        self._stream_plan = plan
+        return plan
+
+    _stream_plan = None
 
     def __str__(self):
         return "/".join((str(s) for s in self.steps))
 
 
+def evaluate_steps(result, steps, context, ordered=True):
+    """Evaluate the steps of a location path which follow the first one.
+
+    'result' is the node-set selected by the first step, and 'steps' is a
+    list of (evaluate, axis, filter) triples: evaluate(node, pos, size,
+    context) evaluates the step for one context node, and axis and filter
+    are the values of nodeset_axis() and nodeset_filter() for the step.
+    Unless 'ordered' is true, 'result' may not be in document order or may
+    contain duplicates.
+
+    """
+    for evaluate, axis, filter in steps:
+        nodes = None
+        if ordered and axis is not None and len(result) > 1:
+            nodes = evaluate_nodeset(evaluate, axis, filter, result, context)
+        if nodes is None:
+            nodes = evaluate_each(evaluate, result, context)
+        result = nodes
+        ordered = True
+    return result
+
+
+def evaluate_each(evaluate, nodes, context):
+    """Evaluate a step for each node of a node-set, merging the results."""
+    result = []
+    seen = set()
+    needSort = False
+    size = len(nodes)
+    for i in range(size):
+        found = evaluate(nodes[i], i + 1, size, context)
+        if not nodesetp(found):
+            raise XPathTypeError("path step is not a node-set")
+        if merge_into_nodeset(result, found, dontsort=True, seen=seen):
+            needSort = True
+    if needSort:
+        sort_nodeset(result)
+    return result
+
+
+#
+# Set-at-a-time evaluation of location steps.
+#
+# Evaluating a step for every node of a node-set and merging the results one
+# at a time costs a membership test for every node found, and document order
+# lookups for every context node.  For axis steps, the union can instead be
+# built from the results of a few "root" context nodes: the outermost nodes
+# for the descendant axes, the first or last node under each parent for the
+# sibling axes, and a single node for the following and preceding axes.
+# These results are disjoint, so they are simply concatenated, and only
+# need sorting if roots nested in each other produced them out of order.
+#
+# Selecting fewer roots than context nodes changes the proximity positions
+# seen by predicates, so these axes are only evaluated this way for steps
+# without positional predicates.
+#
+
+
+def nodeset_axis(step):
+    """Return the name of the axis of a location step if evaluate_steps()
+    may evaluate the step for a whole node-set at once, or None.
+
+    """
+    if isinstance(step, GroupedStep):
+        # The groups under each parent are the same from any ancestor, so
+        # only the outermost context nodes are needed.
+        return "descendant"
+    axis = step_axis(step)
+    if axis in _pruning_roots and isinstance(step, PredicateList):
+        if step.positional:
+            return None
+    return axis
+
+
+def nodeset_filter(step):
+    """Return the filter() function of a location step if it may be
+    applied to the nodes found by a structural join, or None.
+
+    """
+    if isinstance(step, AxisStep):
+        return step.filter
+    if (
+        isinstance(step, PredicateList)
+        and isinstance(step.expr, AxisStep)
+        and not step.positional
+    ):
+        return step.filter
+    return None
+
+
+def evaluate_nodeset(evaluate, axis, filter, nodes, context):
+    """Evaluate an axis step for every node of a node-set in document order,
+    given the step's evaluate() function, the name of its axis, and its
+    filter() function or None.  Returns the union of the results, in
+    document order, or None if the node-set contains attributes which
+    prevent this.
+
+    """
+    roots = _pruning_roots.get(axis)
+    if roots is not None or axis == "child":
+        # The child and descendant axes of an attribute are its text,
+        # which is not ranked in document order.
+        for node in nodes:
+            if node.nodeType == node.ATTRIBUTE_NODE:
+                return None
+        if roots is not None:
+            nodes = roots(nodes)
+
+    join = _structural_joins.get(axis)
+    if join is not None and filter is not None:
+        found = join(nodes)
+        if found is not None:
+            return list(filter(found, context))
+
+    if axis in _overlapping_axes:
+        result = []
+        seen = set()
+        for node in nodes:
+            for n in evaluate(node, 1, 1, context):
+                if n not in seen:
+                    seen.add(n)
+                    result.append(n)
+        sort_nodeset(result)
+        return result
+
+    result = []
+    if axis in _ordered_axes:
+        for node in nodes:
+            result.extend(evaluate(node, 1, 1, context))
+        return result
+
+    needSort = False
+    for node in nodes:
+        found = evaluate(node, 1, 1, context)
+        if found:
+            if result and not needSort:
+                needSort = precedes(found[0], result[-1])
+            result.extend(found)
+    if needSort:
+        sort_nodeset(result)
+    return result
+
+
+def _outermost(nodes):
+    # The nodes which are not descendants of other nodes of the set.
+    index = usable_index(nodes[0])
+    if index is not None:
+        roots = []
+        order = index.order
+        end = -1
+        for node in nodes:
+            rank = order.get(node)
+            if rank is None:
+                # Nodes of other trees.
+                break
+            if rank >= end:
+                roots.append(node)
+                end = index.subtree_end(node)
+        else:
+            return roots
+    roots = []
+    outer = set()
+    for node in nodes:
+        parent = node.parentNode
+        while parent is not None and parent not in outer:
+            parent = parent.parentNode
+        if parent is None:
+            outer.add(node)
+            roots.append(node)
+    return roots
+
+
+def _first_to_end(nodes):
+    # The node whose subtree ends first, and so has all the others'
+    # following nodes on its own following axis: the last of the nodes
+    # from the first one on which are each a descendant of the previous
+    # one.  Any other node starts after the subtree of the previous one.
+    first = nodes[0]
+    for node in nodes[1:]:
+        parent = node.parentNode
+        while parent is not None and parent is not first:
+            parent = parent.parentNode
+        if parent is None:
+            break
+        first = node
+    return [first]
+
+
+def _last(nodes):
+    # All the preceding nodes of the others are also before the last node,
+    # without being its ancestors.
+    return nodes[-1:]
+
+
+def _first_under_parent(nodes):
+    roots = []
+    parents = set()
+    for node in nodes:
+        parent = node.parentNode
+        if parent is not None and parent not in parents:
+            parents.add(parent)
+            roots.append(node)
+    return roots
+
+
+def _last_under_parent(nodes):
+    roots = _first_under_parent(reversed(nodes))
+    roots.reverse()
+    return roots
+
+
+#
+# Structural joins.
+#
+# Using the region encoding of the document, the nodes along the descendant,
+# following and preceding axes of the roots are slices of the list of nodes
+# in document order, and the ancestors of a node-set are found by climbing
+# from each node only until an ancestor found before.  The node test and
+# predicates of the step are applied to the result as a whole, so the cost
+# is linear in the sizes of the context node-set and of the result.
+#
+# The joins return None if the roots are not all ranked in the same index,
+# in which case the step is evaluated for each root.
+#
+
+
+def _regions(roots):
+    # The index of the roots, with its region encoding, and their ranks.
+    index = usable_index(roots[0])
+    if index is None:
+        return None, None
+    if index.post is None:
+        index.regions()
+    order = index.order
+    post = index.post
+    ranks = []
+    for node in roots:
+        rank = order.get(node)
+        if rank is None or post[rank] is None:
+            return None, None
+        ranks.append(rank)
+    return index, ranks
+
+
+def _without_attributes(nodes):
+    ATTRIBUTE_NODE = xml.dom.Node.ATTRIBUTE_NODE
+    return [n for n in nodes if n.nodeType != ATTRIBUTE_NODE]
+
+
+def _join_descendant(roots, self=False):
+    index, ranks = _regions(roots)
+    if index is None:
+        return None
+    nodes = index.nodes
+    post = index.post
+    level = index.level
+    result = []
+    for node, rank in zip(roots, ranks):
+        if self:
+            result.append(node)
+        result.extend(_without_attributes(nodes[rank + 1 : post[rank] + level[rank] + 1]))
+    return result
+
+
+def _join_descendant_or_self(roots):
+    return _join_descendant(roots, True)
+
+
+def _join_following(roots):
+    index, ranks = _regions(roots)
+    if index is None:
+        return None
+    (rank,) = ranks
+    return _without_attributes(index.nodes[index.post[rank] + index.level[rank] + 1 :])
+
+
+def _join_preceding(roots):
+    index, ranks = _regions(roots)
+    if index is None:
+        return None
+    (node,) = roots
+    ancestors = set(axes["ancestor"](node))
+    return [n for n in _without_attributes(index.nodes[: ranks[0]]) if n not in ancestors]
+
+
+def _join_ancestor(nodes, self=False):
+    # Each node's ancestors which are not ancestors of an earlier node come
+    # after every node found before, so the result needs no sorting.  The
+    # parent of an attribute is None in the DOM, so attributes have no
+    # ancestors.
+    result = []
+    seen = set()
+    for node in nodes:
+        chain = []
+        if self:
+            seen.add(node)
+            chain.append(node)
+        node = node.parentNode
+        while node is not None and node not in seen:
+            seen.add(node)
+            chain.append(node)
+            node = node.parentNode
+        chain.reverse()
+        result.extend(chain)
+    return result
+
+
+def _join_ancestor_or_self(nodes):
+    return _join_ancestor(nodes, True)
+
+
+_structural_joins = {
+    "descendant": _join_descendant,
+    "descendant-or-self": _join_descendant_or_self,
+    "following": _join_following,
+    "preceding": _join_preceding,
+    "ancestor": _join_ancestor,
+    "ancestor-or-self": _join_ancestor_or_self,
+}
+
+
+# Axes whose results from distinct roots may overlap.
+_overlapping_axes = frozenset(["parent", "ancestor", "ancestor-or-self"])
+
+# Axes whose results from the roots come out in document order.
+_ordered_axes = frozenset(
+    ["attribute", "self", "descendant", "descendant-or-self", "following", "preceding"]
+)
+
+# How to choose the roots of axes which don't use every context node.
+_pruning_roots = {
+    "descendant": _outermost,
+    "descendant-or-self": _outermost,
+    "following": _first_to_end,
+    "preceding": _last,
+    "following-sibling": _first_under_parent,
+    "preceding-sibling": _last_under_parent,
+}
+
+
+def stream_each(iterate, nodes, context):
+    """Lazily apply a step, given its iterate() function, to each node."""
+    for node in nodes:
+        for n in iterate(node, 1, 1, context):
+            yield n
+
+
+def stream_children(iterate, nodes, context):
+    """Lazily apply a child step, given its iterate() function, to each
+    node of a node-set in document order in which some nodes may be
+    descendants of others, producing the results in document order.
+
+    The children found for a node are held back at the first one which
+    follows the next node, and resumed once the subtree of that node has
+    been passed, so only the pending children of the ancestors of the
+    current node are kept.
+
+    """
+    # [node, children, pending] for the nodes which are ancestors of the
+    # current one, innermost last.
+    stack = []
+    for node in nodes:
+        if stack:
+            ancestors = set()
+            parent = node.parentNode
+            while parent is not None:
+                ancestors.add(parent)
+                parent = parent.parentNode
+            while stack and stack[-1][0] not in ancestors:
+                _, children, pending = stack.pop()
+                if pending is not None:
+                    yield pending
+                for n in children:
+                    yield n
+            if stack:
+                entry = stack[-1]
+                children = entry[1]
+                pending = entry[2]
+                if pending is None:
+                    pending = next(children, None)
+                while pending is not None and not precedes(node, pending):
+                    yield pending
+                    pending = next(children, None)
+                entry[2] = pending
+        stack.append([node, iterate(node, 1, 1, context), None])
+    while stack:
+        _, children, pending = stack.pop()
+        if pending is not None:
+            yield pending
+        for n in children:
+            yield n
+
+
+def stream_descendants(filter, nodes, context):
+    """Lazily apply a step, given its filter() function, to the
+    descendants of each node.
+
+    """
+    descendant = axes["descendant"]
+    for node in nodes:
+        for n in filter(descendant(node), context):
+            yield n
+
+
+def nonempty(nodes):
+    """Return true iff the iterator 'nodes' produces at least one node."""
+    for n in nodes:
+        return True
+    return False
+
+
 class PredicateList(Expr):
     """A list of predicates.
 
@@ -822,18 +1931,104 @@ class PredicateList(Expr):
         self.expr = expr
         self.axis = axes[axis]
 
+        # Predicates which never select by position can be applied to nodes
+        # as they are produced.
+        self.positional = not all(
+            expr_type(p) in ("node-set", "boolean", "string")
+            and not uses_position(p)
+            for p in predicates
+        )
+        self.streamable = not self.axis.reverse and not self.positional
+        self.selectors = [
+            predicate_selector(p, p.evaluate, p.evaluate_boolean)
+            for p in predicates
+        ]
+
     def evaluate(self, node, pos, size, context):
-        result = self.expr.evaluate(node, pos, size, context)
-        if not nodesetp(result):
-            raise XPathTypeError("predicate input is not a node-set")
+        if isinstance(self.expr, AxisStep):
+            # Walk the axis directly, yielding nodes in proximity order
+            # (reverse document order for reverse axes).
+            nodes = self.expr.filter(self.expr.axis(node), context)
+        else:
+            nodes = self.expr.evaluate(node, pos, size, context)
+            if not nodesetp(nodes):
+                raise XPathTypeError("predicate input is not a node-set")
 
+        result = apply_predicates(nodes, self.selectors, context)
         if self.axis.reverse:
             result.reverse()
+        return result
+
+    def iterate(self, node, pos, size, context):
+        if not self.streamable:
+            return iter(self.evaluate(node, pos, size, context))
+        return stream_predicates(
+            self.expr.iterate(node, pos, size, context),
+            [p.evaluate_boolean for p in self.predicates],
+            context,
+        )
+
+    def evaluate_boolean(self, node, pos, size, context):
+        return nonempty(self.iterate(node, pos, size, context))
+
+    def filter(self, nodes, context):
+        """Return an iterator over the candidate nodes which pass the
+        node test of the wrapped axis step and the predicates.  Only valid
+        for streamable predicates on an AxisStep.
+
+        """
+        return stream_predicates(
+            self.expr.filter(nodes, context),
+            [p.evaluate_boolean for p in self.predicates],
+            context,
+        )
+
+    def __str__(self):
+        s = str(self.expr)
+        if "/" in s:
+            s = "(%s)" % s
+        return s + "".join(("[%s]" % x for x in self.predicates))
+
+
+def predicate_selector(pred, evaluate, evaluate_boolean):
+    """Classify a predicate for apply_predicates().
 
-        for pred in self.predicates:
-            match = []
-            for i, node in zip(count(1), result):
-                r = pred.evaluate(node, i, len(result), context)
+    Returns a (kind, value) pair.  Predicates such as [1], [last()] and
+    [position() = 2] select a node by a constant position, and don't need
+    to be evaluated for every node: ("position", position).  Predicates
+    which cannot evaluate to a number only need their boolean value:
+    ("test", evaluate_boolean).  Other predicates: ("value", evaluate).
+
+    """
+    position = constant_position(pred)
+    if position is not None:
+        return ("position", position)
+    if expr_type(pred) in ("node-set", "boolean", "string"):
+        return ("test", evaluate_boolean)
+    return ("value", evaluate)
+
+
+def apply_predicates(nodes, selectors, context):
+    """Filter an iterable of nodes, in proximity order, through the
+    predicate selectors returned by predicate_selector().  Returns a list.
+
+    """
+    for kind, pred in selectors:
+        if kind == "position":
+            nodes = select_position(nodes, pred)
+            continue
+
+        if not isinstance(nodes, list):
+            nodes = list(nodes)
+        size = len(nodes)
+        match = []
+        if kind == "test":
+            for i, node in zip(count(1), nodes):
+                if pred(node, i, size, context):
+                    match.append(node)
+        else:
+            for i, node in zip(count(1), nodes):
+                r = pred(node, i, size, context)
 
                 # If a predicate evaluates to a number, select the node
                 # with that position.  Otherwise, select nodes for which
@@ -843,23 +2038,31 @@ class PredicateList(Expr):
                         match.append(node)
                 elif boolean(r):
                     match.append(node)
-            result = match
+        nodes = match
 
-        if self.axis.reverse:
-            result.reverse()
+    if not isinstance(nodes, list):
+        nodes = list(nodes)
+    return nodes
 
-        return result
 
-    def __str__(self):
-        s = str(self.expr)
-        if "/" in s:
-            s = "(%s)" % s
-        return s + "".join(("[%s]" % x for x in self.predicates))
+def stream_predicates(nodes, tests, context):
+    """Lazily filter nodes through the evaluate_boolean() functions of
+    predicates which do not depend on the context position or size.
+
+    """
+    for node in nodes:
+        for test in tests:
+            if not test(node, None, None, context):
+                break
+        else:
+            yield node
 
 
 class AxisStep(Expr):
     """One step in a location path expression."""
 
+    streamable = True
+
     def __init__(self, axis, test=None, predicates=None):
         if test is None:
             test = AnyKindTest()
@@ -867,20 +2070,338 @@ class AxisStep(Expr):
         self.test = test
 
     def evaluate(self, node, pos, size, context):
-        match = []
-        for n in self.axis(node):
-            if self.test.match(n, self.axis, context):
-                match.append(n)
+        match = self.test.matcher(self.axis, context)
+        result = [n for n in self.axis(node) if match(n)]
 
         if self.axis.reverse:
-            match.reverse()
+            result.reverse()
 
-        return match
+        return result
+
+    def iterate(self, node, pos, size, context):
+        if self.axis.reverse:
+            return iter(self.evaluate(node, pos, size, context))
+        return self.filter(self.axis(node), context)
+
+    def evaluate_boolean(self, node, pos, size, context):
+        return nonempty(self.iterate(node, pos, size, context))
+
+    def filter(self, nodes, context):
+        """Return an iterator over the candidate nodes which pass the node
+        test, as if they had been found along this step's axis.
+
+        """
+        match = self.test.matcher(self.axis, context)
+        return (n for n in nodes if match(n))
 
     def __str__(self):
         return "%s::%s" % (self.axis.__name__, self.test)
 
 
+class GroupedStep(Expr):
+    """descendant-or-self::node()/<step>, for a child step with positional
+    predicates.
+
+    The positions seen by the predicates of a child step count the
+    children of one parent, so the step is evaluated as a descendant step
+    whose nodes are grouped by parent before the predicates are applied.
+
+    """
+
+    def __init__(self, step):
+        self.step = step
+        self.descendant = AxisStep("descendant", step.expr.test)
+
+    def evaluate(self, node, pos, size, context):
+        nodes = self.descendant.evaluate(node, pos, size, context)
+        return apply_grouped_predicates(nodes, self.step.selectors, context)
+
+    def __str__(self):
+        return "descendant-or-self::node()/%s" % self.step
+
+
+class InvariantExpr(Expr):
+    """A subexpression of a predicate, or of a later step of a path, whose
+    value does not depend on the context node, position or size.
+
+    It is evaluated once in each evaluation of the enclosing InvariantScope
+    rather than for every node.  If it depends on the document, its value
+    is kept for each document.
+
+    """
+
+    def __init__(self, expr):
+        self.expr = expr
+        self.document = DOCUMENT in dependencies(expr)
+
+    def evaluate(self, node, pos, size, context):
+        values = context.invariants
+        if values is None:
+            return self.expr.evaluate(node, pos, size, context)
+        key = self
+        if self.document:
+            if node.nodeType == node.DOCUMENT_NODE:
+                key = (self, node)
+            else:
+                key = (self, node.ownerDocument)
+        try:
+            return values[key]
+        except KeyError:
+            value = values[key] = self.expr.evaluate(node, pos, size, context)
+            return value
+
+    def __str__(self):
+        return str(self.expr)
+
+
+class InvariantScope(Expr):
+    """The root of an expression holding InvariantExprs, which evaluates
+    the expression with a copy of the context keeping their values.
+
+    """
+
+    def __init__(self, expr):
+        self.expr = expr
+
+    def evaluate(self, node, pos, size, context):
+        return self.expr.evaluate(node, pos, size, invariant_scope(context))
+
+    def iterate(self, node, pos, size, context):
+        return self.expr.iterate(node, pos, size, invariant_scope(context))
+
+    def evaluate_boolean(self, node, pos, size, context):
+        return self.expr.evaluate_boolean(node, pos, size, invariant_scope(context))
+
+    def __str__(self):
+        return str(self.expr)
+
+
+def invariant_scope(context):
+    """Return a shallow copy of a context, with an empty dictionary of the
+    values of InvariantExprs.
+
+    """
+    context = copy.copy(context)
+    context.invariants = {}
+    return context
+
+
+def apply_grouped_predicates(nodes, selectors, context):
+    """Filter a list of nodes in document order through predicate
+    selectors, applying them separately to the children of each parent,
+    as if each group had been found along the child axis.  Returns a list
+    in document order.
+
+    """
+    groups = {}
+    for node in nodes:
+        group = groups.get(node.parentNode)
+        if group is None:
+            groups[node.parentNode] = [node]
+        else:
+            group.append(node)
+    if len(groups) <= 1:
+        return apply_predicates(nodes, selectors, context)
+    selected = set()
+    for group in groups.values():
+        selected.update(apply_predicates(group, selectors, context))
+    return [n for n in nodes if n in selected]
+
+
+def select_position(nodes, position):
+    """Select the node at a position returned by constant_position() from
+    an iterable of nodes, stopping as soon as it is found.  Returns a
+    node-set.
+
+    """
+    if position == "last":
+        result = []
+        for node in nodes:
+            result = [node]
+        return result
+    if position == 0:
+        return []
+    if isinstance(nodes, list):
+        return nodes[position - 1 : position]
+    for node in islice(nodes, position - 1, None):
+        return [node]
+    return []
+
+
+#
+# Static analysis of expressions.
+#
+
+
+def unwrap(expr):
+    """Strip the single-step PathExpr the parser wraps around every
+    primary expression.
+
+    """
+    while isinstance(expr, PathExpr) and len(expr.steps) == 1:
+        expr = expr.steps[0]
+    return expr
+
+
+def expr_type(expr):
+    """Return the type of the values an expression evaluates to: one of
+    "node-set", "boolean", "number" or "string", or None if this cannot be
+    determined without evaluating it.
+
+    """
+    if isinstance(
+        expr, (AxisStep, AbsolutePathExpr, PredicateList, UnionExpr, GroupedStep)
+    ):
+        return "node-set"
+    elif isinstance(expr, (InvariantExpr, InvariantScope)):
+        return expr_type(expr.expr)
+    elif isinstance(expr, PathExpr):
+        if len(expr.steps) > 1:
+            return "node-set"
+        return expr_type(expr.steps[0])
+    elif isinstance(expr, (EqualityExpr, AndExpr, OrExpr)):
+        return "boolean"
+    elif isinstance(expr, (ArithmeticalExpr, NegationExpr)):
+        return "number"
+    elif isinstance(expr, LiteralExpr):
+        return "string" if stringp(expr.literal) else "number"
+    elif isinstance(expr, Function):
+        return expr.evaluate.rtype
+    return None
+
+
+def step_axis(step):
+    """Return the axis name of a location step, or None if the step is
+    not an axis step.
+
+    """
+    if isinstance(step, PredicateList):
+        step = step.expr
+    if isinstance(step, AxisStep):
+        return step.axis.__name__
+    return None
+
+
+def constant_position(expr):
+    """If a predicate selects a node by a constant position, return that
+    position: a positive integer, 0 for a position matching no node, or
+    "last" for last().  Otherwise, return None.
+
+    """
+    expr = unwrap(expr)
+    if isinstance(expr, EqualityExpr) and expr.op == "=":
+        left, right = unwrap(expr.left), unwrap(expr.right)
+        if isinstance(left, Function) and left.name == "position":
+            expr = right
+    if isinstance(expr, LiteralExpr) and numberp(expr.literal):
+        n = expr.literal
+        if math.isfinite(n) and n >= 1 and n == int(n):
+            return int(n)
+        return 0
+    if isinstance(expr, Function) and expr.name == "last" and not expr.args:
+        return "last"
+    return None
+
+
+def uses_position(expr):
+    """Return true if the value of an expression may depend on the context
+    position or the context size.
+
+    """
+    if isinstance(expr, Function):
+        if expr.name in ("position", "last"):
+            return True
+        return any(uses_position(x) for x in expr.args)
+    elif isinstance(expr, BinaryOperatorExpr):
+        return uses_position(expr.left) or uses_position(expr.right)
+    elif isinstance(expr, NegationExpr):
+        return uses_position(expr.expr)
+    elif isinstance(expr, PathExpr):
+        # Steps after the first have a context of their own.
+        return uses_position(expr.steps[0])
+    elif isinstance(expr, (PredicateList, InvariantScope)):
+        return uses_position(expr.expr)
+    elif isinstance(
+        expr,
+        (
+            LiteralExpr,
+            VariableReference,
+            AxisStep,
+            AbsolutePathExpr,
+            GroupedStep,
+            InvariantExpr,
+        ),
+    ):
+        return False
+    return True
+
+
+# The parts of the evaluation context an expression may depend on: the
+# context node, position and size, the variable bindings, and the document
+# containing the context node.
+CONTEXT_NODE = "node"
+CONTEXT_POSITION = "position"
+CONTEXT_SIZE = "size"
+VARIABLES = "variables"
+DOCUMENT = "document"
+
+_focus = frozenset([CONTEXT_NODE, CONTEXT_POSITION, CONTEXT_SIZE])
+_everything = _focus | frozenset([VARIABLES, DOCUMENT])
+_no_dependencies = frozenset()
+
+
+def dependencies(expr):
+    """Return the set of the parts of the evaluation context the value of
+    an expression may depend on: CONTEXT_NODE, CONTEXT_POSITION,
+    CONTEXT_SIZE, VARIABLES and DOCUMENT.
+
+    """
+    if isinstance(expr, LiteralExpr):
+        return _no_dependencies
+    elif isinstance(expr, VariableReference):
+        return frozenset([VARIABLES])
+    elif isinstance(expr, Function):
+        if expr.name == "position":
+            return frozenset([CONTEXT_POSITION])
+        if expr.name == "last":
+            return frozenset([CONTEXT_SIZE])
+        result = _no_dependencies
+        if expr.name == "lang" or (expr.evaluate.implicit and not expr.args):
+            result = frozenset([CONTEXT_NODE])
+        elif expr.name == "id":
+            result = frozenset([DOCUMENT])
+        for arg in expr.args:
+            result |= dependencies(arg)
+        return result
+    elif isinstance(expr, BinaryOperatorExpr):
+        return dependencies(expr.left) | dependencies(expr.right)
+    elif isinstance(expr, NegationExpr):
+        return dependencies(expr.expr)
+    elif isinstance(expr, AxisStep):
+        return frozenset([CONTEXT_NODE])
+    elif isinstance(expr, AbsolutePathExpr):
+        # The steps of the path have a context of their own.
+        result = frozenset([DOCUMENT])
+        if expr.path is not None:
+            result |= dependencies(expr.path) - _focus
+        return result
+    elif isinstance(expr, PathExpr):
+        result = dependencies(expr.steps[0])
+        for step in expr.steps[1:]:
+            result |= dependencies(step) - _focus
+        return result
+    elif isinstance(expr, PredicateList):
+        result = dependencies(expr.expr)
+        for p in expr.predicates:
+            result |= dependencies(p) - _focus
+        return result
+    elif isinstance(expr, GroupedStep):
+        return frozenset([CONTEXT_NODE]) | (dependencies(expr.step) - _focus)
+    elif isinstance(expr, (InvariantExpr, InvariantScope)):
+        return dependencies(expr.expr)
+    return _everything
+
+
 #
 # Node tests.
 #
@@ -892,6 +2413,13 @@ class Test(object):
     def match(self, node, axis, context):
         """Return True if 'node' matches the test along 'axis'."""
 
+    def matcher(self, axis, context):
+        """Return a function of one node, equivalent to match() along
+        'axis' in 'context'.
+
+        """
+        return lambda node: self.match(node, axis, context)
+
 
 class NameTest(object):
     def __init__(self, prefix, localpart):
@@ -920,6 +2448,68 @@ class NameTest(object):
                 return False
         return True
 
+    def expanded_name(self, context, principal=xml.dom.Node.ELEMENT_NODE):
+        """Return the (namespaceURI, localName) pair matched on an axis
+        with the given principal node type, by default the child axis, with
+        "*" for a wildcard, or None if the prefix is unknown.
+
+        """
+        if self.prefix == "*":
+            return ("*", self.localName)
+        if self.prefix is None:
+            if principal == xml.dom.Node.ELEMENT_NODE:
+                return (context.default_namespace, self.localName)
+            return (None, self.localName)
+        try:
+            return (context.namespaces[self.prefix], self.localName)
+        except KeyError:
+            return None
+
+    def bind(self, axis, namespaces, default_namespace):
+        """Return a BoundNameTest matching the same nodes along 'axis' as
+        this test in a context with the given namespace declarations.
+        Raises XPathUnknownPrefixError if the prefix is not declared.
+
+        """
+        if self.prefix == "*":
+            return self
+        if self.prefix is None:
+            namespaceURI = None
+            if axis.principal_node_type == xml.dom.Node.ELEMENT_NODE:
+                namespaceURI = default_namespace
+        else:
+            try:
+                namespaceURI = namespaces[self.prefix]
+            except KeyError:
+                raise XPathUnknownPrefixError(self.prefix)
+        return BoundNameTest(self.prefix, self.localName, namespaceURI)
+
+    def matcher(self, axis, context):
+        # The namespace is resolved once, rather than for every node.
+        principal = axis.principal_node_type
+        localName = self.localName
+        if self.prefix == "*":
+            if localName == "*":
+                return lambda n: n.nodeType == principal
+            return lambda n: n.nodeType == principal and n.localName == localName
+
+        namespaceURI = None
+        if self.prefix is not None:
+            try:
+                namespaceURI = context.namespaces[self.prefix]
+            except KeyError:
+                prefix = self.prefix
+
+                def unknown(n):
+                    if n.nodeType == principal:
+                        raise XPathUnknownPrefixError(prefix)
+                    return False
+
+                return unknown
+        elif principal == xml.dom.Node.ELEMENT_NODE:
+            namespaceURI = context.default_namespace
+        return _name_matcher(principal, namespaceURI, localName)
+
     def __str__(self):
         if self.prefix is not None:
             return "%s:%s" % (self.prefix, self.localName)
@@ -927,6 +2517,47 @@ class NameTest(object):
             return self.localName
 
 
+class BoundNameTest(NameTest):
+    """A name test whose prefix was resolved when the expression was bound
+    to a set of namespace declarations, and which ignores those of the
+    context.
+
+    """
+
+    def __init__(self, prefix, localpart, namespaceURI):
+        NameTest.__init__(self, prefix, sys.intern(localpart))
+        if namespaceURI is not None:
+            namespaceURI = sys.intern(namespaceURI)
+        self.namespaceURI = namespaceURI
+        self._matchers = {}
+
+    def match(self, node, axis, context):
+        return self.matcher(axis, context)(node)
+
+    def expanded_name(self, context, principal=xml.dom.Node.ELEMENT_NODE):
+        return (self.namespaceURI, self.localName)
+
+    def matcher(self, axis, context):
+        principal = axis.principal_node_type
+        match = self._matchers.get(principal)
+        if match is None:
+            match = self._matchers[principal] = _name_matcher(
+                principal, self.namespaceURI, self.localName
+            )
+        return match
+
+
+def _name_matcher(principal, namespaceURI, localName):
+    # Match nodes of the principal node type with an expanded name.
+    if localName == "*":
+        return lambda n: n.nodeType == principal and n.namespaceURI == namespaceURI
+    return (
+        lambda n: n.nodeType == principal
+        and n.localName == localName
+        and n.namespaceURI == namespaceURI
+    )
+
+
 class PITest(object):
     def __init__(self, name=None):
         self.name = name
@@ -936,6 +2567,13 @@ class PITest(object):
             self.name is None or node.target == self.name
         )
 
+    def matcher(self, axis, context):
+        PI = xml.dom.Node.PROCESSING_INSTRUCTION_NODE
+        name = self.name
+        if name is None:
+            return lambda n: n.nodeType == PI
+        return lambda n: n.nodeType == PI and n.target == name
+
     def __str__(self):
         if self.name is None:
             name = ""
@@ -950,6 +2588,9 @@ class CommentTest(object):
     def match(self, node, axis, context):
         return node.nodeType == node.COMMENT_NODE
 
+    def matcher(self, axis, context):
+        return _is_comment
+
     def __str__(self):
         return "comment()"
 
@@ -960,6 +2601,9 @@ class TextTest(object):
             node.nodeType == node.TEXT_NODE or node.nodeType == node.CDATA_SECTION_NODE
         )
 
+    def matcher(self, axis, context):
+        return _is_text
+
     def __str__(self):
         return "text()"
 
@@ -968,5 +2612,20 @@ class AnyKindTest(object):
     def match(self, node, axis, context):
         return True
 
+    def matcher(self, axis, context):
+        return _is_node
+
     def __str__(self):
         return "node()"
+
+
+def _is_comment(node):
+    return node.nodeType == node.COMMENT_NODE
+
+
+def _is_text(node):
+    return node.nodeType == node.TEXT_NODE or node.nodeType == node.CDATA_SECTION_NODE
+
+
+def _is_node(node):
+    return True
@@ -0,0 +1,409 @@
+"""Read-only documents stored in parallel arrays.
+
+A FrozenDocument numbers the nodes of a tree in document order, exactly as
+DocumentIndex does, and records the structure of the tree in arrays indexed
+by these numbers: the parent, first child and next sibling of each node, its
+node type, an interned id for its expanded name, the offset of its text in
+the concatenated text of the document, and the range of its attributes.
+
+Axis steps evaluated by a compiled expression over a frozen document walk
+these arrays instead of the DOM, and compare integers instead of names.
+The nodes they select are mapped back to DOM nodes as results are built, so
+the results are the same as for the DOM.  String-values of elements are
+slices of the concatenated text.
+
+The DOM tree must not be modified while it is frozen.
+
+"""
+
+from array import array
+import xml.dom
+
+import xpath
+import xpath.expr as X
+
+ELEMENT_NODE = xml.dom.Node.ELEMENT_NODE
+ATTRIBUTE_NODE = xml.dom.Node.ATTRIBUTE_NODE
+TEXT_NODE = xml.dom.Node.TEXT_NODE
+CDATA_SECTION_NODE = xml.dom.Node.CDATA_SECTION_NODE
+PROCESSING_INSTRUCTION_NODE = xml.dom.Node.PROCESSING_INSTRUCTION_NODE
+COMMENT_NODE = xml.dom.Node.COMMENT_NODE
+
+
+class FrozenDocument(X.DocumentIndex):
+    """A read-only, array-backed copy of the structure of a DOM tree.
+
+    Nodes are identified by their rank in document order.  For the node
+    with id i:
+
+    * kind[i] is its node type;
+    * parent[i], first_child[i] and next_sibling[i] are the ids of the
+      related nodes, or -1;
+    * name[i] is the index in expanded_names of the (namespaceURI,
+      localName) pair of an element or attribute, or -1;
+    * attributes_end[i] follows the ids of its attributes, which come
+      directly after it, and so is also the id of the next node in
+      document order which is not an attribute;
+    * end[i] follows the ids of its descendants;
+    * text[text_start[i]:text_start[end[i]]] is its string-value, for
+      elements, documents and text nodes.
+
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.nodes = nodes = []
+        self.order = order = {}
+        self.kind = kind = array("b")
+        self.parent = parent = array("i")
+        self.first_child = first_child = array("i")
+        self.next_sibling = next_sibling = array("i")
+        self.name = name = array("i")
+        self.attributes_end = attributes_end = array("i")
+        self.end = end = array("i")
+        self.text_start = text_start = array("q")
+        self.expanded_names = []
+        self.name_ids = {}
+        texts = []
+        offset = 0
+
+        def append(node, nodeType, parent_id, name_id, skip):
+            order[node] = len(nodes)
+            nodes.append(node)
+            kind.append(nodeType)
+            parent.append(parent_id)
+            first_child.append(-1)
+            next_sibling.append(-1)
+            name.append(name_id)
+            attributes_end.append(len(nodes) + skip)
+            end.append(len(nodes))
+            text_start.append(offset)
+
+        def add(node, parent_id):
+            # Append a node followed by its attributes, returning its id.
+            nonlocal offset
+            i = len(nodes)
+            nodeType = node.nodeType
+            attrs = node.attributes
+            attrs = [attrs.item(a) for a in range(attrs.length)] if attrs else []
+            name_id = self._name_id(node) if nodeType == ELEMENT_NODE else -1
+            append(node, nodeType, parent_id, name_id, len(attrs))
+            if nodeType == TEXT_NODE or nodeType == CDATA_SECTION_NODE:
+                texts.append(node.data)
+                offset += len(node.data)
+            for attr in attrs:
+                append(attr, ATTRIBUTE_NODE, i, self._name_id(attr), 0)
+            return i
+
+        stack = [[add(root, -1), iter(root.childNodes), -1]]
+        while stack:
+            frame = stack[-1]
+            for child in frame[1]:
+                i = add(child, frame[0])
+                if frame[2] < 0:
+                    first_child[frame[0]] = i
+                else:
+                    next_sibling[frame[2]] = i
+                frame[2] = i
+                if child.childNodes:
+                    stack.append([i, iter(child.childNodes), -1])
+                    break
+                end[i] = len(nodes)
+            else:
+                stack.pop()
+                end[frame[0]] = len(nodes)
+        text_start.append(offset)
+
+        self.text = "".join(texts)
+        self.size = len(nodes)
+        self.names = None
+        self._ranks = {}
+        self._name_sets = {}
+        self.post = None
+        self.level = None
+        self.strings = _TextSlices(self)
+
+    def _name_id(self, node):
+        key = (node.namespaceURI, node.localName)
+        i = self.name_ids.get(key)
+        if i is None:
+            i = self.name_ids[key] = len(self.expanded_names)
+            self.expanded_names.append(key)
+        return i
+
+    def name_set(self, namespaceURI, localName):
+        """Return the set of name ids matching an expanded name, where
+        either part may be "*" to match any value.
+
+        """
+        key = (namespaceURI, localName)
+        ids = self._name_sets.get(key)
+        if ids is None:
+            ids = frozenset(
+                i
+                for i, (ns, local) in enumerate(self.expanded_names)
+                if (namespaceURI == "*" or ns == namespaceURI)
+                and (localName == "*" or local == localName)
+            )
+            self._name_sets[key] = ids
+        return ids
+
+    def subtree_end(self, node):
+        return self.end[self.order[node]]
+
+    def regions(self):
+        parent = self.parent
+        end = self.end
+        level = array("i", [0]) * self.size
+        for i in range(1, self.size):
+            level[i] = level[parent[i]] + 1
+        post = array("i", (end[i] - level[i] - 1 for i in range(self.size)))
+        # Readers test post, so it is published last.
+        self.level = level
+        self.post = post
+
+    def select(self, node, axis, test, context):
+        """Return an iterator over the DOM nodes along an axis from node
+        which pass a node test, in the order of the axis.
+
+        Returns None if the step is better evaluated over the DOM: the
+        node is not in this document or is an attribute, the axis only
+        goes up the tree, or the axis or test is not supported, or the
+        test uses an unknown prefix.
+
+        """
+        walk = _walks.get(axis)
+        if walk is None:
+            return None
+        i = self.order.get(node)
+        if i is None or self.kind[i] == ATTRIBUTE_NODE:
+            return None
+        nodes = self.nodes
+
+        if isinstance(test, X.AnyKindTest):
+            return (nodes[j] for j in walk(self, i))
+
+        kind = self.kind
+        if isinstance(test, X.NameTest):
+            principal = axis.principal_node_type
+            name = test.expanded_name(context, principal)
+            if name is None:
+                return None
+            namespaceURI = name[0]
+            if namespaceURI == "*" and test.localName == "*":
+                return (nodes[j] for j in walk(self, i) if kind[j] == principal)
+            # Elements and attributes are the only nodes with names, and
+            # only the attribute axis reaches attributes.
+            ids = self.name_set(namespaceURI, test.localName)
+            if not ids:
+                return iter(())
+            name = self.name
+            if len(ids) == 1:
+                (wanted,) = ids
+                return (nodes[j] for j in walk(self, i) if name[j] == wanted)
+            return (nodes[j] for j in walk(self, i) if name[j] in ids)
+
+        if isinstance(test, X.TextTest):
+            return (
+                nodes[j]
+                for j in walk(self, i)
+                if kind[j] == TEXT_NODE or kind[j] == CDATA_SECTION_NODE
+            )
+        if isinstance(test, X.CommentTest):
+            return (nodes[j] for j in walk(self, i) if kind[j] == COMMENT_NODE)
+        if isinstance(test, X.PITest):
+            target = test.name
+            return (
+                nodes[j]
+                for j in walk(self, i)
+                if kind[j] == PROCESSING_INSTRUCTION_NODE
+                and (target is None or nodes[j].target == target)
+            )
+        return None
+
+    def _evaluate(self, method, expr, node, context, kwargs):
+        if node is None:
+            node = self.root
+        if context is None:
+            context = xpath.XPathContext(node, **kwargs)
+        else:
+            context = context.overlay(**kwargs)
+        context.frozen = self
+        context.memoize = self.strings
+        with X._document_indexes.scope():
+            X._document_indexes[self.root] = self
+            with X.string_value_memo(node, self.strings):
+                return method(xpath.XPath.get(expr), node, context)
+
+    def find(self, expr, node=None, context=None, **kwargs):
+        """Evaluate expr with node as the context node, or the root of
+        the document if node is None, as xpath.find() does.
+
+        """
+        return self._evaluate(xpath.XPath.find, expr, node, context, kwargs)
+
+    def findnode(self, expr, node=None, context=None, **kwargs):
+        return self._evaluate(xpath.XPath.findnode, expr, node, context, kwargs)
+
+    def findvalue(self, expr, node=None, context=None, **kwargs):
+        return self._evaluate(xpath.XPath.findvalue, expr, node, context, kwargs)
+
+    def findvalues(self, expr, node=None, context=None, **kwargs):
+        return self._evaluate(xpath.XPath.findvalues, expr, node, context, kwargs)
+
+    def iterfind(self, expr, node=None, context=None, **kwargs):
+        return self._evaluate(xpath.XPath.iterfind, expr, node, context, kwargs)
+
+    def iterfindvalues(self, expr, node=None, context=None, **kwargs):
+        return self._evaluate(xpath.XPath.iterfindvalues, expr, node, context, kwargs)
+
+
+class _TextSlices(dict):
+    # The string-value memo of a frozen document: string-values of its
+    # elements and documents are sliced from its text.  Nodes of other
+    # trees are not memoized, since they may change.
+
+    def __init__(self, frozen):
+        self.frozen = frozen
+
+    def __setitem__(self, node, value):
+        pass
+
+    def __missing__(self, node):
+        frozen = self.frozen
+        i = frozen.order.get(node)
+        if i is None:
+            raise KeyError(node)
+        start = frozen.text_start
+        return frozen.text[start[i] : start[frozen.end[i]]]
+
+
+#
+# Axes over node ids.  Each function takes a FrozenDocument and the id of
+# a node which is not an attribute, and returns an iterable over the ids of
+# the nodes along the axis, in the order of the axis.
+#
+
+axes = {}
+
+
+def _axis(name):
+    def decorate(f):
+        axes[name] = f
+        return f
+
+    return decorate
+
+
+@_axis("child")
+def _child(d, i):
+    next_sibling = d.next_sibling
+    i = d.first_child[i]
+    while i >= 0:
+        yield i
+        i = next_sibling[i]
+
+
+@_axis("descendant")
+def _descendant(d, i):
+    # Skipping from each node past its attributes gives the next node in
+    # document order which is not an attribute.
+    attributes_end = d.attributes_end
+    end = d.end[i]
+    i = attributes_end[i]
+    while i < end:
+        yield i
+        i = attributes_end[i]
+
+
+@_axis("descendant-or-self")
+def _descendant_or_self(d, i):
+    yield i
+    for j in _descendant(d, i):
+        yield j
+
+
+@_axis("parent")
+def _parent(d, i):
+    i = d.parent[i]
+    return (i,) if i >= 0 else ()
+
+
+@_axis("ancestor")
+def _ancestor(d, i):
+    parent = d.parent
+    ancestors = []
+    i = parent[i]
+    while i >= 0:
+        ancestors.append(i)
+        i = parent[i]
+    return ancestors
+
+
+@_axis("ancestor-or-self")
+def _ancestor_or_self(d, i):
+    ancestors = _ancestor(d, i)
+    ancestors.insert(0, i)
+    return ancestors
+
+
+@_axis("following-sibling")
+def _following_sibling(d, i):
+    next_sibling = d.next_sibling
+    i = next_sibling[i]
+    while i >= 0:
+        yield i
+        i = next_sibling[i]
+
+
+@_axis("preceding-sibling")
+def _preceding_sibling(d, i):
+    p = d.parent[i]
+    if p < 0:
+        return []
+    siblings = []
+    for j in _child(d, p):
+        if j == i:
+            break
+        siblings.append(j)
+    siblings.reverse()
+    return siblings
+
+
+@_axis("following")
+def _following(d, i):
+    attributes_end = d.attributes_end
+    size = d.size
+    i = d.end[i]
+    while i < size:
+        yield i
+        i = attributes_end[i]
+
+
+@_axis("preceding")
+def _preceding(d, i):
+    kind = d.kind
+    ancestors = set(_ancestor(d, i))
+    for j in range(i - 1, -1, -1):
+        if kind[j] != ATTRIBUTE_NODE and j not in ancestors:
+            yield j
+
+
+@_axis("attribute")
+def _attribute(d, i):
+    return range(i + 1, d.attributes_end[i])
+
+
+@_axis("self")
+def _self(d, i):
+    return (i,)
+
+
+# The walks used by FrozenDocument.select(), by the axis functions of
+# xpath.expr.  Following parentNode is as fast as following the parent
+# array, so the axes which only go up are left to the DOM.
+_walks = dict(
+    (X.axes[name], walk)
+    for name, walk in axes.items()
+    if name not in ("self", "parent", "ancestor", "ancestor-or-self")
+)
@@ -0,0 +1,422 @@
+"""Rewriting of expression trees before they are evaluated or compiled.
+
+The parser builds a tree which mirrors the text of an expression, so
+queries such as ``item[@price > 10 * 2 and true()]`` keep arithmetic on
+literals and calls of constant functions as nodes which are evaluated
+again for every node the predicate is applied to.  optimize() returns an
+equivalent tree in which:
+
+* subexpressions which depend neither on the context nor on variables
+  are replaced by their values;
+* boolean operators with a constant operand are reduced, as in
+  ``not(not(x))`` or ``x and true()``;
+* predicates which are always true are dropped;
+* ``//x``, which the parser expands into ``descendant-or-self::node()``
+  followed by ``child::x``, becomes a single ``descendant::x`` step, or a
+  GroupedStep if the predicates of ``x`` select by position;
+* subexpressions of predicates which do not depend on the context node,
+  position or size, such as ``/library/featured/@name`` in
+  ``//book[@author = /library/featured/@name]``, are wrapped in
+  InvariantExprs, which are evaluated only once per evaluation.
+
+A subexpression is only folded if evaluating it succeeds and its value can
+be written as an XPath expression, so that errors such as ``0 mod 0`` are
+still raised when the expression is evaluated, and str() of the optimized
+tree can still be parsed.  Trees are rebuilt rather than modified.
+
+"""
+
+import math
+
+import xpath.expr as X
+from xpath.exceptions import XPathUnknownPrefixError
+
+# Rewriters for each expression class.
+_rewriters = {}
+
+
+def rewrites(cls):
+    """Decorator registering a rewriter for an expression class."""
+
+    def decorate(f):
+        _rewriters[cls] = f
+        return f
+
+    return decorate
+
+
+def optimize(expr):
+    """Return an expression equivalent to expr, rewritten by rewrite(),
+    with its invariant subexpressions hoisted by hoist().
+
+    """
+    return hoist(rewrite(expr))
+
+
+def rewrite(expr):
+    """Return an expression equivalent to expr, with constant
+    subexpressions folded into literals, boolean identities simplified,
+    and // steps merged.
+
+    """
+    try:
+        rewriter = _rewriters[type(expr)]
+    except KeyError:
+        return expr
+    return rewriter(expr)
+
+
+#
+# Constants.
+#
+
+# Functions whose value depends on the context even when their arguments
+# are constant.
+_context_functions = frozenset(["last", "position", "id", "lang"])
+
+
+def constant(expr):
+    """Return a one-element tuple holding the value of expr if it is a
+    literal, a negated number, or true() or false(); otherwise, return
+    None.
+
+    """
+    if isinstance(expr, X.LiteralExpr):
+        return (expr.literal,)
+    if isinstance(expr, X.NegationExpr) and isinstance(expr.expr, X.LiteralExpr):
+        if X.numberp(expr.expr.literal):
+            return (-expr.expr.literal,)
+    if isinstance(expr, X.Function) and not expr.args:
+        if expr.name == "true":
+            return (True,)
+        if expr.name == "false":
+            return (False,)
+    return None
+
+
+def literal(value):
+    """Return an expression evaluating to value, or None if it cannot be
+    written in XPath 1.0.
+
+    """
+    if X.booleanp(value):
+        return X.Function("true" if value else "false", [])
+    if X.numberp(value):
+        if not math.isfinite(value) or math.copysign(1.0, value) < 0:
+            # NaN, the infinities and negative numbers have no literal
+            # form; -x is left to NegationExpr.
+            return None
+        if "e" in X.string(value):
+            return None
+        return X.LiteralExpr(value)
+    if X.stringp(value):
+        if "'" in value and '"' in value:
+            return None
+        return X.LiteralExpr(value)
+    return None
+
+
+def fold(expr, operands):
+    """Return the value of expr as a literal if all of its operands are
+    constant, or expr itself.
+
+    """
+    if not all(constant(x) is not None for x in operands):
+        return expr
+    try:
+        value = expr.evaluate(None, 1, 1, None)
+    except Exception:
+        # Leave the error to be raised if the expression is evaluated.
+        return expr
+    folded = literal(value)
+    if folded is None:
+        if isinstance(value, float) and value < 0:
+            folded = literal(-value)
+            if folded is not None:
+                return X.NegationExpr(folded)
+        return expr
+    return folded
+
+
+def as_boolean(expr):
+    """Return expr if it evaluates to a boolean, or boolean(expr)."""
+    if X.expr_type(expr) == "boolean":
+        return expr
+    value = constant(expr)
+    if value is not None:
+        return literal(X.boolean(value[0]))
+    return X.Function("boolean", [expr])
+
+
+#
+# Location paths.
+#
+
+
+def descendant_steps(steps):
+    """Replace each descendant-or-self::node() step followed by a child
+    step in a list of location steps with a single step.
+
+    """
+    result = []
+    i = 0
+    while i < len(steps):
+        step = steps[i]
+        if (
+            i + 1 < len(steps)
+            and isinstance(step, X.AxisStep)
+            and step.axis is X.axes["descendant-or-self"]
+            and isinstance(step.test, X.AnyKindTest)
+            and X.step_axis(steps[i + 1]) == "child"
+        ):
+            result.append(descendant_step(steps[i + 1]))
+            i += 2
+        else:
+            result.append(step)
+            i += 1
+    return result
+
+
+def descendant_step(step):
+    """Return the step equivalent to descendant-or-self::node()/step, for
+    a child step.
+
+    """
+    if isinstance(step, X.AxisStep):
+        return X.AxisStep("descendant", step.test)
+    if step.positional:
+        return X.GroupedStep(step)
+    return X.PredicateList(
+        X.AxisStep("descendant", step.expr.test), step.predicates, "descendant"
+    )
+
+
+#
+# Rewriters.
+#
+
+
+@rewrites(X.PathExpr)
+def _path(expr):
+    steps = descendant_steps([rewrite(s) for s in expr.steps])
+    if len(steps) == 1 and X.expr_type(steps[0]) != "node-set":
+        # The parser wraps every primary expression in a path.
+        return steps[0]
+    return X.PathExpr(steps)
+
+
+@rewrites(X.AbsolutePathExpr)
+def _absolute_path(expr):
+    if expr.path is None:
+        return expr
+    steps = descendant_steps([rewrite(s) for s in expr.path.steps])
+    return X.AbsolutePathExpr(X.PathExpr(steps))
+
+
+@rewrites(X.PredicateList)
+def _predicate_list(expr):
+    inner = rewrite(expr.expr)
+    predicates = []
+    for p in expr.predicates:
+        p = rewrite(p)
+        value = constant(p)
+        if value is not None and not X.numberp(value[0]) and X.boolean(value[0]):
+            continue
+        predicates.append(p)
+    if not predicates:
+        return inner
+    return X.PredicateList(inner, predicates, expr.axis.__name__)
+
+
+@rewrites(X.UnionExpr)
+def _union(expr):
+    return X.UnionExpr(expr.op, rewrite(expr.left), rewrite(expr.right))
+
+
+@rewrites(X.EqualityExpr)
+@rewrites(X.ArithmeticalExpr)
+def _operator(expr):
+    left, right = rewrite(expr.left), rewrite(expr.right)
+    return fold(type(expr)(expr.op, left, right), [left, right])
+
+
+@rewrites(X.AndExpr)
+def _and(expr):
+    left, right = rewrite(expr.left), rewrite(expr.right)
+    value = constant(left)
+    if value is not None:
+        return as_boolean(right) if X.boolean(value[0]) else literal(False)
+    value = constant(right)
+    if value is not None and X.boolean(value[0]):
+        return as_boolean(left)
+    return X.AndExpr(expr.op, left, right)
+
+
+@rewrites(X.OrExpr)
+def _or(expr):
+    left, right = rewrite(expr.left), rewrite(expr.right)
+    value = constant(left)
+    if value is not None:
+        return literal(True) if X.boolean(value[0]) else as_boolean(right)
+    value = constant(right)
+    if value is not None and not X.boolean(value[0]):
+        return as_boolean(left)
+    return X.OrExpr(expr.op, left, right)
+
+
+@rewrites(X.NegationExpr)
+def _negation(expr):
+    operand = rewrite(expr.expr)
+    if isinstance(operand, X.NegationExpr):
+        # -(-x) is number(x).
+        operand = operand.expr
+        if X.expr_type(operand) == "number":
+            return operand
+        return X.Function("number", [operand])
+    return fold(X.NegationExpr(operand), [operand])
+
+
+@rewrites(X.Function)
+def _function(expr):
+    args = [rewrite(x) for x in expr.args]
+    name = expr.name
+    if len(args) == 1:
+        (arg,) = args
+        if name == "not" and isinstance(arg, X.Function) and arg.name == "not":
+            return as_boolean(arg.args[0])
+        if name in ("boolean", "number", "string") and X.expr_type(arg) == name:
+            return arg
+    call = X.Function(name, args)
+    if name in _context_functions or (call.evaluate.implicit and not args):
+        return call
+    return fold(call, args)
+
+
+#
+# Invariant subexpressions.
+#
+
+
+def hoist(expr):
+    """Wrap the subexpressions of expr which are evaluated for every node
+    of a node-set, but do not depend on the node, its position or the
+    size of the set, in InvariantExprs.  If there are any, expr is wrapped
+    in an InvariantScope keeping their values.
+
+    """
+    hoisted = _hoist(expr, False)
+    if hoisted is expr:
+        return expr
+    return X.InvariantScope(hoisted)
+
+
+def worth_hoisting(expr):
+    """Return true if an invariant expression is costly enough to keep
+    its value.
+
+    """
+    return constant(expr) is None and not isinstance(
+        expr, (X.VariableReference, X.InvariantExpr)
+    )
+
+
+_focus = frozenset([X.CONTEXT_NODE, X.CONTEXT_POSITION, X.CONTEXT_SIZE])
+
+
+def _hoist(expr, repeated):
+    # Returns expr itself if nothing in it was hoisted.  repeated is true
+    # if expr is evaluated for every node of a node-set.
+    if repeated and worth_hoisting(expr) and not X.dependencies(expr) & _focus:
+        return X.InvariantExpr(expr)
+
+    if isinstance(expr, X.PredicateList):
+        inner = _hoist(expr.expr, repeated)
+        predicates = [_hoist(p, True) for p in expr.predicates]
+        if inner is expr.expr and _same(predicates, expr.predicates):
+            return expr
+        return X.PredicateList(inner, predicates, expr.axis.__name__)
+    elif isinstance(expr, X.GroupedStep):
+        step = _hoist(expr.step, repeated)
+        return expr if step is expr.step else X.GroupedStep(step)
+    elif isinstance(expr, X.PathExpr):
+        steps = [_hoist(expr.steps[0], repeated)]
+        steps.extend(_hoist(s, True) for s in expr.steps[1:])
+        return expr if _same(steps, expr.steps) else X.PathExpr(steps)
+    elif isinstance(expr, X.AbsolutePathExpr):
+        if expr.path is None:
+            return expr
+        path = _hoist(expr.path, repeated)
+        return expr if path is expr.path else X.AbsolutePathExpr(path)
+    elif isinstance(expr, X.BinaryOperatorExpr):
+        left = _hoist(expr.left, repeated)
+        right = _hoist(expr.right, repeated)
+        if left is expr.left and right is expr.right:
+            return expr
+        return type(expr)(expr.op, left, right)
+    elif isinstance(expr, X.NegationExpr):
+        operand = _hoist(expr.expr, repeated)
+        return expr if operand is expr.expr else X.NegationExpr(operand)
+    elif isinstance(expr, X.Function):
+        args = [_hoist(x, repeated) for x in expr.args]
+        return expr if _same(args, expr.args) else X.Function(expr.name, args)
+    return expr
+
+
+def _same(a, b):
+    return all(x is y for x, y in zip(a, b))
+
+
+#
+# Namespace binding.
+#
+
+
+def bind(expr, namespaces, default_namespace=None):
+    """Return a copy of expr whose name tests and variable references
+    have their prefixes resolved with the given namespace declarations,
+    rather than with those of the evaluation context.  Unprefixed names of
+    elements are in default_namespace.
+
+    Raises XPathUnknownPrefixError if a prefix is not declared.
+
+    """
+    if isinstance(expr, X.AxisStep):
+        if not isinstance(expr.test, X.NameTest):
+            return expr
+        test = expr.test.bind(expr.axis, namespaces, default_namespace)
+        return X.AxisStep(expr.axis.__name__, test)
+    elif isinstance(expr, X.VariableReference):
+        if expr.prefix is None:
+            return expr
+        try:
+            namespaceURI = namespaces[expr.prefix]
+        except KeyError:
+            raise XPathUnknownPrefixError(expr.prefix)
+        return X.BoundVariableReference(expr.prefix, expr.name, namespaceURI)
+
+    def rebind(x):
+        return bind(x, namespaces, default_namespace)
+
+    if isinstance(expr, X.PredicateList):
+        return X.PredicateList(
+            rebind(expr.expr),
+            [rebind(p) for p in expr.predicates],
+            expr.axis.__name__,
+        )
+    elif isinstance(expr, X.GroupedStep):
+        return X.GroupedStep(rebind(expr.step))
+    elif isinstance(expr, X.PathExpr):
+        return X.PathExpr([rebind(s) for s in expr.steps])
+    elif isinstance(expr, X.AbsolutePathExpr):
+        if expr.path is None:
+            return expr
+        return X.AbsolutePathExpr(rebind(expr.path))
+    elif isinstance(expr, X.BinaryOperatorExpr):
+        return type(expr)(expr.op, rebind(expr.left), rebind(expr.right))
+    elif isinstance(expr, X.NegationExpr):
+        return X.NegationExpr(rebind(expr.expr))
+    elif isinstance(expr, X.Function):
+        return X.Function(expr.name, [rebind(x) for x in expr.args])
+    elif isinstance(expr, (X.InvariantExpr, X.InvariantScope)):
+        return type(expr)(rebind(expr.expr))
+    return expr
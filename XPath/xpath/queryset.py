@@ -0,0 +1,464 @@
+"""Many expressions evaluated over a document in one traversal.
+
+A QuerySet compiles each of its expressions as a StreamingXPath if it is in
+the streamable subset of XPath (see xpath.stream), and otherwise as an
+XPath.  The streamable ones are matched together against the elements of
+the document, in one walk of the tree: for each element, only the steps
+which may select an element of that name are tried, using the state each
+query keeps for the open elements, as a StreamMatcher does for one query.
+The steps which first compare an attribute with a literal are looked up by
+the value of the attribute, rather than each tried in turn.
+
+The other location paths are merged into a trie of their steps, so that
+the steps shared by the beginnings of several paths are evaluated once,
+and the node-set they select is the context of all the steps which may
+follow.  Child steps with different names from the same node-set are
+evaluated in one pass over the children.  The remaining expressions are
+evaluated one after the other.
+
+"""
+
+import xml.dom
+
+import xpath
+import xpath.expr as X
+from xpath.exceptions import XPathNotImplementedError, XPathTypeError
+from xpath.stream import StreamingXPath
+
+ELEMENT_NODE = xml.dom.Node.ELEMENT_NODE
+DOCUMENT_NODE = xml.dom.Node.DOCUMENT_NODE
+
+
+class QuerySet(object):
+    """A set of expressions evaluated together.
+
+    exprs is a sequence of expressions, or a dict of names to expressions.
+    Their prefixes are resolved with namespaces and default_namespace when
+    they are compiled, as by XPath.bind(), rather than with the namespace
+    declarations of the documents they are evaluated over.  Unless stream
+    is true, no expression is streamed.
+
+    """
+
+    def __init__(
+        self, exprs, namespaces=None, default_namespace=None, stream=True
+    ):
+        self.names = None
+        if isinstance(exprs, dict):
+            self.names = list(exprs)
+            exprs = [exprs[name] for name in self.names]
+        self.namespaces = namespaces or {}
+        self.default_namespace = default_namespace
+
+        # The streamed queries, as (indexes, StreamingXPath) pairs where
+        # indexes lists the positions of the expressions which are the same
+        # path; the tries of the other location paths, from the document
+        # and from the context node; and the other expressions, as (index,
+        # XPath) pairs.
+        self.streamed = []
+        self.absolute = _Branch()
+        self.relative = _Branch()
+        self.others = []
+        streamed = {}
+        for i, expr in enumerate(exprs):
+            try:
+                if not stream:
+                    raise XPathNotImplementedError("not streamed")
+                path = StreamingXPath(expr, namespaces, default_namespace)
+            except XPathNotImplementedError:
+                self._add(i, self._compile(expr))
+                continue
+            key = str(path.expr)
+            if key in streamed:
+                streamed[key].append(i)
+            else:
+                streamed[key] = indexes = [i]
+                self.streamed.append((indexes, path))
+        self.size = len(exprs)
+
+        self._absolute = [
+            isinstance(path.expr, X.AbsolutePathExpr) for _, path in self.streamed
+        ]
+        # Relative paths are only matched from an element if they go down
+        # the tree from it, since the context element itself is not matched
+        # against the steps.
+        self._downward = [_downward(path) for _, path in self.streamed]
+        self._descendant = [
+            [step.axis in ("descendant", "descendant-or-self") for step in path.steps]
+            for _, path in self.streamed
+        ]
+        # The child steps following a descendant-or-self::node() step, as
+        # in //name.  Rather than each element being selected by the
+        # descendant-or-self step, the parent of an element tried against
+        # the child step is given counters for it when it is in the range
+        # of the descendant-or-self step.
+        self._lazy = [
+            set(
+                j
+                for j in range(1, len(path.steps))
+                if path.steps[j].axis == "child"
+                and path.steps[j - 1].any_kind
+                and path.steps[j - 1].axis == "descendant-or-self"
+            )
+            for _, path in self.streamed
+        ]
+        # The XPaths of streamed queries evaluated one at a time.
+        self._compiled = {}
+        # For each expanded name, the (j, step) pairs of the steps of each
+        # query which may select an element of that name, in order: a dict
+        # of the queries to try for every element, and a list of (key,
+        # evaluate, queries) for those only tried when an attribute has a
+        # value, where queries maps the values to dicts of queries.
+        self._candidates = {}
+
+    def _compile(self, expr):
+        return xpath.XPath(
+            str(expr),
+            namespaces=self.namespaces,
+            default_namespace=self.default_namespace,
+        )
+
+    def _add(self, i, compiled):
+        # Add a location path to its trie, with a branch for each step, or
+        # any other expression to the others.
+        expr = compiled.expr
+        branch = self.relative
+        if isinstance(expr, X.AbsolutePathExpr):
+            branch = self.absolute
+            expr = expr.path
+        steps = []
+        if isinstance(expr, X.PathExpr):
+            steps = expr.steps
+        elif expr is not None:
+            steps = [expr]
+        if branch is self.relative and (
+            not steps or len(steps) == 1 and X.step_axis(steps[0]) is None
+        ):
+            self.others.append((i, compiled))
+            return
+        for j, step in enumerate(steps):
+            key = str(step)
+            following = branch.branches.get(key)
+            if following is None:
+                following = branch.branches[key] = _Branch(
+                    step, primary=j == 0, disjoint=branch.disjoint
+                )
+            branch = following
+        branch.indexes.append(i)
+
+    def find(self, node, context=None, **kwargs):
+        """Evaluate every expression with node as the context node, as
+        XPath.find() does.  Returns a list of the results in the order of
+        the expressions, or a dict if the expressions were given as one.
+
+        """
+        context = xpath.XPath._context(node, context, kwargs)
+        # The document order and indexes worked out for one expression are
+        # kept for the others, as for a single call.
+        with X.evaluation(node, context):
+            results = [None] * self.size
+
+            # The queries matched in a walk from each root.
+            roots = {}
+            document = node if node.nodeType == DOCUMENT_NODE else node.ownerDocument
+            for q, (indexes, path) in enumerate(self.streamed):
+                if self._absolute[q]:
+                    root = document
+                elif node.nodeType == DOCUMENT_NODE or self._downward[q]:
+                    root = node
+                else:
+                    root = None
+                if root is None:
+                    expr = self._compiled.get(q)
+                    if expr is None:
+                        expr = self._compiled[q] = self._compile(path.expr)
+                    _store(results, indexes, expr.find(node, context))
+                else:
+                    roots.setdefault(root, []).append(q)
+            for root, queries in roots.items():
+                self._walk(root, queries, context, results)
+
+            if self.absolute.branches or self.absolute.indexes:
+                self._evaluate(self.absolute, [document], True, context, results)
+            if self.relative.branches:
+                self._evaluate(self.relative, [node], True, context, results)
+            for i, expr in self.others:
+                results[i] = expr.find(node, context)
+            if self.names is not None:
+                return dict(zip(self.names, results))
+            return results
+
+    def _evaluate(self, branch, nodes, ordered, context, results):
+        # Evaluate the steps following a branch of a trie from the nodes
+        # it leads to, once for all the paths which share them.
+        _store(results, branch.indexes, nodes)
+        children = {}
+        if ordered and len(branch.branches) > 1:
+            children = _children_by_name(branch, nodes, context)
+        for following in branch.branches.values():
+            if following in children:
+                self._evaluate(following, children[following], True, context, results)
+            elif following.evaluate is not None:
+                selected = following.evaluate(nodes[0], 1, 1, context)
+                if not X.nodesetp(selected):
+                    raise XPathTypeError("path step is not a node-set")
+                self._evaluate(following, selected, False, context, results)
+            else:
+                selected = X.evaluate_steps(nodes, [following.step], context, ordered)
+                self._evaluate(following, selected, True, context, results)
+
+    def _candidates_for(self, namespaceURI, localName):
+        candidates = {}
+        guarded = {}
+        for q, (_, path) in enumerate(self.streamed):
+            lazy = self._lazy[q]
+            steps = [
+                (j, step)
+                for j, step in enumerate(path.steps)
+                if step.axis != "attribute"
+                and j + 1 not in lazy
+                and step.match(namespaceURI, localName)
+            ]
+            if not steps:
+                continue
+            # A query with one step for the name, whose first predicate
+            # compares an attribute with a literal, is only tried when the
+            # attribute has that value: the predicate does not depend on
+            # the position, and the later ones only count the nodes it
+            # selects.
+            guard = steps[0][1].guard if len(steps) == 1 else None
+            if guard is None:
+                candidates[q] = steps
+                continue
+            text, evaluate, literal = guard
+            key = (text, X.stringp(literal))
+            if key not in guarded:
+                guarded[key] = (evaluate, {})
+            guarded[key][1].setdefault(literal, {})[q] = steps
+        candidates = (
+            candidates,
+            [(key, evaluate, queries) for key, (evaluate, queries) in guarded.items()],
+        )
+        self._candidates[(namespaceURI, localName)] = candidates
+        return candidates
+
+    def _walk(self, root, queries, context, results):
+        streamed = self.streamed
+        descendant = self._descendant
+        lazy = self._lazy
+        # For each query, the counters for each step of the open elements
+        # selected by the steps before it, as StreamMatcher.open, and the
+        # nodes it selects.
+        open = [None] * len(streamed)
+        found = [None] * len(streamed)
+        attributes = []
+        # For each query, the number of open elements which are context
+        # nodes for its descendant steps.  Only the queries with such
+        # elements, or with steps active at the parent, can select an
+        # element, and when there are none, the children of an element
+        # which no step selected need not be visited.
+        deep = {}
+
+        def enter(q):
+            deep[q] = deep.get(q, 0) + 1
+
+        def exit(q):
+            if deep[q] == 1:
+                del deep[q]
+            else:
+                deep[q] -= 1
+
+        frame = {}
+        for q in queries:
+            path = streamed[q][1]
+            open[q] = [[] for _ in path.steps]
+            found[q] = []
+            if path.steps[-1].axis == "attribute":
+                attributes.append(q)
+            active = path.root_active()
+            for j, counters in active.items():
+                open[q][j].append(counters)
+                if descendant[q][j]:
+                    enter(q)
+            frame[q] = active
+
+        def visit(element, parent):
+            # Match an element against the steps of the queries, returning
+            # the counters for the steps it is a context node for.
+            key = (element.namespaceURI, element.localName)
+            candidates = self._candidates.get(key)
+            if candidates is None:
+                candidates = self._candidates_for(*key)
+            frame = {}
+            candidates, guarded = candidates
+            if not candidates and not guarded:
+                return frame
+            # The queries to try, and the values of predicates shared by the
+            # steps.
+            tried = [candidates]
+            memo = {}
+            for (_, strings), evaluate, queries in guarded:
+                values = set(
+                    X.string_value(node) if strings else X.number(X.string_value(node))
+                    for node in evaluate(element, 1, 1, context)
+                )
+                for value in values:
+                    if value in queries:
+                        tried.append(queries[value])
+            for q, steps in (item for queries in tried for item in queries.items()):
+                if q not in parent and q not in deep:
+                    continue
+                inherited = parent.get(q, _empty)
+                active = _empty
+                for j, step in steps:
+                    if j in lazy[q] and j not in inherited and open[q][j - 1]:
+                        if inherited is _empty:
+                            inherited = parent[q] = {}
+                        inherited[j] = counters = [0] * len(step.predicates)
+                        open[q][j].append(counters)
+                    contexts = step.contexts(j, inherited, open[q], active)
+                    if contexts and step.select_any(contexts, element, context, memo):
+                        if active is _empty:
+                            active = frame[q] = {}
+                        following = streamed[q][1].steps
+                        active[j + 1] = (
+                            [0] * len(following[j + 1].predicates)
+                            if j + 1 < len(following)
+                            else None
+                        )
+            for q, active in frame.items():
+                last = len(open[q])
+                for j, counters in active.items():
+                    if j < last:
+                        open[q][j].append(counters)
+                        if descendant[q][j]:
+                            enter(q)
+                if last in active:
+                    found[q].append(element)
+            for q in attributes:
+                active = frame.get(q)
+                if active is not None and len(open[q]) - 1 in active:
+                    step = streamed[q][1].steps[-1]
+                    counters = [0] * len(step.predicates)
+                    attrs = element.attributes
+                    for attr in (attrs.item(a) for a in range(attrs.length)):
+                        if step.match(attr.namespaceURI, attr.localName) and (
+                            not step.predicates or step.select(counters, attr, context)
+                        ):
+                            found[q].append(attr)
+            return frame
+
+        def leave(frame):
+            for q, active in frame.items():
+                last = len(open[q])
+                for j in active:
+                    if j < last:
+                        open[q][j].pop()
+                        if descendant[q][j]:
+                            exit(q)
+
+        stack = [(frame, iter(root.childNodes))]
+        while stack:
+            parent, children = stack[-1]
+            for child in children:
+                if child.nodeType != ELEMENT_NODE:
+                    continue
+                frame = visit(child, parent)
+                if child.childNodes and (frame or deep):
+                    stack.append((frame, iter(child.childNodes)))
+                    break
+                leave(frame)
+            else:
+                stack.pop()
+                if stack:
+                    leave(parent)
+
+        for q in queries:
+            _store(results, streamed[q][0], found[q])
+
+    def __repr__(self):
+        return "%s.%s(%d queries, %d streamed)" % (
+            self.__class__.__module__,
+            self.__class__.__name__,
+            self.size,
+            len(self.streamed),
+        )
+
+
+def _children_by_name(branch, nodes, context):
+    # Select the children of nodes, in document order and with no
+    # duplicates, for all the branches whose step is a child step with a
+    # name test and no predicates, at once.  The children of nodes nested
+    # in each other are found out of order, and sorted.
+    names = {}
+    for following in branch.branches.values():
+        if following.test is not None:
+            name = following.test.expanded_name(context)
+            if name is not None and "*" not in name:
+                names.setdefault(name, []).append(following)
+    if len(names) < 2:
+        return {}
+    found = dict((name, []) for name in names)
+    for node in nodes:
+        for child in node.childNodes:
+            if child.nodeType == ELEMENT_NODE:
+                matched = found.get((child.namespaceURI, child.localName))
+                if matched is not None:
+                    matched.append(child)
+    if not branch.disjoint:
+        for matched in found.values():
+            X.sort_nodeset(matched)
+    selected = {}
+    for name, branches in names.items():
+        selected[branches[0]] = found[name]
+        for following in branches[1:]:
+            selected[following] = list(found[name])
+    return selected
+
+
+class _Branch(object):
+    # A branch of a trie of location paths: the branches for the steps
+    # which may follow, by their text, and the positions of the paths
+    # which end here.  The step leading to it is compiled as
+    # X.evaluate_steps() takes it, or, for a first step which is not an
+    # axis step, as an expression evaluated from the context node.  The
+    # nodes it leads to are disjoint if none is a descendant of another,
+    # as for the children or attributes of disjoint nodes.
+
+    def __init__(self, step=None, primary=False, disjoint=True):
+        self.branches = {}
+        self.indexes = []
+        self.step = self.evaluate = self.test = None
+        self.disjoint = disjoint
+        if step is None:
+            return
+        if X.step_axis(step) not in ("child", "attribute", "self"):
+            self.disjoint = False
+        if (
+            isinstance(step, X.AxisStep)
+            and step.axis is X.axes["child"]
+            and isinstance(step.test, X.NameTest)
+        ):
+            self.test = step.test
+        if primary and X.step_axis(step) is None:
+            self.evaluate = xpath.compiler.compile(step)
+        else:
+            self.step = xpath.compiler._compile_steps([step])[0]
+
+
+def _store(results, indexes, nodes):
+    # Each expression gets its own list.
+    if indexes:
+        results[indexes[0]] = nodes
+        for i in indexes[1:]:
+            results[i] = list(nodes)
+
+
+def _downward(path):
+    for step in path.steps:
+        if not (step.any_kind and step.axis in ("self", "descendant-or-self")):
+            return step.axis in ("child", "descendant")
+    return False
+
+
+_empty = {}
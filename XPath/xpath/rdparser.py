@@ -0,0 +1,324 @@
+"""A hand-written scanner and recursive-descent parser for XPath.
+
+This builds the same xpath.expr trees as the yapps2 grammar in parser.g,
+which remains the reference for the language accepted, without going
+through the yapps runtime: tokens are read with a single regular
+expression, and binary operators are parsed by precedence climbing rather
+than one rule per precedence level.
+
+The yapps scanner only tries the tokens that are valid at each point of
+the grammar, preferring the longest match.  The parser reproduces the
+places where this matters:
+
+* After an operand, "and", "or", "div" and "mod" are operators even when
+  they are followed by more name characters ("1 andy" is "1 and y").
+* A name that is also an axis name always starts an axis step.
+* Where only an NCName may appear, a name directly followed by "(" loses
+  its last character.
+
+"""
+
+import re
+
+import xpath.expr as X
+from xpath.exceptions import XPathParseError
+
+_token = re.compile(
+    r"""\s*(?:
+      (?P<kind>(?:node|text|comment|processing-instruction)\s*\()
+    | (?P<name>[a-zA-Z_][\w.\-]*)
+    | (?P<number>(?:\.[0-9]+|[0-9]+(?:\.[0-9]*)?)(?:[eE][+\-]?[0-9]+)?)
+    | (?P<string>"[^"]*"|'[^']*')
+    | (?P<op>//|/|::|:|\.\.|\.|!=|<=|>=|[=<>@$()\[\],|*+\-])
+    | (?P<end>$)
+    )""",
+    re.VERBOSE,
+)
+
+_axes = frozenset(
+    [
+        "child",
+        "descendant-or-self",
+        "attribute",
+        "self",
+        "descendant",
+        "following-sibling",
+        "following",
+        "namespace",
+        "parent",
+        "preceding-sibling",
+        "preceding",
+        "ancestor-or-self",
+        "ancestor",
+    ]
+)
+
+# Binary operators: precedence and expression class.
+_operators = {
+    "or": (1, X.OrExpr),
+    "and": (2, X.AndExpr),
+    "=": (3, X.EqualityExpr),
+    "!=": (3, X.EqualityExpr),
+    "<": (4, X.EqualityExpr),
+    "<=": (4, X.EqualityExpr),
+    ">": (4, X.EqualityExpr),
+    ">=": (4, X.EqualityExpr),
+    "+": (5, X.ArithmeticalExpr),
+    "-": (5, X.ArithmeticalExpr),
+    "*": (6, X.ArithmeticalExpr),
+    "div": (6, X.ArithmeticalExpr),
+    "mod": (6, X.ArithmeticalExpr),
+    "|": (7, X.UnionExpr),
+}
+
+# Tokens that may start a location step after a lone "/".
+_step_start = frozenset(
+    ["name", "kind", "number", "string", "(", "@", "..", "$", ".", "*"]
+)
+
+
+def parse(text):
+    """Parse an XPath expression, returning its expression tree.
+
+    Raises XPathParseError if the expression is not valid.
+
+    """
+    return Parser(text).parse()
+
+
+class Parser(object):
+    def __init__(self, text):
+        self.text = text
+        # The current token: its kind ("name", "kind", "number", "string",
+        # "end", "error", or the operator itself), text, and extent.
+        self.kind = None
+        self.value = None
+        self.start = 0
+        self.end = 0
+
+    def parse(self):
+        self._advance(0)
+        expr = self._expr(1)
+        if self.kind != "end":
+            self._error("expected end of expression")
+        return expr
+
+    def _advance(self, pos):
+        m = _token.match(self.text, pos)
+        if m is None:
+            # Report the error when the parser next looks at the token.
+            self.kind = "error"
+            self.value = ""
+            pos = len(self.text) - len(self.text[pos:].lstrip())
+            self.start = self.end = pos
+            return
+        kind = m.lastgroup
+        self.value = m.group(kind)
+        self.start = m.start(kind)
+        self.end = m.end()
+        self.kind = self.value if kind == "op" else kind
+
+    def _error(self, message):
+        raise XPathParseError(self.text, self.start, message)
+
+    def _expect(self, kind):
+        if self.kind != kind:
+            self._error('expected "%s"' % kind)
+        self._advance(self.end)
+
+    def _operator(self):
+        kind = self.kind
+        if kind == "name":
+            value = self.value
+            if value[:2] == "or":
+                return "or"
+            if value[:3] in ("and", "div", "mod"):
+                return value[:3]
+            return None
+        if kind in _operators:
+            return kind
+        return None
+
+    def _expr(self, precedence):
+        left = self._unary()
+        while True:
+            op = self._operator()
+            if op is None:
+                return left
+            level, cls = _operators[op]
+            if level < precedence:
+                return left
+            if self.kind == "name":
+                self._advance(self.start + len(op))
+            else:
+                self._advance(self.end)
+            left = cls(op, left, self._expr(level + 1))
+
+    def _unary(self):
+        if self.kind == "-":
+            self._advance(self.end)
+            return X.NegationExpr(self._path())
+        return self._path()
+
+    def _path(self):
+        kind = self.kind
+        if kind == "/":
+            self._advance(self.end)
+            path = None
+            if self.kind in _step_start and (
+                self.kind != "name" or self.value not in ("and", "or")
+            ):
+                path = self._relative()
+            return X.AbsolutePathExpr(path)
+        if kind == "//":
+            self._advance(self.end)
+            path = self._relative()
+            path.steps.insert(0, X.AxisStep("descendant-or-self"))
+            return X.AbsolutePathExpr(path)
+        return self._relative()
+
+    def _relative(self):
+        steps = [self._step()]
+        while self.kind == "/" or self.kind == "//":
+            if self.kind == "//":
+                steps.append(X.AxisStep("descendant-or-self"))
+            self._advance(self.end)
+            steps.append(self._step())
+        return X.PathExpr(steps)
+
+    def _step(self):
+        kind = self.kind
+        if kind == "name":
+            name = self.value
+            if name in _axes:
+                self._advance(self.end)
+                self._expect("::")
+                step = [name, self._node_test()]
+            elif self.text.startswith("(", self.end):
+                return self._filter()
+            else:
+                self._advance(self.end)
+                step = ["child", self._name_test(name)]
+        elif kind == "@":
+            self._advance(self.end)
+            step = ["attribute", self._node_test()]
+        elif kind == "*":
+            self._advance(self.end)
+            step = ["child", self._name_test("*")]
+        elif kind == "kind":
+            step = ["child", self._kind_test()]
+        elif kind == "..":
+            self._advance(self.end)
+            step = ["parent", None]
+        else:
+            return self._filter()
+
+        expr = X.AxisStep(*step)
+        if self.kind == "[":
+            expr = X.PredicateList(expr, self._predicates(), step[0])
+        return expr
+
+    def _node_test(self):
+        kind = self.kind
+        if kind == "kind":
+            return self._kind_test()
+        if kind == "*":
+            self._advance(self.end)
+            return self._name_test("*")
+        return self._name_test(self._ncname())
+
+    def _name_test(self, name):
+        prefix = None
+        if self.kind == ":":
+            self._advance(self.end)
+            prefix = name
+            if self.kind == "*":
+                self._advance(self.end)
+                name = "*"
+            else:
+                name = self._ncname()
+        return X.NameTest(prefix, name)
+
+    def _ncname(self):
+        if self.kind != "name":
+            self._error("expected name")
+        start, end = self.start, self.end
+        if self.text.startswith("(", end):
+            # NCNAME may not be followed by "(" in the grammar.
+            end -= 1
+            if end == start:
+                self._error("expected name")
+        self._advance(end)
+        return self.text[start:end]
+
+    def _kind_test(self):
+        kind = self.value[0]
+        self._advance(self.end)
+        if kind == "p":
+            name = None
+            if self.kind == "string":
+                name = self.value[1:-1]
+                self._advance(self.end)
+            elif self.kind != ")":
+                name = self._ncname()
+            self._expect(")")
+            return X.PITest(name)
+        self._expect(")")
+        if kind == "n":
+            return X.AnyKindTest()
+        if kind == "t":
+            return X.TextTest()
+        return X.CommentTest()
+
+    def _predicates(self):
+        predicates = []
+        while self.kind == "[":
+            self._advance(self.end)
+            predicates.append(self._expr(1))
+            self._expect("]")
+        return predicates
+
+    def _filter(self):
+        expr = self._primary()
+        if self.kind == "[":
+            expr = X.PredicateList(expr, self._predicates())
+        return expr
+
+    def _primary(self):
+        kind = self.kind
+        value = self.value
+        if kind == "number":
+            self._advance(self.end)
+            return X.LiteralExpr(float(value))
+        if kind == "string":
+            self._advance(self.end)
+            return X.LiteralExpr(value[1:-1])
+        if kind == "$":
+            self._advance(self.end)
+            prefix = None
+            name = self._ncname()
+            if self.kind == ":":
+                self._advance(self.end)
+                prefix = name
+                name = self._ncname()
+            return X.VariableReference(prefix, name)
+        if kind == "(":
+            self._advance(self.end)
+            expr = self._expr(1)
+            self._expect(")")
+            return expr
+        if kind == ".":
+            self._advance(self.end)
+            return X.AxisStep("self")
+        if kind == "name" and self.text.startswith("(", self.end):
+            self._advance(self.end)
+            self._advance(self.end)
+            args = []
+            if self.kind != ")" and self.kind != ",":
+                args.append(self._expr(1))
+                while self.kind == ",":
+                    self._advance(self.end)
+                    args.append(self._expr(1))
+            self._expect(")")
+            return X.Function(value, args)
+        self._error("expected expression")
@@ -0,0 +1,695 @@
+"""Evaluation of location paths over a stream of parser events.
+
+A StreamingXPath selects nodes from a document as it is parsed, without
+building the document.  It is compiled from a location path in a subset of
+XPath which only looks forward, so that whether an element is selected is
+known when its start tag is read:
+
+* an absolute path, or a relative path, which is evaluated from the
+  document node;
+* steps along the child, descendant, descendant-or-self and self axes, or
+  the attribute axis in the last step;
+* name tests, and node() in any step but the last;
+* predicates which only look at the attributes, the name or the position
+  of a node: paths in predicates are attribute steps, and last(), id(),
+  lang() and functions of the string-value of the node are not allowed.
+
+The document is read as expat or SAX events, which drive a StreamMatcher.
+For each step, the matcher keeps the position counters of the open
+elements selected by the steps before it, so its memory is bounded by the
+depth of the document, as well as by the size of the selected elements
+whose end tags have not been read yet.  Selected elements are built as
+detached DOM elements, or only their string-values are collected.
+
+"""
+
+import collections
+import xml.dom
+import xml.dom.minidom
+import xml.dom.pulldom
+import xml.parsers.expat
+import xml.sax.handler
+
+import xpath
+import xpath.compiler
+import xpath.expr as X
+import xpath.optimizer
+import xpath.rdparser
+from xpath.exceptions import (
+    XPathNotImplementedError,
+    XPathTypeError,
+    XPathUnknownPrefixError,
+)
+
+TEXT_NODE = xml.dom.Node.TEXT_NODE
+XMLNS_NAMESPACE = xml.dom.XMLNS_NAMESPACE
+
+_axes = frozenset(["child", "descendant", "descendant-or-self", "self", "attribute"])
+
+_self_axes = ("self", "descendant-or-self")
+
+# Functions of the context node which only look at its name.
+_name_functions = frozenset(["name", "local-name", "namespace-uri"])
+
+
+class StreamingXPath(object):
+    """A location path compiled for evaluation over parser events.
+
+    Prefixes in the path are resolved with namespaces and
+    default_namespace when it is compiled, rather than with the namespace
+    declarations of the document.  Variables referenced by predicates are
+    looked up in variables.
+
+    Raises XPathNotImplementedError if the path is not in the subset of
+    XPath which can be evaluated over a stream.
+
+    """
+
+    def __init__(self, expr, namespaces=None, default_namespace=None, variables=None):
+        self.expr = xpath.rdparser.parse(str(expr))
+        self.context = xpath.XPathContext(
+            namespaces=namespaces or {},
+            default_namespace=default_namespace,
+            variables=variables or {},
+        )
+
+        path = self.expr
+        if isinstance(path, X.AbsolutePathExpr):
+            path = path.path
+        if not isinstance(path, X.PathExpr):
+            raise XPathNotImplementedError(
+                "only location paths can be streamed: %s" % self.expr
+            )
+        for step in path.steps:
+            if X.step_axis(step) is None:
+                raise XPathNotImplementedError(
+                    "only location steps can be streamed: %s" % step
+                )
+        # //x is matched as descendant::x, which only the parents of the
+        # elements named x are context nodes for, unless the predicates of
+        # x select by position among their siblings.
+        steps = []
+        for step in xpath.optimizer.descendant_steps(path.steps):
+            if isinstance(step, X.GroupedStep):
+                steps.append(X.AxisStep("descendant-or-self"))
+                step = step.step
+            steps.append(step)
+        last = len(steps) - 1
+        self.steps = [
+            _Step(step, i == last, self.context) for i, step in enumerate(steps)
+        ]
+
+    def root_active(self):
+        """Return the counters of the positions of the nodes along each
+        step from the document node, for the steps whose context node it
+        is: the first one, and those following it along the self or
+        descendant-or-self axis.
+
+        """
+        steps = self.steps
+        active = {0: [0] * len(steps[0].predicates)}
+        for j, step in enumerate(steps[:-1]):
+            if j in active and step.any_kind and step.axis in _self_axes:
+                active[j + 1] = [0] * len(steps[j + 1].predicates)
+        return active
+
+    def matcher(self, values=False):
+        """Return a StreamMatcher for one document, collecting the
+        selected nodes, or their string-values if values is true.
+
+        """
+        return StreamMatcher(self, values)
+
+    def handler(self, values=False):
+        """Return a SAX content handler collecting the selected nodes, or
+        their string-values, in its results deque.  The parser must report
+        namespaces.
+
+        """
+        return StreamHandler(self.matcher(values))
+
+    def iterfind(self, source, chunk_size=65536):
+        """Parse source, a file name or a binary file object, with expat,
+        and return an iterator over the selected nodes in document order.
+        Elements are detached DOM elements, each produced once its end tag
+        has been read.
+
+        """
+        return self._parse(source, False, chunk_size)
+
+    def iterfindvalues(self, source, chunk_size=65536):
+        """Parse source with expat, and return an iterator over the
+        string-values of the selected nodes in document order.
+
+        """
+        return self._parse(source, True, chunk_size)
+
+    def _parse(self, source, values, chunk_size):
+        matcher = self.matcher(values)
+        parser = expat_parser(matcher)
+        results = matcher.results
+        close = False
+        if isinstance(source, str):
+            source = open(source, "rb")
+            close = True
+        try:
+            while True:
+                data = source.read(chunk_size)
+                parser.Parse(data, not data)
+                while results:
+                    yield results.popleft()
+                if not data:
+                    break
+        finally:
+            if close:
+                source.close()
+
+    def __repr__(self):
+        return "%s.%s(%s)" % (
+            self.__class__.__module__,
+            self.__class__.__name__,
+            repr(str(self.expr)),
+        )
+
+    def __str__(self):
+        return str(self.expr)
+
+
+class _Step(object):
+    # One step of a StreamingXPath: its axis, the expanded name it matches
+    # with "*" for a wildcard, and its predicates as pairs returned by
+    # X.predicate_selector().
+
+    def __init__(self, step, last, context):
+        predicates = []
+        if isinstance(step, X.PredicateList):
+            predicates = step.predicates
+            step = step.expr
+        self.axis = X.step_axis(step)
+        if self.axis not in _axes:
+            raise XPathNotImplementedError(
+                "the %s axis cannot be streamed" % self.axis
+            )
+        attribute = self.axis == "attribute"
+        if attribute and not last:
+            raise XPathNotImplementedError(
+                "only the last step of a streamed path may select attributes"
+            )
+
+        test = step.test
+        self.any_kind = isinstance(test, X.AnyKindTest)
+        if isinstance(test, X.NameTest):
+            name = test.expanded_name(context, step.axis.principal_node_type)
+            if name is None:
+                raise XPathUnknownPrefixError(test.prefix)
+            self.namespaceURI, self.localName = name
+        elif self.any_kind and not last and not predicates:
+            # Nodes other than elements have neither children nor
+            # attributes, so node() can stand for any element.
+            self.namespaceURI = self.localName = "*"
+        else:
+            raise XPathNotImplementedError(
+                "the node test %s cannot be streamed here" % test
+            )
+
+        self.predicates = []
+        # The text of each predicate whose value only depends on the node,
+        # to share its value between steps, or None.
+        self.keys = []
+        self.node = False
+        # The first predicate, if it compares an attribute with a literal
+        # by =, as (text, evaluate, literal) for the attribute path: a
+        # QuerySet looks up the steps to try by the value of the attribute.
+        self.guard = None
+        for pred in predicates:
+            if not _streamable_predicate(pred, attribute):
+                raise XPathNotImplementedError(
+                    "the predicate [%s] cannot be streamed" % pred
+                )
+            pred = xpath.optimizer.bind(
+                xpath.optimizer.rewrite(pred),
+                context.namespaces,
+                context.default_namespace,
+            )
+            self.predicates.append(
+                X.predicate_selector(
+                    pred,
+                    xpath.compiler.compile(pred),
+                    xpath.compiler.compile_boolean(pred),
+                )
+            )
+            if len(self.predicates) == 1:
+                self.guard = _attribute_equality(pred)
+            dependencies = X.dependencies(pred)
+            self.node = self.node or X.CONTEXT_NODE in dependencies
+            self.keys.append(
+                None
+                if X.CONTEXT_POSITION in dependencies or X.CONTEXT_SIZE in dependencies
+                else str(pred)
+            )
+
+    def contexts(self, j, parent, open, active):
+        # The counters of the context nodes of this step, steps[j], for a
+        # new element: parent and active map the indexes of steps to the
+        # counters of its parent and of the element itself, and open[j]
+        # lists the counters of the open elements.
+        axis = self.axis
+        if axis == "child":
+            counters = parent.get(j)
+        elif axis == "descendant":
+            return open[j]
+        elif axis == "self":
+            counters = active.get(j)
+        elif axis == "descendant-or-self":
+            if j in active:
+                return open[j] + [active[j]]
+            return open[j]
+        else:
+            return ()
+        return () if counters is None else (counters,)
+
+    def select_any(self, contexts, node, context, memo=None):
+        # Whether a node which passed the node test is selected from any
+        # of the contexts.  Every context counts the position of the node.
+        if not self.predicates:
+            return True
+        selected = False
+        for counters in contexts:
+            if self.select(counters, node, context, memo):
+                selected = True
+        return selected
+
+    def match(self, namespaceURI, localName):
+        return (self.localName == "*" or localName == self.localName) and (
+            self.namespaceURI == "*" or namespaceURI == self.namespaceURI
+        )
+
+    def select(self, counters, node, context, memo=None):
+        # Apply the predicates to a node which passed the node test, with
+        # the counters of positions of one context node.  The values of
+        # the predicates which only depend on the node are kept in memo,
+        # if given, by their text.
+        numberp = X.numberp
+        for i, (kind, value) in enumerate(self.predicates):
+            counters[i] += 1
+            pos = counters[i]
+            if kind == "position":
+                if pos != value:
+                    return False
+                continue
+            key = self.keys[i]
+            if memo is None or key is None:
+                result = value(node, pos, pos, context)
+            else:
+                result = memo.get(key, memo)
+                if result is memo:
+                    result = memo[key] = value(node, pos, pos, context)
+            if kind == "test":
+                if not result:
+                    return False
+            elif numberp(result):
+                if result != pos:
+                    return False
+            elif not X.boolean(result):
+                return False
+        return True
+
+
+def _streamable_predicate(expr, attribute=False):
+    # Whether a predicate only looks at the attributes, name or position of
+    # the context node; or, for attribute steps, at the attribute.
+    if isinstance(expr, (X.LiteralExpr, X.VariableReference)):
+        return True
+    elif isinstance(expr, X.Function):
+        if expr.name in ("last", "lang", "id"):
+            return False
+        if expr.evaluate.implicit and not expr.args:
+            if not attribute and expr.name not in _name_functions:
+                return False
+        return all(_streamable_predicate(x, attribute) for x in expr.args)
+    elif isinstance(expr, X.BinaryOperatorExpr):
+        return _streamable_predicate(expr.left, attribute) and _streamable_predicate(
+            expr.right, attribute
+        )
+    elif isinstance(expr, X.NegationExpr):
+        return _streamable_predicate(expr.expr, attribute)
+    elif isinstance(expr, X.PathExpr):
+        return len(expr.steps) == 1 and _streamable_predicate(expr.steps[0], attribute)
+    elif isinstance(expr, X.AxisStep):
+        axis = X.step_axis(expr)
+        return axis == "attribute" or (attribute and axis == "self")
+    return False
+
+
+def _attribute_equality(expr):
+    # The (text, evaluate, literal) of the attribute path of a predicate
+    # such as [@name = 'value'], or None.
+    if not isinstance(expr, X.EqualityExpr) or expr.op != "=":
+        return None
+    for path, literal in ((expr.left, expr.right), (expr.right, expr.left)):
+        if (
+            isinstance(literal, X.LiteralExpr)
+            and (X.stringp(literal.literal) or X.numberp(literal.literal))
+            and isinstance(path, X.PathExpr)
+            and len(path.steps) == 1
+            and X.step_axis(path.steps[0]) == "attribute"
+        ):
+            return str(path), xpath.compiler.compile(path), literal.literal
+    return None
+
+
+class StreamMatcher(object):
+    """The state of a StreamingXPath over one document.
+
+    The events of the document are passed to start(), end(), characters(),
+    comment() and processing_instruction(), and the selected nodes, or
+    their string-values, are appended to the results deque in document
+    order.
+
+    """
+
+    def __init__(self, path, values=False):
+        self.steps = path.steps
+        self.context = path.context
+        self.values = values
+        self.document = _implementation.createDocument(None, None, None)
+        self.results = collections.deque()
+
+        # open[j] holds the position counters for steps[j] of each open
+        # node selected by the steps before it, innermost last.
+        steps = self.steps
+        self.open = [[] for _ in steps]
+        # [done, result, text offset] for the selected nodes which have not
+        # been added to results yet, in document order.
+        self.pending = collections.deque()
+        # The number of selected elements whose end tags have not been
+        # read, and the text read since the first of them.
+        self.selected = 0
+        self.text = []
+
+        active = path.root_active()
+        for j, counters in active.items():
+            self.open[j].append(counters)
+        # (active, element, entry) for each open node: the counters for
+        # steps[j] of each j for which the node is selected by the steps
+        # before steps[j], the DOM element built for it, and its entry in
+        # pending if it is selected by the path.
+        self.stack = [(active, None, None)]
+
+    def start(self, namespaceURI, localName, qname, attributes):
+        """Handle a start tag.  attributes is a list of (namespaceURI,
+        localName, qname, value) tuples.  Returns true if the element is
+        selected by the path.
+
+        """
+        steps = self.steps
+        last = len(steps)
+        parent = self.stack[-1][0]
+        context = self.context
+        active = {}
+        element = None
+
+        for j, step in enumerate(steps):
+            if step.axis == "attribute" or not step.match(namespaceURI, localName):
+                continue
+            contexts = step.contexts(j, parent, self.open, active)
+            if not contexts:
+                continue
+            node = self.document
+            if step.node:
+                if element is None:
+                    element = self._element(namespaceURI, qname, attributes)
+                node = element
+            if step.select_any(contexts, node, context):
+                active[j + 1] = (
+                    [0] * len(steps[j + 1].predicates) if j + 1 < last else None
+                )
+
+        for j, counters in active.items():
+            if j < last:
+                self.open[j].append(counters)
+
+        entry = None
+        parent_element = self.stack[-1][1]
+        if last in active:
+            entry = [False, None, len(self.text)]
+            self.pending.append(entry)
+            self.selected += 1
+        if self.values or not self.selected:
+            element = None
+        else:
+            if element is None:
+                element = self._element(namespaceURI, qname, attributes)
+            if parent_element is not None:
+                parent_element.appendChild(element)
+            if entry is not None:
+                entry[1] = element
+
+        step = steps[-1]
+        if step.axis == "attribute" and last - 1 in active and attributes:
+            self._attributes(step, namespaceURI, qname, attributes, element)
+        self.stack.append((active, element, entry))
+        return entry is not None
+
+    def _attributes(self, step, namespaceURI, qname, attributes, element):
+        counters = [0] * len(step.predicates)
+        for attr in attributes:
+            if not step.match(attr[0], attr[1]):
+                continue
+            node = None
+            if step.node or not self.values:
+                if element is None:
+                    element = self._element(namespaceURI, qname, attributes)
+                node = element.getAttributeNodeNS(attr[0], attr[1])
+            if step.predicates and not step.select(counters, node, self.context):
+                continue
+            self.pending.append([True, attr[3] if self.values else node, 0])
+        self._flush()
+
+    def end(self):
+        """Handle an end tag."""
+        active, element, entry = self.stack.pop()
+        last = len(self.steps)
+        for j in active:
+            if j < last:
+                self.open[j].pop()
+        if entry is not None:
+            if self.values:
+                entry[1] = "".join(self.text[entry[2] :])
+            entry[0] = True
+            self.selected -= 1
+            if not self.selected:
+                del self.text[:]
+            self._flush()
+
+    def characters(self, data):
+        """Handle character data, including that of CDATA sections."""
+        if not self.selected:
+            return
+        if self.values:
+            self.text.append(data)
+            return
+        element = self.stack[-1][1]
+        child = element.lastChild
+        if child is not None and child.nodeType == TEXT_NODE:
+            child.appendData(data)
+        else:
+            element.appendChild(self.document.createTextNode(data))
+
+    def comment(self, data):
+        element = self.stack[-1][1]
+        if element is not None:
+            element.appendChild(self.document.createComment(data))
+
+    def processing_instruction(self, target, data):
+        element = self.stack[-1][1]
+        if element is not None:
+            element.appendChild(
+                self.document.createProcessingInstruction(target, data)
+            )
+
+    def _element(self, namespaceURI, qname, attributes):
+        element = self.document.createElementNS(namespaceURI, qname)
+        for attr in attributes:
+            element.setAttributeNS(attr[0], attr[2], attr[3])
+        return element
+
+    def _flush(self):
+        pending = self.pending
+        results = self.results
+        while pending and pending[0][0]:
+            results.append(pending.popleft()[1])
+
+
+_implementation = xml.dom.minidom.getDOMImplementation()
+
+
+def iterrecords(
+    source,
+    path,
+    fields,
+    namespaces=None,
+    default_namespace=None,
+    bufsize=None,
+    **kwargs
+):
+    """Parse source, a file name or file object, with xml.dom.pulldom,
+    and for each element selected by path, expand it into a DOM subtree,
+    evaluate fields on it and release it.
+
+    path is a streamable location path, or a StreamingXPath, selecting
+    elements.  fields is a dict of names to expressions, or a sequence of
+    expressions, which are evaluated with the record as the context node
+    as by XPath.findvalue(); a dict or a tuple of their values is produced
+    for each record.  Records inside a record are not searched.
+
+    The namespace declarations and the variables given as keyword
+    arguments are used for the path and the fields, and not those of the
+    document.
+
+    """
+    if not isinstance(path, StreamingXPath):
+        path = StreamingXPath(path, namespaces, default_namespace, kwargs)
+    if path.steps[-1].axis == "attribute":
+        raise XPathTypeError("records must be elements: %s" % path)
+    context = xpath.XPathContext(
+        namespaces=namespaces or {}, default_namespace=default_namespace, **kwargs
+    )
+    if isinstance(fields, dict):
+        names = list(fields)
+        exprs = [xpath.XPath.get(fields[name]) for name in names]
+    else:
+        names = None
+        exprs = [xpath.XPath.get(expr) for expr in fields]
+    return _records(source, path, names, exprs, context, bufsize)
+
+
+def _records(source, path, names, exprs, context, bufsize):
+    matcher = path.matcher(values=True)
+    events = xml.dom.pulldom.parse(source, bufsize=bufsize)
+    START_ELEMENT = xml.dom.pulldom.START_ELEMENT
+    END_ELEMENT = xml.dom.pulldom.END_ELEMENT
+    for event, node in events:
+        if event == START_ELEMENT:
+            attrs = node.attributes
+            attributes = []
+            for i in range(attrs.length):
+                attr = attrs.item(i)
+                if attr.namespaceURI != XMLNS_NAMESPACE:
+                    attributes.append(
+                        (attr.namespaceURI, attr.localName, attr.name, attr.value)
+                    )
+            selected = matcher.start(
+                node.namespaceURI, node.localName, node.tagName, attributes
+            )
+            if selected:
+                events.expandNode(node)
+                matcher.end()
+                matcher.results.clear()
+                values = tuple(expr.findvalue(node, context) for expr in exprs)
+                # The record is not part of the document, so it is freed
+                # once unlinked.
+                node.unlink()
+                yield values if names is None else dict(zip(names, values))
+        elif event == END_ELEMENT:
+            matcher.end()
+
+
+def _split_name(name):
+    # Names reported by expat with namespace_separator=" " and
+    # namespace_prefixes set: "uri local prefix", "uri local" or "local".
+    parts = name.split(" ")
+    if len(parts) == 1:
+        return None, name, name
+    if len(parts) == 2:
+        return parts[0], parts[1], parts[1]
+    return parts[0], parts[1], "%s:%s" % (parts[2], parts[1])
+
+
+def expat_parser(matcher):
+    """Return an expat parser which passes its events to a
+    StreamMatcher.
+
+    """
+    parser = xml.parsers.expat.ParserCreate(namespace_separator=" ")
+    parser.namespace_prefixes = True
+    parser.buffer_text = True
+    parser.ordered_attributes = True
+
+    def start(name, attrs):
+        attributes = []
+        for i in range(0, len(attrs), 2):
+            attributes.append(_split_name(attrs[i]) + (attrs[i + 1],))
+        matcher.start(*(_split_name(name) + (attributes,)))
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = lambda name: matcher.end()
+    parser.CharacterDataHandler = matcher.characters
+    parser.CommentHandler = matcher.comment
+    parser.ProcessingInstructionHandler = matcher.processing_instruction
+    return parser
+
+
+class StreamHandler(xml.sax.handler.ContentHandler):
+    """A SAX content handler passing its events to a StreamMatcher, whose
+    results it shares.
+
+    """
+
+    def __init__(self, matcher):
+        xml.sax.handler.ContentHandler.__init__(self)
+        self.matcher = matcher
+        self.results = matcher.results
+        # The prefix mappings in scope, innermost last.  Parsers without
+        # the namespace-prefixes feature report no qualified names, which
+        # are then rebuilt from these.
+        self.prefixes = []
+
+    def startPrefixMapping(self, prefix, uri):
+        self.prefixes.append((prefix, uri))
+
+    def endPrefixMapping(self, prefix):
+        for i in range(len(self.prefixes) - 1, -1, -1):
+            if self.prefixes[i][0] == prefix:
+                del self.prefixes[i]
+                break
+
+    def _qname(self, name, attribute=False):
+        uri, local = name
+        if uri is None:
+            return local
+        shadowed = set()
+        for prefix, mapped in reversed(self.prefixes):
+            if prefix in shadowed:
+                continue
+            shadowed.add(prefix)
+            if mapped != uri:
+                continue
+            if prefix is None or prefix == "":
+                # Unprefixed attributes are in no namespace.
+                if not attribute:
+                    return local
+                continue
+            return "%s:%s" % (prefix, local)
+        return local
+
+    def startElementNS(self, name, qname, attrs):
+        attributes = []
+        for key, value in attrs.items():
+            try:
+                attr_qname = attrs.getQNameByName(key)
+            except KeyError:
+                attr_qname = None
+            if not attr_qname:
+                attr_qname = self._qname(key, True)
+            attributes.append((key[0], key[1], attr_qname, value))
+        self.matcher.start(name[0], name[1], qname or self._qname(name), attributes)
+
+    def endElementNS(self, name, qname):
+        self.matcher.end()
+
+    def characters(self, content):
+        self.matcher.characters(content)
+
+    def processingInstruction(self, target, data):
+        self.matcher.processing_instruction(target, data)